@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import loudness
+import replaygain
+
+# Compara o custo por faixa do caminho antigo (loudnorm + reencode MP3 320k) com a análise
+# R128 do loudness.py (decodifica uma vez + tags) e com o ebur128 do ffmpeg.
+# Uso: python benchmark_loudness.py [arquivo de áudio]
+# Sem arquivo, gera um ruído rosa de DURATION segundos com o próprio ffmpeg.
+
+DURATION = 240
+
+def make_sample(directory):
+    path = os.path.join(directory, "amostra.m4a")
+    subprocess.run([replaygain.ffmpeg_binary(), "-v", "error", "-y", "-f", "lavfi",
+                    "-i", f"anoisesrc=color=pink:amplitude=0.3:duration={DURATION}",
+                    "-ac", "2", "-ar", "48000", "-c:a", "aac", "-b:a", "192k", path], check=True)
+    return path
+
+def run_loudnorm(path, directory):
+    out = os.path.join(directory, "loudnorm.mp3")
+    subprocess.run([replaygain.ffmpeg_binary(), "-v", "error", "-y", "-i", path, "-vn",
+                    "-af", "loudnorm=I=-16:TP=-1.5:LRA=11", "-c:a", "libmp3lame", "-b:a", "320k", out], check=True)
+
+def timed(label, func):
+    start_time = time.time()
+    result = func()
+    elapsed = time.time() - start_time
+    print(f"{label}: {elapsed:.2f} segundos")
+    return elapsed, result
+
+def benchmark():
+    with tempfile.TemporaryDirectory() as directory:
+        path = sys.argv[1] if len(sys.argv) > 1 else make_sample(directory)
+        print(f"Arquivo: {path}")
+
+        old_time, _ = timed("loudnorm + reencode MP3 (caminho antigo)", lambda: run_loudnorm(path, directory))
+        ffmpeg_time, ffmpeg_result = timed("ffmpeg ebur128 (só análise)", lambda: replaygain.analyze_ffmpeg(path))
+        numpy_time, numpy_result = timed("loudness.py NumPy (decodifica uma vez)", lambda: loudness.measure_file(path))
+
+        print(f"ffmpeg: {ffmpeg_result['integrated_lufs']:.2f} LUFS, pico {ffmpeg_result['true_peak_dbtp']:.2f} dBTP")
+        print(f"NumPy:  {numpy_result['integrated_lufs']:.2f} LUFS, pico {numpy_result['true_peak_dbtp']:.2f} dBTP "
+              f"({numpy_result['duration'] / numpy_time:.0f}x tempo real)")
+
+        diff = abs(ffmpeg_result['integrated_lufs'] - numpy_result['integrated_lufs'])
+        assert diff < 0.5, f"Loudness integrada diverge do ebur128 do ffmpeg em {diff:.2f} LU"
+        print(f"OK: {old_time / numpy_time:.1f}x mais rápido que o loudnorm, sem perda de geração.")
+
+benchmark()
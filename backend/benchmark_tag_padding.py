@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+from mutagen.mp3 import MP3
+from mutagen.id3 import ID3, TIT2, APIC, USLT, Encoding
+import tag_padding
+
+# Editar tags (capa + letra, como o tag_editor e o shazam_fixer) num arquivo antigo da biblioteca
+# x no mesmo arquivo depois do repad (tag_padding.py).
+# Uso: python benchmark_tag_padding.py [tamanhos em MB separados por vírgula]
+# Os MP3 são sintéticos (frames MPEG-1 Layer III de silêncio): não precisa de ffmpeg nem de rede.
+
+SIZES_MB = [int(s) for s in sys.argv[1].split(",")] if len(sys.argv) > 1 else [8, 32, 128]
+ROUNDS = 3
+COVER = b'\xff\xd8' + os.urandom(200 * 1024)
+FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413  # 128 kbps, 44.1 kHz
+
+def make_library_file(path, size_mb):
+    """MP3 como ficava antes: só título, gravado com o padding padrão do mutagen."""
+    chunk = FRAME * 2500
+    with open(path, "wb") as f:
+        for _ in range(size_mb * 1024 * 1024 // len(chunk) + 1):
+            f.write(chunk)
+    audio = MP3(path, ID3=ID3)
+    audio.add_tags()
+    audio.tags.add(TIT2(encoding=3, text="Faixa"))
+    audio.save()
+
+def edit(path):
+    audio = MP3(path, ID3=ID3)
+    audio.tags.delall("APIC")
+    audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=COVER))
+    audio.tags.delall("USLT")
+    audio.tags.add(USLT(encoding=Encoding.UTF8, lang='und', desc='Lyrics', text="la la la\n" * 300))
+    audio.save(padding=tag_padding.policy)
+
+def timed_edit(original, work, repad_first):
+    total = 0.0
+    for _ in range(ROUNDS):
+        shutil.copyfile(original, work)
+        if repad_first: tag_padding.repad(work)
+        start_time = time.time()
+        edit(work)
+        total += time.time() - start_time
+    return total / ROUNDS
+
+def benchmark():
+    tmp = tempfile.mkdtemp()
+    rows = []
+    try:
+        for size_mb in SIZES_MB:
+            original = os.path.join(tmp, f"{size_mb}mb.mp3")
+            work = os.path.join(tmp, "work.mp3")
+            make_library_file(original, size_mb)
+            before = timed_edit(original, work, repad_first=False)
+            after = timed_edit(original, work, repad_first=True)
+            rows.append((size_mb, before, after))
+            print(f"{size_mb:>5} MB: sem padding {before * 1000:8.1f} ms por edição | depois do repad {after * 1000:6.1f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    (small_mb, small_before, small_after), (large_mb, large_before, large_after) = rows[0], rows[-1]
+    print(f"De {small_mb} MB para {large_mb} MB: sem padding {large_before / small_before:.1f}x mais lento, "
+          f"com padding {large_after / small_after:.1f}x")
+    assert large_after / small_after < 3, "Com padding a edição deveria custar o mesmo em qualquer tamanho de arquivo"
+    print(f"OK: edição de tags em tempo constante depois do repad ({tag_padding.PADDING_BYTES // 1024} KB de folga).")
+
+benchmark()
@@ -0,0 +1,56 @@
+import sys
+import time
+import yt_dlp
+import ydl_pool
+from utils import get_cookies_path
+
+# Custo de montar um YoutubeDL por chamada x emprestar uma instância do ydl_pool.
+# Uso: python benchmark_ydl_pool.py [URL do YouTube]
+# Sem URL mede só a construção (extratores + cookies.txt). Com URL faz N_NETWORK extrações
+# reais pelos dois caminhos e mostra quantas conexões TCP o pool precisou abrir.
+
+N_LOCAL = 20
+N_NETWORK = 3
+
+def base_opts():
+    opts = {'quiet': True, 'no_warnings': True, 'socket_timeout': 15}
+    if get_cookies_path(): opts['cookiefile'] = get_cookies_path()
+    return opts
+
+def fresh(opts, url=None):
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        ydl.cookiejar  # força a leitura do cookies.txt, como na primeira requisição
+        if url: ydl.extract_info(url, download=False)
+
+def pooled(opts, url=None):
+    with ydl_pool.lease(opts) as ydl:
+        ydl.cookiejar
+        if url: ydl.extract_info(url, download=False)
+
+def timed(label, func, n):
+    start_time = time.time()
+    for i in range(n):
+        func(dict(base_opts(), outtmpl=f"%(title)s.{i}.%(ext)s"))
+    elapsed = time.time() - start_time
+    print(f"{label}: {elapsed:.2f} segundos ({elapsed / n * 1000:.0f} ms por chamada)")
+    return elapsed
+
+def benchmark():
+    url = sys.argv[1] if len(sys.argv) > 1 else None
+
+    fresh_time = timed(f"YoutubeDL novo x{N_LOCAL}", fresh, N_LOCAL)
+    pooled_time = timed(f"ydl_pool.lease x{N_LOCAL}", pooled, N_LOCAL)
+    print(f"Construção: {fresh_time / pooled_time:.1f}x mais rápido com o pool")
+
+    if url:
+        timed(f"extract_info com YoutubeDL novo x{N_NETWORK}", lambda opts: fresh(opts, url), N_NETWORK)
+        timed(f"extract_info com ydl_pool x{N_NETWORK}", lambda opts: pooled(opts, url), N_NETWORK)
+
+    stats = ydl_pool.snapshot()
+    print(f"Pool: {stats['created']} criadas, {stats['reused']} reaproveitadas, "
+          f"{stats['http_requests']} requisições em {stats['tcp_connections']} conexões "
+          f"(reuso de conexão {stats['connection_reuse_ratio']:.0%})")
+    assert stats['created'] == 1, "Chamadas com a mesma sessão deveriam reaproveitar uma única instância"
+    print("OK: uma instância atendeu todas as chamadas.")
+
+benchmark()
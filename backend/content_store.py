@@ -0,0 +1,170 @@
+"""
+content_store.py
+Armazenamento endereçado por conteúdo dos arquivos baixados, chaveado por (video_id, perfil de saída).
+Cada faixa única é baixada e convertida uma vez e fica em <data_dir>/store/<perfil>/<video_id>.<ext>.
+As pastas de playlist/artista recebem hardlinks para o objeto (symlink quando o sistema de
+arquivos não aceita hardlink, por exemplo store e downloads em discos diferentes).
+O índice fica nas tabelas store_objects/store_links do downloads.db; o sync_db_with_disk
+limpa links apagados e objetos que não têm mais nenhum link.
+"""
+import os
+import shutil
+import threading
+import yt_dlp
+from utils import get_data_dir, get_downloads_dir
+from database import get_store_object, save_store_object, add_store_link, delete_store_object
+
+_template_ydl = None
+_template_lock = threading.Lock()
+# job_id -> pedidos anexados (user-016) que precisam do arquivo em outra pasta quando o job terminar
+_pending_links = {}
+
+
+def store_dir() -> str:
+    path = os.path.join(get_data_dir(), "store")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def profile_for(request):
+    """
+    Perfil de saída: tudo que muda os bytes do arquivo além do vídeo em si.
+    Pitch/velocidade/EQ e recortes não entram no store (None): são variações pontuais.
+    """
+    from downloader import has_audio_filters, section_range
+    if getattr(request, 'playlist', False) or has_audio_filters(request) or section_range(request): return None
+    parts = [request.mode, request.quality]
+    if request.mode == 'video':
+        parts.append(getattr(request, 'video_codec', None) or 'auto')
+        if getattr(request, 'compress_video', False): parts.append('compressed')
+        subtitle = getattr(request, 'subtitle', None) or 'none'
+        if subtitle != 'none': parts.append(f"sub-{subtitle}")
+    if getattr(request, 'sponsorblock_enabled', False): parts.append('sponsorblock')
+    return "_".join(str(p) for p in parts)
+
+
+def object_path(video_id: str, profile: str, ext: str) -> str:
+    folder = os.path.join(store_dir(), profile)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{video_id}{ext}")
+
+
+def _link(source: str, target: str) -> str:
+    """Cria `target` apontando para `source`. Retorna "hardlink" ou "symlink"; OSError se nenhum funcionar."""
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError:
+        os.symlink(source, target)
+        return "symlink"
+
+
+def _replace_with_link(source: str, target: str) -> str:
+    tmp = target + ".storelink"
+    if os.path.lexists(tmp): os.remove(tmp)
+    kind = _link(source, tmp)
+    os.replace(tmp, target)
+    return kind
+
+
+def ingest(video_id: str, profile: str, final_path: str, meta: dict) -> str:
+    """
+    Depois do pós-processamento: registra `final_path` como objeto do store e deixa no lugar um link.
+    Retorna o tipo de ligação ("hardlink", "symlink", "copy" quando nenhum link é possível, ou "existing").
+    """
+    if not video_id or not profile or not os.path.exists(final_path): return None
+    ext = os.path.splitext(final_path)[1]
+    existing = get_store_object(video_id, profile)
+    if existing and os.path.exists(existing["object_path"]) and not os.path.samefile(existing["object_path"], final_path):
+        # Baixado de novo mesmo com o objeto no store (corrida entre pastas): fica só o objeto
+        kind = _replace_with_link(existing["object_path"], final_path)
+        add_store_link(final_path, video_id, profile, kind)
+        return "existing"
+
+    obj = object_path(video_id, profile, ext)
+    try:
+        if os.path.lexists(obj): os.remove(obj)
+        os.link(final_path, obj)  # mesmo disco: nenhum byte copiado
+        kind = "hardlink"
+    except OSError:
+        # Store e downloads em sistemas de arquivos diferentes: copia uma vez e troca por symlink
+        try:
+            shutil.copy2(final_path, obj)
+            kind = _replace_with_link(obj, final_path)
+        except OSError:
+            if os.path.exists(obj) and not os.path.samefile(obj, final_path): os.remove(obj)
+            # Sem symlink (Windows sem modo desenvolvedor): o próprio arquivo vira o objeto
+            obj, kind = final_path, "copy"
+
+    display_name = os.path.basename(final_path)
+    save_store_object(video_id, profile, obj, display_name, meta, os.path.getsize(obj))
+    add_store_link(final_path, video_id, profile, kind)
+    return kind
+
+
+def _view_path(request, record: dict) -> str:
+    """Caminho que o download teria na pasta de destino do pedido (mesmo outtmpl do build_ydl_opts)."""
+    global _template_ydl
+    from downloader import output_template
+    info = {
+        'id': record["video_id"],
+        'title': record.get("title") or os.path.splitext(record["display_name"])[0],
+        'artist': record.get("artist"),
+        'uploader': record.get("uploader"),
+        'album': record.get("album"),
+        'ext': os.path.splitext(record["display_name"])[1].lstrip('.'),
+    }
+    with _template_lock:
+        if _template_ydl is None:
+            _template_ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+        path = _template_ydl.prepare_filename(info, outtmpl=output_template(request, get_downloads_dir()))
+    # O nome final é o limpo (clean_title) que o finalize_download gravou
+    return os.path.join(os.path.dirname(path), record["display_name"])
+
+
+def materialize(request) -> str:
+    """
+    Se o store já tem o objeto do pedido, cria o link na pasta de destino (sem rede) e
+    retorna o caminho relativo à pasta de downloads. None se precisar baixar.
+    """
+    from downloader import video_id_for
+    profile = profile_for(request)
+    video_id = video_id_for(request)
+    if not profile or not video_id: return None
+    record = get_store_object(video_id, profile)
+    if not record: return None
+    if not os.path.exists(record["object_path"]):
+        delete_store_object(video_id, profile)
+        return None
+
+    target = _view_path(request, record)
+    try:
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            kind = _link(record["object_path"], target)
+            add_store_link(target, video_id, profile, kind)
+            print(f"[Store] {record['display_name']} ligado em {os.path.dirname(target)} ({kind})")
+        elif not os.path.samefile(target, record["object_path"]):
+            return None  # Outro arquivo com o mesmo nome: deixa o download normal decidir
+    except OSError as e:
+        print(f"[Store] Não foi possível criar link para {record['display_name']}: {e}")
+        return None
+    return os.path.relpath(target, get_downloads_dir())
+
+
+def link_when_done(job_id: str, request):
+    """Pedido anexado a um job em andamento que quer o arquivo em outra pasta."""
+    _pending_links.setdefault(job_id, []).append(request)
+
+
+def job_finished(job_id: str, status: str):
+    """Chamado quando o job termina: cria os links dos pedidos anexados (ou os descarta se falhou)."""
+    from downloader import video_id_for
+    from database import mark_downloaded_db
+    pending = _pending_links.pop(job_id, [])
+    if status not in ("done", "completed", "already_downloaded"): return
+    for request in pending:
+        linked = materialize(request)
+        if linked:
+            mark_downloaded_db(getattr(request, 'playlist_id', None), video_id_for(request),
+                               getattr(request, 'title', None) or os.path.basename(linked), linked, request.url)
@@ -0,0 +1,258 @@
+"""
+cover_cache.py
+Cache de capas compartilhado por apply_metadata (iTunes), shazam_fixer e a thumbnail do YouTube
+embutida no finalize_download.
+Cada URL baixada aponta (tabela cover_urls) para o sha256 do conteúdo; os arquivos ficam em
+<data_dir>/covers por hash, então URLs diferentes com a mesma imagem dividem o mesmo arquivo.
+Do original saem JPEGs quadrados (crop central pelo ffmpeg) nos tamanhos padrão de SIZES,
+gerados uma vez e reaproveitados: as 20 faixas de um álbum baixam e recortam a capa uma vez só.
+O diretório tem teto de tamanho (MAX_BYTES); os arquivos usados há mais tempo saem primeiro.
+"""
+import os
+import time
+import hashlib
+import threading
+import subprocess
+from utils import get_data_dir
+from database import get_cover_hash, save_cover_url, count_cover_urls
+
+SIZES = (300, 600, 1000)
+MAX_BYTES = 256 * 1024 * 1024
+# Quanto uma thread espera pelo download da mesma URL feito por outra
+FLIGHT_TIMEOUT = 30
+
+_flights = {}
+_lock = threading.Lock()
+_disk_bytes = None  # calculado na primeira escrita, depois mantido incrementalmente
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "fetches": 0, "dedup": 0, "crops": 0, "evicted": 0, "errors": 0}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+def _count(name: str, n: int = 1):
+    with _lock:
+        _stats[name] += n
+
+
+def covers_dir() -> str:
+    path = os.path.join(get_data_dir(), "covers")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def configure(max_mb: float = None) -> dict:
+    global MAX_BYTES
+    if max_mb is not None:
+        MAX_BYTES = int(max(16, min(16384, float(max_mb))) * 1024 * 1024)
+        _evict()
+    return get_config()
+
+
+def get_config() -> dict:
+    return {"max_mb": MAX_BYTES // (1024 * 1024), "sizes": list(SIZES)}
+
+
+def standard_size(size: int) -> int:
+    """Menor tamanho padrão que atende `size` (o maior, se nenhum atende)."""
+    return next((s for s in SIZES if s >= size), SIZES[-1])
+
+
+def _source_path(sha256: str) -> str:
+    return os.path.join(covers_dir(), f"{sha256}.src")
+
+
+def _variant_path(sha256: str, size: int) -> str:
+    return os.path.join(covers_dir(), f"{sha256}_{size}.jpg")
+
+
+def _touch(path: str):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def _write(path: str, data: bytes):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _grew(len(data))
+
+
+def _fetch(url: str) -> bytes:
+    from curl_cffi import requests
+    from config import CHROME_IMPERSONATE
+    _count("fetches")
+    res = requests.get(url, timeout=15, impersonate=CHROME_IMPERSONATE)
+    if res.status_code != 200 or not res.content:
+        raise Exception(f"capa respondeu HTTP {res.status_code}")
+    return res.content
+
+
+def _crop(sha256: str, size: int):
+    """JPEG quadrado (crop central) com no máximo `size` px de lado, sem ampliar. None se o ffmpeg falhar."""
+    from replaygain import ffmpeg_binary
+    out = _variant_path(sha256, size)
+    tmp = f"{out}.{threading.get_ident()}.tmp.jpg"
+    cmd = [ffmpeg_binary(), "-v", "error", "-y", "-i", _source_path(sha256),
+           "-vf", f"crop='min(iw,ih)':'min(iw,ih)',scale='min({size},iw)':'min({size},ih)'",
+           "-frames:v", "1", "-q:v", "2", tmp]
+    flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, errors="replace", creationflags=flags)
+    except OSError as e:
+        print(f"      \033[90m[covers:warn] ffmpeg indisponível para recortar a capa: {e}\033[0m")
+        return None
+    if proc.returncode != 0 or not os.path.exists(tmp):
+        print(f"      \033[90m[covers:warn] ffmpeg não recortou a capa: {proc.stderr.strip()[:200]}\033[0m")
+        try: os.remove(tmp)
+        except OSError: pass
+        return None
+    os.replace(tmp, out)
+    _count("crops")
+    _grew(os.path.getsize(out))
+    return out
+
+
+def _ensure_source(url: str) -> str:
+    """sha256 do original desta URL, baixando se o arquivo não estiver mais no disco."""
+    sha256 = get_cover_hash(url)
+    if sha256 and os.path.exists(_source_path(sha256)):
+        _touch(_source_path(sha256))
+        return sha256
+    data = _fetch(url)
+    sha256 = hashlib.sha256(data).hexdigest()
+    if os.path.exists(_source_path(sha256)):
+        _count("dedup")  # outra URL já trouxe a mesma imagem
+        _touch(_source_path(sha256))
+    else:
+        _write(_source_path(sha256), data)
+    save_cover_url(url, sha256)
+    return sha256
+
+
+def _build(url: str, size: int, crop: bool):
+    sha256 = _ensure_source(url)
+    if not crop: return _source_path(sha256)
+    path = _variant_path(sha256, size)
+    if os.path.exists(path): return path
+    return _crop(sha256, size) or _source_path(sha256)
+
+
+def cached_path(url: str, size: int = 1000, crop: bool = True):
+    """Caminho já no disco, sem baixar nem recortar (None se faltar)."""
+    sha256 = get_cover_hash(url) if url else None
+    if not sha256: return None
+    path = _variant_path(sha256, standard_size(size)) if crop else _source_path(sha256)
+    return path if os.path.exists(path) else None
+
+
+def get_path(url: str, size: int = 1000, crop: bool = True):
+    """
+    Caminho do JPEG quadrado da capa no cache (ou do original, se o recorte falhar). None em erro.
+    crop=False devolve o original sem passar pelo ffmpeg (capas que já vêm quadradas, como as do iTunes).
+    """
+    if not url: return None
+    size = standard_size(size)
+    path = cached_path(url, size, crop)
+    if path:
+        _count("hits")
+        _touch(path)
+        return path
+
+    key = (url, size if crop else None)
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            _stats["misses"] += 1
+        else:
+            _stats["coalesced"] += 1
+    if not leader:
+        flight.done.wait(FLIGHT_TIMEOUT)
+        return flight.result
+
+    try:
+        flight.result = _build(url, size, crop)
+        _evict()
+        return flight.result
+    except Exception as e:
+        _count("errors")
+        print(f"      \033[90m[covers:warn] Falha ao obter capa {url[:80]}: {e}\033[0m")
+        return None
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def get(url: str, size: int = 1000, crop: bool = True):
+    """Bytes do JPEG quadrado da capa (ver get_path) ou None."""
+    path = get_path(url, size, crop)
+    if not path: return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _scan() -> list:
+    entries = []
+    for name in os.listdir(covers_dir()):
+        if name.endswith(".tmp") or name.endswith(".tmp.jpg"): continue
+        path = os.path.join(covers_dir(), name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def _grew(n: int):
+    global _disk_bytes
+    with _lock:
+        if _disk_bytes is not None: _disk_bytes += n
+
+
+def _evict():
+    """Apaga os arquivos menos usados até o diretório caber em MAX_BYTES."""
+    global _disk_bytes
+    with _lock:
+        if _disk_bytes is not None and _disk_bytes <= MAX_BYTES: return
+    entries = _scan()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= MAX_BYTES: break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    with _lock:
+        _disk_bytes = total
+        _stats["evicted"] += removed
+
+
+def snapshot() -> dict:
+    entries = _scan()
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+    return {
+        **stats,
+        **get_config(),
+        "files": len(entries),
+        "disk_mb": round(sum(size for _, size, _ in entries) / (1024 * 1024), 2),
+        "urls": count_cover_urls(),
+        "hit_ratio": round((stats["hits"] + stats["coalesced"]) / lookups, 3) if lookups else 0.0,
+    }
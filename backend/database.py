@@ -40,6 +40,95 @@ def init_db():
                 added_at   REAL
             );
         """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS strategy_events (
+                strategy    TEXT,
+                ok          INTEGER,
+                error_class TEXT,
+                latency     REAL,
+                created_at  REAL
+            );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_strategy_events_created ON strategy_events (created_at);")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS job_queue (
+                job_id      TEXT PRIMARY KEY,
+                request     TEXT,
+                priority    TEXT,
+                status      TEXT,
+                title       TEXT,
+                error       TEXT,
+                created_at  REAL,
+                updated_at  REAL
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS playlist_group_tracks (
+                group_id       TEXT,
+                job_id         TEXT,
+                playlist_index INTEGER,
+                title          TEXT,
+                filename       TEXT,
+                finished_at    REAL,
+                PRIMARY KEY (group_id, job_id)
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS video_strategy_memo (
+                video_id    TEXT PRIMARY KEY,
+                strategy    TEXT,
+                successes   INTEGER,
+                updated_at  REAL
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS video_failures (
+                video_id      TEXT PRIMARY KEY,
+                failure_class TEXT,
+                message       TEXT,
+                failed_at     REAL,
+                expires_at    REAL
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS itunes_cache (
+                query       TEXT PRIMARY KEY,
+                result      TEXT,
+                created_at  REAL,
+                expires_at  REAL
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS cover_urls (
+                url         TEXT PRIMARY KEY,
+                sha256      TEXT,
+                fetched_at  REAL
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS store_objects (
+                video_id     TEXT,
+                profile      TEXT,
+                object_path  TEXT,
+                display_name TEXT,
+                title        TEXT,
+                artist       TEXT,
+                uploader     TEXT,
+                album        TEXT,
+                size         INTEGER,
+                created_at   REAL,
+                PRIMARY KEY (video_id, profile)
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS store_links (
+                link_path   TEXT PRIMARY KEY,
+                video_id    TEXT,
+                profile     TEXT,
+                kind        TEXT,
+                created_at  REAL
+            );
+        """)
         try:
             cur.execute("ALTER TABLE downloads ADD COLUMN url TEXT;")
         except: 
@@ -136,6 +225,339 @@ def mark_error_db(playlist_id: str, video_id: str, title: str, error_msg: str):
     except Exception as e:
         print(f"Erro ao salvar erro no DB: {e}")
 
+def record_strategy_event(strategy: str, ok: bool, error_class: str, latency: float, prune_before: float = None):
+    """Insere uma tentativa; com `prune_before`, apaga na mesma transação as mais velhas que a janela."""
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO strategy_events (strategy, ok, error_class, latency, created_at)
+            VALUES (?, ?, ?, ?, ?);
+        """, (strategy, 1 if ok else 0, error_class, latency, time.time()))
+        if prune_before is not None:
+            cur.execute("DELETE FROM strategy_events WHERE created_at < ?;", (prune_before,))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar evento de estrategia: {e}")
+
+def get_strategy_events(since: float) -> list:
+    """
+    Returns strategy attempts newer than `since` (oldest first) and prunes older rows,
+    so the table never grows past the scoreboard's sliding window.
+    """
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM strategy_events WHERE created_at < ?;", (since,))
+        cur.execute(
+            "SELECT strategy, ok, error_class, latency, created_at FROM strategy_events WHERE created_at >= ? ORDER BY created_at ASC;",
+            (since,)
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+        conn.commit()
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Erro ao carregar eventos de estrategia: {e}")
+        return []
+
+def get_video_memo(video_id: str) -> dict:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM video_strategy_memo WHERE video_id = ?;", (video_id,))
+        row = cur.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    except:
+        return None
+
+def save_video_memo(video_id: str, strategy: str):
+    """Última estratégia que funcionou para o vídeo (o contador só cresce enquanto for a mesma)."""
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO video_strategy_memo (video_id, strategy, successes, updated_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(video_id) DO UPDATE SET
+                successes = CASE WHEN strategy = excluded.strategy THEN successes + 1 ELSE 1 END,
+                strategy = excluded.strategy,
+                updated_at = excluded.updated_at;
+        """, (video_id, strategy, time.time()))
+        cur.execute("DELETE FROM video_failures WHERE video_id = ?;", (video_id,))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar memo de estrategia: {e}")
+
+def get_video_failure(video_id: str) -> dict:
+    """Falha permanente em cache ainda válida (as vencidas são apagadas aqui)."""
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM video_failures WHERE video_id = ? AND expires_at < ?;", (video_id, time.time()))
+        cur.execute("SELECT * FROM video_failures WHERE video_id = ?;", (video_id,))
+        row = cur.fetchone()
+        conn.commit()
+        conn.close()
+        return dict(row) if row else None
+    except:
+        return None
+
+def save_video_failure(video_id: str, failure_class: str, message: str, ttl: float):
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        now = time.time()
+        cur.execute("""
+            INSERT OR REPLACE INTO video_failures (video_id, failure_class, message, failed_at, expires_at)
+            VALUES (?, ?, ?, ?, ?);
+        """, (video_id, failure_class, message, now, now + ttl))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar falha permanente: {e}")
+
+def delete_video_failures(video_id: str = None, classes: tuple = None) -> int:
+    """Apaga falhas em cache de um vídeo, de algumas classes, ou todas (sem argumentos)."""
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        if video_id:
+            cur.execute("DELETE FROM video_failures WHERE video_id = ?;", (video_id,))
+        elif classes:
+            cur.execute(f"DELETE FROM video_failures WHERE failure_class IN ({','.join('?' * len(classes))});", tuple(classes))
+        else:
+            cur.execute("DELETE FROM video_failures;")
+        removed = cur.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+    except Exception as e:
+        print(f"Erro ao limpar falhas permanentes: {e}")
+        return 0
+
+def get_video_memo_summary() -> dict:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT strategy, COUNT(*) AS videos FROM video_strategy_memo GROUP BY strategy ORDER BY videos DESC;")
+        memo = {r["strategy"]: r["videos"] for r in cur.fetchall()}
+        cur.execute("SELECT failure_class, COUNT(*) AS videos FROM video_failures WHERE expires_at >= ? GROUP BY failure_class;", (time.time(),))
+        failures = {r["failure_class"]: r["videos"] for r in cur.fetchall()}
+        conn.close()
+        return {"memo": memo, "failures": failures}
+    except:
+        return {"memo": {}, "failures": {}}
+
+def get_itunes_cache(query: str) -> dict:
+    """Resposta do iTunes em cache e ainda válida. `result` NULL é um "não encontrado" em cache."""
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT result, created_at, expires_at FROM itunes_cache WHERE query = ? AND expires_at >= ?;", (query, time.time()))
+        row = cur.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    except:
+        return None
+
+def save_itunes_cache(query: str, result: str, ttl: float):
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        now = time.time()
+        cur.execute("INSERT OR REPLACE INTO itunes_cache (query, result, created_at, expires_at) VALUES (?, ?, ?, ?);",
+                    (query, result, now, now + ttl))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar cache do iTunes: {e}")
+
+def prune_itunes_cache(clear_all: bool = False) -> int:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        if clear_all:
+            cur.execute("DELETE FROM itunes_cache;")
+        else:
+            cur.execute("DELETE FROM itunes_cache WHERE expires_at < ?;", (time.time(),))
+        removed = cur.rowcount
+        conn.commit()
+        conn.close()
+        return removed
+    except Exception as e:
+        print(f"Erro ao limpar cache do iTunes: {e}")
+        return 0
+
+def get_itunes_cache_summary() -> dict:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COUNT(*) AS entries, SUM(CASE WHEN result IS NULL THEN 1 ELSE 0 END) AS negative
+            FROM itunes_cache WHERE expires_at >= ?;
+        """, (time.time(),))
+        row = cur.fetchone()
+        conn.close()
+        return {"entries": row["entries"] or 0, "negative_entries": row["negative"] or 0}
+    except:
+        return {"entries": 0, "negative_entries": 0}
+
+def get_cover_hash(url: str) -> str:
+    """Hash do conteúdo já baixado desta URL de capa (cover_cache.py)."""
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT sha256 FROM cover_urls WHERE url = ?;", (url,))
+        row = cur.fetchone()
+        conn.close()
+        return row["sha256"] if row else None
+    except:
+        return None
+
+def save_cover_url(url: str, sha256: str):
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO cover_urls (url, sha256, fetched_at) VALUES (?, ?, ?);", (url, sha256, time.time()))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar URL de capa: {e}")
+
+def count_cover_urls() -> int:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) AS n FROM cover_urls;")
+        row = cur.fetchone()
+        conn.close()
+        return row["n"] or 0
+    except:
+        return 0
+
+def save_job_rows(upserts: list, deletes: list):
+    """
+    Grava um lote da fila persistente numa única transação.
+    upserts: tuplas (job_id, request_json, priority, status, title, error, created_at)
+    """
+    if not upserts and not deletes: return
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        now = time.time()
+        cur.executemany("""
+            INSERT OR REPLACE INTO job_queue
+            (job_id, request, priority, status, title, error, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+        """, [row + (now,) for row in upserts])
+        cur.executemany("DELETE FROM job_queue WHERE job_id = ?;", [(job_id,) for job_id in deletes])
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar fila de jobs: {e}")
+
+def load_job_rows() -> list:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT job_id, request, priority, status, title, error, created_at FROM job_queue ORDER BY created_at ASC;")
+        rows = [dict(r) for r in cur.fetchall()]
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Erro ao carregar fila de jobs: {e}")
+        return []
+
+def save_group_tracks(rows: list):
+    """Faixas concluídas de playlists em andamento: tuplas (group_id, job_id, playlist_index, title, filename)."""
+    if not rows: return
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        now = time.time()
+        cur.executemany("""
+            INSERT OR REPLACE INTO playlist_group_tracks
+            (group_id, job_id, playlist_index, title, filename, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?);
+        """, [row + (now,) for row in rows])
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar faixas da playlist: {e}")
+
+def load_group_tracks(group_id: str) -> list:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT job_id, playlist_index, title, filename FROM playlist_group_tracks WHERE group_id = ?;", (group_id,))
+        rows = [dict(r) for r in cur.fetchall()]
+        conn.close()
+        return rows
+    except Exception as e:
+        print(f"Erro ao carregar faixas da playlist: {e}")
+        return []
+
+def delete_group_tracks(group_id: str):
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM playlist_group_tracks WHERE group_id = ?;", (group_id,))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao limpar faixas da playlist: {e}")
+
+def get_store_object(video_id: str, profile: str) -> dict:
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM store_objects WHERE video_id = ? AND profile = ?;", (video_id, profile))
+        row = cur.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    except:
+        return None
+
+def save_store_object(video_id: str, profile: str, object_path: str, display_name: str, meta: dict, size: int):
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT OR REPLACE INTO store_objects
+            (video_id, profile, object_path, display_name, title, artist, uploader, album, size, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """, (video_id, profile, object_path, display_name, meta.get('title'), meta.get('artist'),
+              meta.get('uploader'), meta.get('album'), size, time.time()))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar objeto do store: {e}")
+
+def add_store_link(link_path: str, video_id: str, profile: str, kind: str):
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO store_links (link_path, video_id, profile, kind, created_at) VALUES (?, ?, ?, ?, ?);",
+                    (link_path, video_id, profile, kind, time.time()))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao salvar link do store: {e}")
+
+def delete_store_object(video_id: str, profile: str):
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM store_objects WHERE video_id = ? AND profile = ?;", (video_id, profile))
+        cur.execute("DELETE FROM store_links WHERE video_id = ? AND profile = ?;", (video_id, profile))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"Erro ao remover objeto do store: {e}")
+
 def get_downloaded_ids(playlist_id: str) -> list[str]:
     """
     Returns video_ids that are 'downloaded'.
@@ -167,6 +589,22 @@ def get_downloaded_ids(playlist_id: str) -> list[str]:
         return []
 
 
+def find_downloaded_file(video_id: str) -> list[str]:
+    """Caminhos (como gravados) de todos os registros 'downloaded' desse vídeo, mais recentes primeiro."""
+    if not video_id: return []
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT file_path FROM downloads WHERE video_id = ? AND status = 'downloaded' AND file_path != '' ORDER BY created_at DESC;",
+            (video_id,)
+        )
+        paths = [r["file_path"] for r in cur.fetchall()]
+        conn.close()
+        return paths
+    except:
+        return []
+
 def mark_missing_db(playlist_id: str, video_id: str):
     try:
         conn = get_conn()
@@ -188,14 +626,83 @@ def get_download_record(playlist_id: str, video_id: str) -> dict:
     except:
         return None
 
+def _same_file(a: str, b: str) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+def _library_symlinks(downloads_dir: str) -> dict:
+    """Symlinks da biblioteca por destino (realpath): acha links do store movidos/renomeados pelo usuário."""
+    found = {}
+    for folder, _, names in os.walk(downloads_dir):
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.islink(path):
+                found.setdefault(os.path.realpath(path), []).append(path)
+    return found
+
+def _sync_store(cur, downloads_dir: str) -> dict:
+    """
+    Parte do content store (content_store.py) no sync: links cujo arquivo sumiu ou não aponta mais
+    para o objeto saem do índice, e objetos sem nenhum link vivo são apagados do disco.
+    Um hardlink continua válido mesmo sem o objeto; um symlink órfão já aparece como 'missing'.
+    Objeto ligado por symlink (store em outro disco) é o único dono dos bytes: nunca é apagado.
+    Se o symlink foi movido (ex.: tag_editor move para edited/), o caminho novo volta para o índice.
+    """
+    stale_links = 0
+    orphans = 0
+    freed = 0
+    cur.execute("SELECT link_path, video_id, profile, kind FROM store_links;")
+    links = {}
+    for row in cur.fetchall():
+        links.setdefault((row["video_id"], row["profile"]), []).append((row["link_path"], row["kind"]))
+
+    symlinks = None
+    cur.execute("SELECT video_id, profile, object_path, size FROM store_objects;")
+    for obj in cur.fetchall():
+        key = (obj["video_id"], obj["profile"])
+        live, stale = [], []
+        for link, kind in links.get(key, []):
+            (live if os.path.lexists(link) and _same_file(link, obj["object_path"]) else stale).append((link, kind))
+        exists = os.path.exists(obj["object_path"])
+        if not live and exists and any(kind == "symlink" for _, kind in stale):
+            if symlinks is None: symlinks = _library_symlinks(downloads_dir)
+            moved = symlinks.get(os.path.realpath(obj["object_path"]), [])
+            if not moved:
+                continue  # Symlink levado para fora da biblioteca: objeto e registros ficam
+            for link in moved:
+                cur.execute("INSERT OR REPLACE INTO store_links (link_path, video_id, profile, kind, created_at) VALUES (?, ?, ?, ?, ?);",
+                            (link, key[0], key[1], "symlink", time.time()))
+            live = [(link, "symlink") for link in moved]
+        for link, _ in stale:
+            cur.execute("DELETE FROM store_links WHERE link_path = ?;", (link,))
+            stale_links += 1
+        if live and exists:
+            continue
+        # Sem links (ou objeto apagado): remove o objeto e o registro
+        if not live and os.path.exists(obj["object_path"]):
+            try:
+                os.remove(obj["object_path"])
+                freed += obj["size"] or 0
+            except OSError:
+                continue
+        cur.execute("DELETE FROM store_objects WHERE video_id = ? AND profile = ?;", key)
+        cur.execute("DELETE FROM store_links WHERE video_id = ? AND profile = ?;", key)
+        orphans += 1
+    return {"stale_links": stale_links, "store_orphans_removed": orphans, "store_bytes_freed": freed}
+
 def sync_db_with_disk(downloads_dir: str) -> dict:
     """
     Varre todos os registros 'downloaded' no banco e verifica se os arquivos ainda existem no disco.
     Arquivos deletados sao marcados como 'missing' automaticamente.
-    Retorna um resumo com { 'checked': N, 'marked_missing': N }.
+    Os arquivos podem ser links para o content store: um symlink quebrado conta como ausente, e
+    objetos do store sem nenhum link restante são removidos (ver _sync_store).
+    Retorna um resumo com { 'checked': N, 'marked_missing': N, 'stale_links': N, 'store_orphans_removed': N, ... }.
     """
     checked = 0
     marked_missing = 0
+    store_summary = {}
     try:
         conn = get_conn()
         cur = conn.cursor()
@@ -217,7 +724,8 @@ def sync_db_with_disk(downloads_dir: str) -> dict:
                     (row["playlist_id"], row["video_id"])
                 )
                 marked_missing += 1
-        
+
+        store_summary = _sync_store(cur, downloads_dir)
         conn.commit()
         conn.close()
         
@@ -228,5 +736,5 @@ def sync_db_with_disk(downloads_dir: str) -> dict:
     except Exception as e:
         print(f"Erro no sync_db_with_disk: {e}")
     
-    return {"checked": checked, "marked_missing": marked_missing}
+    return {"checked": checked, "marked_missing": marked_missing, **store_summary}
 
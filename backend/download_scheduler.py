@@ -0,0 +1,148 @@
+"""
+download_scheduler.py
+Fila de downloads com prioridades, justiça entre playlists e lanes por fonte.
+Substitui o asyncio.Queue FIFO: um clique manual não espera mais atrás de 500 faixas
+de uma assinatura, e playlists grandes se revezam (round-robin) dentro da mesma prioridade.
+"""
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_RETRY = "retry"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_RETRY, PRIORITY_BACKGROUND)
+
+# Lanes por fonte: no máximo `limit` downloads simultâneos para URLs desses hosts.
+# Twitch precisa ser sequencial por conflito de tokens de live-stream.
+SOURCE_LANES = {
+    "twitch": {"hosts": ("twitch.tv",), "limit": 1},
+}
+DEFAULT_LANE = "default"
+
+
+def lane_for(url: str) -> str:
+    url = (url or "").lower()
+    for name, lane in SOURCE_LANES.items():
+        if any(h in url for h in lane["hosts"]):
+            return name
+    return DEFAULT_LANE
+
+
+@dataclass
+class QueuedJob:
+    job_id: str
+    request: Any
+    priority: str
+    group: str
+    lane: str
+    seq: int = field(default=0)
+
+
+class DownloadScheduler:
+    def __init__(self):
+        # prioridade -> OrderedDict(grupo -> deque[QueuedJob]); a ordem do OrderedDict é a vez do round-robin
+        self._buckets = {p: OrderedDict() for p in PRIORITIES}
+        self._index = {}
+        self._lane_active = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._index)
+
+    def put_nowait(self, job_id: str, request, priority: str = PRIORITY_INTERACTIVE) -> QueuedJob:
+        if priority not in PRIORITIES:
+            priority = PRIORITY_INTERACTIVE
+        group = getattr(request, 'playlist_id', None) or "single"
+        entry = QueuedJob(job_id, request, priority, group, lane_for(getattr(request, 'url', '')), next(self._seq))
+        self._append(entry)
+        return entry
+
+    async def put(self, job_id: str, request, priority: str = PRIORITY_INTERACTIVE) -> QueuedJob:
+        return self.put_nowait(job_id, request, priority)
+
+    def _append(self, entry: QueuedJob):
+        groups = self._buckets[entry.priority]
+        groups.setdefault(entry.group, deque()).append(entry)
+        self._index[entry.job_id] = entry
+        self._wakeup.set()
+
+    def _lane_has_room(self, lane: str) -> bool:
+        if lane not in SOURCE_LANES: return True
+        return self._lane_active.get(lane, 0) < SOURCE_LANES[lane]["limit"]
+
+    def _next(self) -> Optional[QueuedJob]:
+        """Próximo job elegível, sem tirá-lo da fila."""
+        for priority in PRIORITIES:
+            for queue in self._buckets[priority].values():
+                for entry in queue:
+                    if self._lane_has_room(entry.lane):
+                        return entry
+        return None
+
+    def _pick(self) -> Optional[QueuedJob]:
+        entry = self._next()
+        if not entry: return None
+        groups = self._buckets[entry.priority]
+        queue = groups[entry.group]
+        queue.remove(entry)
+        # Grupo atendido vai para o fim da vez (round-robin entre playlists)
+        groups.move_to_end(entry.group)
+        if not queue: del groups[entry.group]
+        del self._index[entry.job_id]
+        self._lane_active[entry.lane] = self._lane_active.get(entry.lane, 0) + 1
+        return entry
+
+    async def get(self) -> QueuedJob:
+        """Espera e retorna o próximo job elegível. Chame task_done(entry) ao terminar."""
+        while True:
+            entry = self._pick()
+            if entry: return entry
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def wait_ready(self):
+        """Espera até haver um job elegível, sem tirá-lo da fila (o worker pega o slot antes do get_nowait)."""
+        while self._next() is None:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def get_nowait(self) -> Optional[QueuedJob]:
+        """Tira o próximo job elegível agora, ou None se outro worker já levou. Chame task_done(entry) ao terminar."""
+        return self._pick()
+
+    def task_done(self, entry: QueuedJob):
+        self._lane_active[entry.lane] = max(0, self._lane_active.get(entry.lane, 0) - 1)
+        # Liberar uma lane pode destravar jobs que estavam esperando por ela
+        if self._index: self._wakeup.set()
+
+    def remove(self, job_id: str) -> Optional[QueuedJob]:
+        entry = self._index.pop(job_id, None)
+        if not entry: return None
+        groups = self._buckets[entry.priority]
+        queue = groups.get(entry.group)
+        if queue is not None:
+            queue.remove(entry)
+            if not queue: del groups[entry.group]
+        return entry
+
+    def reprioritize(self, job_id: str, priority: str) -> bool:
+        """Move um job ainda na fila para outra prioridade (vai para o fim do grupo nela)."""
+        if priority not in PRIORITIES: return False
+        entry = self.remove(job_id)
+        if not entry: return False
+        entry.priority = priority
+        self._append(entry)
+        return True
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": len(self._index),
+            "priorities": {
+                p: {group: len(q) for group, q in self._buckets[p].items()} for p in PRIORITIES
+            },
+            "lanes": {name: {"active": self._lane_active.get(name, 0), "limit": lane["limit"]} for name, lane in SOURCE_LANES.items()},
+        }
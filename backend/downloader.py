@@ -4,14 +4,42 @@ import time
 import sys
 import asyncio
 import threading
+import uuid
+import functools
 from typing import Optional, Dict, Any
-from dataclasses import dataclass, asdict
+from collections import deque
+from dataclasses import dataclass, asdict, field
 from utils import get_downloads_dir, get_cookies_path, parse_time
-from database import mark_downloaded_db, mark_error_db
-from metadata_fetcher import apply_metadata
+from database import mark_downloaded_db, mark_error_db, find_downloaded_file
+from metadata_fetcher import apply_metadata, prefetch as prefetch_metadata, record_cover_source
 from proxy_manager import get_random_proxy
 from lyrics_fetcher import fetch_and_embed_lyrics
+from tag_transaction import TagTransaction
+import strategy_scoreboard
+from download_scheduler import DownloadScheduler, PRIORITY_INTERACTIVE, PRIORITIES
+import rate_limiter
+import job_store
+import playlist_groups
+import postprocess_pool
+import replaygain
+import content_store
+import stall_watchdog
+import ydl_pool
+import video_memo
+import cover_cache
 from yt_dlp.networking.impersonate import ImpersonateTarget
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.postprocessor.ffmpeg import FFmpegExtractAudioPP
+from yt_dlp.utils import replace_extension, prepend_extension
+# Internals do yt-dlp usados pelo FilteredExtractAudioPP. O start_app.bat atualiza o yt-dlp a cada
+# início: se sumirem, os jobs com filtro voltam para o FFmpegExtractAudio padrão
+try:
+    from yt_dlp.globals import postprocessors as yt_dlp_postprocessors
+    from yt_dlp.postprocessor.ffmpeg import ACODECS
+except ImportError:
+    yt_dlp_postprocessors = ACODECS = None
+
+rate_limiter.install()
 
 TRANSIENT_ERRORS = ("rate-limited", "try again later", "HTTP Error 429", "temporarily unavailable", "network is unreachable")
 LOGIN_ERRORS = ("Sign in required", "account problem", "private video")
@@ -20,6 +48,33 @@ FORMAT_ERRORS = ("Requested format is not available", "requested format is not a
 def is_match(err_msg: str, fragments) -> bool:
     return any(f.lower() in err_msg.lower() for f in fragments)
 
+def classify_error(err_msg: str) -> str:
+    if is_match(err_msg, TRANSIENT_ERRORS): return "transient"
+    if is_match(err_msg, LOGIN_ERRORS): return "login"
+    if is_match(err_msg, FORMAT_ERRORS): return "format"
+    if "403" in err_msg or "forbidden" in err_msg.lower(): return "forbidden"
+    return "other"
+
+# Qualidades que mantêm o codec que o YouTube já entrega (remux/stream copy, sem reencode).
+# Pitch/velocidade/EQ exigem decodificar de qualquer jeito: esses jobs usam o FilteredExtractAudioPP.
+PASSTHROUGH_QUALITIES = {
+    'best': {'codec': 'm4a', 'ext': '.m4a', 'format': 'bestaudio[acodec^=mp4a]/bestaudio[ext=m4a]/bestaudio/best'},
+    'm4a':  {'codec': 'm4a', 'ext': '.m4a', 'format': 'bestaudio[acodec^=mp4a]/bestaudio[ext=m4a]/bestaudio/best'},
+    'opus': {'codec': 'opus', 'ext': '.opus', 'format': 'bestaudio[acodec=opus]/bestaudio/best'},
+}
+
+def is_passthrough(request) -> bool:
+    return request.mode != 'video' and request.quality in PASSTHROUGH_QUALITIES
+
+def audio_extension(request) -> str:
+    if request.mode == 'video': return '.mp4'
+    if request.quality == 'flac': return '.flac'
+    if request.quality in PASSTHROUGH_QUALITIES: return PASSTHROUGH_QUALITIES[request.quality]['ext']
+    return '.mp3'
+
+def has_audio_filters(request) -> bool:
+    return request.pitch != 0 or request.speed != 1.0 or bool(request.eq_preset and request.eq_preset in EQ_PRESETS)
+
 EQ_PRESETS = {
     'bass': 'equalizer=f=60:width_type=h:width=50:g=10',
     'soft': 'equalizer=f=1000:width_type=h:width=200:g=-5',
@@ -27,6 +82,59 @@ EQ_PRESETS = {
     'vocal': 'equalizer=f=3000:width_type=h:width=1000:g=5'
 }
 
+def _filtered_extract_supported() -> bool:
+    """Os internals de que o FilteredExtractAudioPP depende existem nesta versão do yt-dlp."""
+    try:
+        return (isinstance(yt_dlp_postprocessors.value, dict)
+                and all(len(entry) == 3 for entry in ACODECS.values())
+                and callable(getattr(FFmpegExtractAudioPP, '_quality_args', None))
+                and callable(getattr(PostProcessor, '_restrict_to', None)))
+    except Exception:
+        return False
+
+def _restrict_to_audio(func):
+    restrict = getattr(PostProcessor, '_restrict_to', None)
+    return restrict(images=False)(func) if restrict else func
+
+class FilteredExtractAudioPP(FFmpegExtractAudioPP):
+    """
+    FFmpegExtractAudio para jobs com pitch/velocidade/EQ: sempre reencoda no codec pedido.
+    O original copia o stream quando a fonte já está nesse codec, e aí o `-af` falha
+    ("Filtering and streamcopy cannot be used together", .webm -> .opus) ou é ignorado
+    ("Not converting", .m4a -> .m4a). Registrado no yt-dlp como 'FilteredExtractAudio'
+    quando FILTERED_EXTRACT_AUDIO; se um internal mudar no meio do caminho, cai no original.
+    """
+    @classmethod
+    def pp_key(cls):
+        return 'ExtractAudio'  # mesmos postprocessor_args ('extractaudio': -af ...)
+
+    @_restrict_to_audio
+    def run(self, information):
+        if self.mapping not in (ACODECS or {}): return super().run(information)
+        path = information['filepath']
+        try:
+            extension, acodec, _ = ACODECS[self.mapping]
+            quality_args = self._quality_args(acodec)
+        except (AttributeError, TypeError, ValueError) as e:
+            print(f"      \033[33m[audio:warn] Reencode forçado indisponível nesta versão do yt-dlp ({e}), usando FFmpegExtractAudio\033[0m")
+            return super().run(information)
+        new_path = replace_extension(path, extension, information['ext'])
+        temp_path = prepend_extension(new_path, 'temp')
+        orig_path = prepend_extension(path, 'orig') if new_path == path else path
+        self.to_screen(f'Destination: {new_path}')
+        self.run_ffmpeg(path, temp_path, acodec, quality_args)
+        os.replace(path, orig_path)
+        os.replace(temp_path, new_path)
+        information['filepath'] = new_path
+        information['ext'] = extension
+        return [orig_path], information
+
+FILTERED_EXTRACT_AUDIO = _filtered_extract_supported()
+if FILTERED_EXTRACT_AUDIO:
+    yt_dlp_postprocessors.value['FilteredExtractAudioPP'] = FilteredExtractAudioPP
+else:
+    print("\033[33m[audio:warn] yt-dlp sem os internals do FilteredExtractAudioPP: pitch/velocidade/EQ usam o FFmpegExtractAudio padrão\033[0m")
+
 @dataclass
 class JobState:
     id: str
@@ -42,13 +150,142 @@ class JobState:
     speed_str: Optional[str] = None
     total_bytes_str: Optional[str] = None
     downloaded_bytes_str: Optional[str] = None
+    priority: Optional[str] = None
+    bytes_reused: int = 0
+    playlist_id: Optional[str] = None
+    # Jobs de playlist expandidos (ver playlist_groups.py): o pai agrega os filhos
+    group_id: Optional[str] = None
+    children_total: int = 0
+    children_done: int = 0
+    children_failed: int = 0
+    # Pós-processamento fora do slot de download: "queued" na fila do postprocess_pool, depois "running"
+    processing_state: Optional[str] = None
+    processing_started_at: Optional[float] = None
+    # Pedidos repetidos que foram anexados a este job em vez de baixar de novo
+    coalesced: int = 0
+    # Vigia de travamentos (stall_watchdog.py): total, causas, travamento atual e voltas para a fila
+    stalls: int = 0
+    stall_causes: Dict[str, int] = field(default_factory=dict)
+    stalled: Optional[str] = None
+    stall_requeues: int = 0
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # Marca o job como sujo para o ws_broadcast_loop enviar só o que mudou
+        _dirty_jobs.add(self.id if name != 'id' else value)
+
+_dirty_jobs = set()
+
+def pop_dirty_jobs() -> set:
+    # set.pop é atômico: threads de download podem continuar marcando enquanto drenamos
+    dirty = set()
+    while _dirty_jobs:
+        try: dirty.add(_dirty_jobs.pop())
+        except KeyError: break
+    return dirty
 
 jobs: Dict[str, JobState] = {}
-download_queue: asyncio.Queue = asyncio.Queue()
+# Fila com prioridades, round-robin entre playlists e lanes por fonte (ver download_scheduler.py)
+download_queue = DownloadScheduler()
 MAX_CONCURRENT_DOWNLOADS = 4
-download_sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
-# Twitch streams require sequential processing due to live-stream token conflicts
-twitch_sem = asyncio.Semaphore(1)
+# Teto quando o usuário não salvou nenhum valor em /api/settings/concurrent_downloads
+MAX_CONCURRENT_CEILING = 8
+
+class AIMDLimiter:
+    """
+    Semáforo com limite adaptativo (AIMD, como o controle de congestionamento do TCP).
+    Sobe +1 slot a cada `limit` downloads bem-sucedidos e corta pela metade quando o YouTube
+    devolve erros de TRANSIENT_ERRORS (429, rate-limited...). Nunca passa de `ceiling`,
+    que é o valor escolhido pelo usuário. Os sinais podem vir das threads de download.
+    """
+    DECREASE_COOLDOWN = 30  # segundos: uma rajada de 429 simultâneos corta só uma vez
+
+    def __init__(self, ceiling: int, initial: int = None, floor: int = 1):
+        self.ceiling = ceiling
+        self.floor = floor
+        self.limit = max(floor, min(ceiling, initial or ceiling))
+        self.active = 0
+        self.adjustments = deque(maxlen=50)
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._loop = None
+
+    async def acquire(self):
+        self._loop = asyncio.get_running_loop()
+        while self.active >= self.limit:
+            fut = self._loop.create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            finally:
+                if fut in self._waiters: self._waiters.remove(fut)
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def _wake(self):
+        # Acorda todos; cada um re-testa o limite (no máximo ~20 workers esperando)
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done(): fut.set_result(True)
+
+    def _wake_threadsafe(self):
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _adjust(self, new_limit: int, reason: str):
+        old = self.limit
+        self.limit = new_limit
+        self.adjustments.append({"at": time.time(), "from": old, "to": new_limit, "reason": reason})
+        print(f"[\033[90mAIMD\033[0m] Concorrência {old} -> {new_limit} ({reason})")
+
+    def on_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.ceiling:
+                self._successes = 0
+                self._adjust(self.limit + 1, "additive increase")
+            else:
+                return
+        self._wake_threadsafe()
+
+    def on_rate_limited(self):
+        with self._lock:
+            now = time.time()
+            if now - self._last_decrease < self.DECREASE_COOLDOWN or self.limit <= self.floor:
+                return
+            self._last_decrease = now
+            self._successes = 0
+            self._adjust(max(self.floor, self.limit // 2), "rate limited")
+
+    def set_ceiling(self, ceiling: int):
+        with self._lock:
+            self.ceiling = max(self.floor, ceiling)
+            if self.limit > self.ceiling:
+                self._adjust(self.ceiling, "user setting")
+        self._wake_threadsafe()
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "ceiling": self.ceiling,
+            "floor": self.floor,
+            "adjustments": list(self.adjustments),
+        }
+
+download_sem = AIMDLimiter(MAX_CONCURRENT_CEILING, initial=MAX_CONCURRENT_DOWNLOADS)
 main_event_loop = None
 active_tasks = {}
 
@@ -66,26 +303,81 @@ async def memory_reaper():
         for j_id in stale_jobs:
             jobs.pop(j_id, None)
             active_tasks.pop(j_id, None)
+
+        # Chaves de deduplicação cujo job já terminou ou saiu da memória
+        for key, j_id in list(_inflight.items()):
+            st = jobs.get(j_id)
+            if not st or st.status in FINAL_STATUSES:
+                _inflight.pop(key, None)
         
         if stale_jobs:
             print(f"[\033[90mMemory Reaper\033[0m] Cleared {len(stale_jobs)} old jobs from RAM.")
 
-def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
-    downloads_dir = get_downloads_dir()
-    os.makedirs(downloads_dir, exist_ok=True)
-    
+def section_range(request):
+    """(início, fim) em segundos a partir de start_time/end_time; fim None = até o final. None = vídeo inteiro."""
+    start = parse_time(getattr(request, 'start_time', None))
+    end = parse_time(getattr(request, 'end_time', None))
+    if start is None and end is None: return None
+    start = start or 0
+    if end is not None and end <= start: return None
+    if end is None and start == 0: return None
+    return (start, end)
+
+def _section_label(section) -> str:
+    clock = lambda t: f"{int(t) // 60:02d}.{int(t) % 60:02d}"
+    return f" (trecho {clock(section[0])}-{clock(section[1]) if section[1] is not None else 'fim'})"
+
+def _section_percent(d: dict, section):
+    """
+    Progresso de um download por trecho. O FFmpegFD não emite hooks 'downloading': quem chama aqui é o
+    SectionProbe, com o tempo já gravado pelo ffmpeg (section_time) sobre a duração do trecho. Sem ele,
+    estima pelos bytes contra o bitrate do formato vezes a duração do trecho.
+    """
+    info = d.get('info_dict') or {}
+    start, end = section
+    end = end if end is not None else info.get('duration')
+    if not end or end <= start: return None
+    if d.get('section_time') is not None:
+        return min(99.9, 100.0 * d['section_time'] / (end - start))
+    if not d.get('downloaded_bytes'): return None
+    total = d.get('total_bytes')
+    if not total:
+        bitrate = info.get('tbr') or ((info.get('vbr') or 0) + (info.get('abr') or 0))
+        if not bitrate: return None
+        total = bitrate * 125 * (end - start)  # kbit/s -> bytes
+    return min(99.9, 100.0 * d['downloaded_bytes'] / total)
+
+def output_template(request, downloads_dir: str) -> str:
+    """outtmpl do pedido (pastas de playlist/artista e sufixo de recorte). Também usado pelo content_store."""
     organize_by_artist = getattr(request, 'organize', False)
     organize_by_playlist = getattr(request, 'organize_by_playlist', False)
     
+    # Faixas de uma playlist expandida não têm mais playlist_title no info_dict: a pasta vem do grupo
+    playlist_folder = '%(playlist_title|Avulsas)s'
+    if getattr(request, 'playlist_title', None):
+        playlist_folder = yt_dlp.utils.sanitize_filename(request.playlist_title).replace('%', '%%')
+
     if organize_by_playlist and organize_by_artist:
-        outtmpl = os.path.join(downloads_dir, '%(playlist_title|Avulsas)s', '%(artist,uploader|Unknown Artist)s', '%(title)s.%(ext)s')
+        outtmpl = os.path.join(downloads_dir, playlist_folder, '%(artist,uploader|Unknown Artist)s', '%(title)s.%(ext)s')
     elif organize_by_playlist:
-        outtmpl = os.path.join(downloads_dir, '%(playlist_title|Avulsas)s', '%(title)s.%(ext)s')
+        outtmpl = os.path.join(downloads_dir, playlist_folder, '%(title)s.%(ext)s')
     elif organize_by_artist:
         outtmpl = os.path.join(downloads_dir, '%(artist,uploader|Unknown Artist)s', '%(album|Singles)s', '%(title)s.%(ext)s')
     else:
         outtmpl = os.path.join(downloads_dir, '%(title)s.%(ext)s')
 
+    # Recorte: nome próprio para não colidir com (nem ser pulado por) o download completo
+    section = section_range(request)
+    if section:
+        outtmpl = outtmpl.replace('%(title)s.%(ext)s', '%(title)s' + _section_label(section) + '.%(ext)s')
+    return outtmpl
+
+def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
+    downloads_dir = get_downloads_dir()
+    os.makedirs(downloads_dir, exist_ok=True)
+    outtmpl = output_template(request, downloads_dir)
+    section = section_range(request)
+
     resource_dir = os.path.dirname(os.path.abspath(__file__))
     if getattr(sys, 'frozen', False):
         if hasattr(sys, '_MEIPASS'):
@@ -114,14 +406,16 @@ def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
         
         postprocessors.append({'key': 'FFmpegMetadata'})
     else:
-        audio_extract = {'key': 'FFmpegExtractAudio'}
+        # Com filtro o stream nunca pode ser copiado (ver FilteredExtractAudioPP)
+        audio_extract = {'key': 'FilteredExtractAudio' if has_audio_filters(request) and FILTERED_EXTRACT_AUDIO else 'FFmpegExtractAudio'}
         
         if request.quality == 'flac':
              audio_extract['preferredcodec'] = 'flac'
              # FLAC é lossless, FFmpeg quebra se passarmos bitrate pra ele.
-        elif request.quality == 'best': 
-             audio_extract['preferredcodec'] = 'm4a'
-             audio_extract['preferredquality'] = '320'
+        elif request.quality in PASSTHROUGH_QUALITIES:
+             passthrough = PASSTHROUGH_QUALITIES[request.quality]
+             audio_extract['preferredcodec'] = passthrough['codec']
+             format_str = passthrough['format']
         elif request.quality == 'medium':
              audio_extract['preferredcodec'] = 'mp3'
              audio_extract['preferredquality'] = '128'
@@ -133,9 +427,7 @@ def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
              audio_extract['preferredquality'] = '320'
 
         postprocessors.append(audio_extract)
-        postprocessors.append({'key': 'FFmpegThumbnailsConvertor', 'format': 'jpg'})
-        postprocessors.append({'key': 'EmbedThumbnail'})
-        postprocessors.append({'key': 'FFmpegMetadata'})
+        # Sem EmbedThumbnail/FFmpegMetadata: capa e tags vão numa única gravação no finalize_download (TagTransaction)
 
     postprocessor_args = {}
     
@@ -162,16 +454,11 @@ def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
     if request.eq_preset and request.eq_preset in EQ_PRESETS:
          af_filters.append(EQ_PRESETS[request.eq_preset])
 
-    if request.mode != 'video':
-         af_filters.append("loudnorm=I=-16:TP=-1.5:LRA=11")
+    # Sem loudnorm: a loudness é medida depois e gravada como tag ReplayGain/R128 (replaygain.py)
 
     if af_filters:
          postprocessor_args['extractaudio'] = ['-af', ",".join(af_filters)]
 
-    # Crop thumbnail to square (1:1) to remove white/black side bars on 16:9 covers
-    if request.mode != 'video':
-         postprocessor_args['FFmpegThumbnailsConvertor'] = ['-vf', "crop='min(iw,ih)':'min(iw,ih)'"]
-
     class StdoutLogger:
         def debug(self, msg): pass
         def warning(self, msg): 
@@ -181,13 +468,24 @@ def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
             # Imprime erro com cor vermelha
             print(f"      \033[31m[yt-dlp:err] {msg}\033[0m")
 
+    metadata_prefetched = []
+
     def local_progress_hook(d):
         if job_id in jobs and jobs[job_id].status == 'cancelled':
             raise Exception("Download cancelado pelo usuario")
+        # Bytes/s por job: sem vazão pela janela do vigia, a tentativa é abortada aqui
+        stall_watchdog.feed(job_id, d)
         
         if d['status'] == 'downloading':
+            if not metadata_prefetched and request.mode != 'video':
+                # iTunes e capa resolvidos em paralelo com o download (ver metadata_fetcher.prefetch)
+                metadata_prefetched.append(True)
+                prefetch_metadata(d.get('info_dict', {}).get('title', ''))
             try:
                 p = d.get('_percent_str', '0%').replace('%','')
+                if section:
+                    section_p = _section_percent(d, section)
+                    if section_p is not None: p = f"{section_p:.1f}"
                 speed = d.get('_speed_str')
                 if speed and '~' in speed: speed = speed.replace('~', '')
                 if speed and '---b/s' in speed: speed = None
@@ -226,7 +524,7 @@ def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
         'nocheckcertificate': True,
         'ignoreerrors': False, 
         'no_warnings': False, 
-        'writethumbnail': True, 
+        'writethumbnail': request.mode == 'video', 
         'ffmpeg_location': resource_dir, 
         'postprocessors': postprocessors,
         'postprocessor_args': postprocessor_args,
@@ -236,16 +534,13 @@ def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
         'extract_flat': False,
         'cookiefile': get_cookies_path(),
         'no_overwrites': True,
+        'continuedl': True,
         'extractor_args': {'youtube': {'player_client': ['tv']}},
         'concurrent_fragment_downloads': 16,
     }
     
-    # Aplica o "Jittering" (Anti-Ban Sleep Aleatório) para TODOS os downloads e buscas
-    # Impede que metralhadoras de ytsearch1: (Spotify) bloqueiem o IP instantaneamente
-    ydl_opts["sleep_requests"] = 1.5
-    ydl_opts["sleep_interval"] = 6
-    ydl_opts["max_sleep_interval"] = 25
-    ydl_opts["sleep_subtitles"] = 2
+    # O anti-ban não é mais um sleep fixo por job: toda requisição do yt-dlp passa pelo
+    # token bucket global por host (rate_limiter.py), inclusive as metralhadoras de ytsearch1: (Spotify)
     
     subtitle_lang = getattr(request, 'subtitle', 'none')
     if request.mode == 'video' and subtitle_lang != 'none':
@@ -260,6 +555,14 @@ def build_ydl_opts(job_id: str, request) -> Dict[str, Any]:
         # Also include automatic subtitles if requested language wasn't manually uploaded
         ydl_opts['writeautomaticsub'] = True
 
+    if section:
+        # Só os fragmentos do trecho são baixados (ffmpeg com seek na URL do stream) e só ele é convertido
+        from yt_dlp.utils import download_range_func
+        start, end = section
+        ydl_opts['download_ranges'] = download_range_func(None, [(start, end if end is not None else float('inf'))])
+        # Vídeo precisa de keyframe no corte para não começar congelado; áudio corta em qualquer amostra
+        ydl_opts['force_keyframes_at_cuts'] = request.mode == 'video'
+
     if request.cover_path and os.path.exists(request.cover_path):
         ydl_opts['writethumbnail'] = False
         postprocessors = [p for p in postprocessors if p.get('key') != 'EmbedThumbnail']
@@ -302,8 +605,7 @@ def build_ydl_opts_for_strategy(job_id: str, request, strategy: dict):
     
     return base_opts
 
-def download_with_retries(job_id: str, request):
-    print(f"\n\033[1;35m[+] INICIANDO SMART DOWNLOAD:\033[0m \033[36m{request.url}\033[0m")
+def build_strategies(request) -> list:
     strategies = [
         {"name": "tv_embedded", "use_cookies": True, "client": "tv_embedded"},
         {"name": "web_embedded", "use_cookies": True, "client": "web_embedded", "impersonate": "chrome"},
@@ -324,14 +626,332 @@ def download_with_retries(job_id: str, request):
         {"name": "invidious_fallback", "use_invidious": True, "use_cookies": False, "client": "web", "impersonate": "chrome"},
         {"name": "proxy_survival", "format": "bestaudio[protocol^=http]", "use_cookies": False, "client": "web", "impersonate": "chrome", "use_proxy": True},
     ]
-    strategies = [s for s in strategies if s is not None]
+    return [s for s in strategies if s is not None]
+
+class PartialResume:
+    """
+    Mantém os .part (e o estado de fragmentos .ytdl) entre trocas de estratégia.
+    Guarda, por vídeo, o format_id da tentativa anterior e os arquivos temporários que ela criou.
+    Na próxima tentativa, um PostProcessor 'before_dl' (roda depois da seleção de formato e antes
+    do download) compara o formato escolhido: se for o mesmo, o yt-dlp retoma do byte onde parou
+    (continuedl); se mudou, apaga os parciais para não emendar bytes de outro formato.
+    """
+    def __init__(self, st: JobState):
+        self.st = st
+        self.videos = {}  # video_id -> {"format_id": str, "parts": set()}
+
+    def preferred_format(self, base_format: Optional[str]) -> Optional[str]:
+        # Com um único vídeo em andamento, tenta o mesmo formato primeiro para poder retomar
+        started = [v for v in self.videos.values() if v["format_id"] and v["parts"]]
+        if len(started) != 1: return base_format
+        return f"{started[0]['format_id']}/{base_format}" if base_format else started[0]["format_id"]
+
+    def progress_hook(self, d):
+        if d.get('status') != 'downloading' or not d.get('tmpfilename'): return
+        video_id = (d.get('info_dict') or {}).get('id')
+        if video_id in self.videos:
+            self.videos[video_id]["parts"].add(d['tmpfilename'])
+
+    @staticmethod
+    def _temp_files(part: str) -> list:
+        import glob
+        files = glob.glob(glob.escape(part) + '*')  # .part e .part-FragN
+        if part.endswith('.part'):
+            files.append(part[:-len('.part')] + '.ytdl')
+        return [f for f in files if os.path.exists(f)]
+
+    def _discard(self, entry: dict):
+        for part in entry["parts"]:
+            for f in self._temp_files(part):
+                try: os.remove(f)
+                except OSError: pass
+        entry["parts"].clear()
+
+    def before_download(self, info: dict):
+        video_id, format_id = info.get('id'), info.get('format_id')
+        entry = self.videos.setdefault(video_id, {"format_id": None, "parts": set()})
+        if entry["format_id"] and entry["format_id"] != format_id and entry["parts"]:
+            print(f"      \033[90m[resume] Formato mudou ({entry['format_id']} -> {format_id}), recomeçando do zero\033[0m")
+            self._discard(entry)
+        elif entry["parts"]:
+            reused = sum(os.path.getsize(f) for part in entry["parts"] for f in self._temp_files(part) if not f.endswith('.ytdl'))
+            if reused:
+                self.st.bytes_reused += reused
+                print(f"      \033[94m[resume] Retomando {format_id}: {reused / 1048576:.1f} MB reaproveitados\033[0m")
+        entry["format_id"] = format_id
+
+    def discard_all(self):
+        for entry in self.videos.values():
+            self._discard(entry)
+
+    def attach(self, ydl):
+        resume = self
+
+        class ResumeGuardPP(PostProcessor):
+            def run(self, info):
+                resume.before_download(info)
+                return [], info
+
+        ydl.add_post_processor(ResumeGuardPP(ydl), when='before_dl')
+
+class SectionProbe:
+    """
+    Downloads por trecho (download_ranges) passam pelo FFmpegFD do yt-dlp, que espera o ffmpeg terminar
+    e só emite o hook 'finished': sem hooks 'downloading' o stall_watchdog dava como travado todo
+    trecho mais longo que STARTUP_WINDOW, e o progresso ficava em 0% até o fim. O ffmpeg ganha `-progress` num arquivo temporário e uma
+    thread lê dali o tempo já gravado, entregando aos hooks o mesmo dicionário de um download com
+    progresso. O tamanho do .part não serve: o muxer segura os pacotes e o arquivo só cresce no fim.
+    Se o tempo para de andar, o vigia marca o travamento como em qualquer outro download.
+    """
+    INTERVAL = 1.0
+    # Bitrate suposto quando o formato não informa (os bytes estimados só alimentam o vigia)
+    DEFAULT_KBPS = 128
+
+    def __init__(self, hooks: list):
+        import tempfile
+        self.hooks = list(hooks)
+        self.progress_path = os.path.join(tempfile.gettempdir(), f"section-{uuid.uuid4().hex}.progress")
+        self.done = threading.Event()
+        self.thread = None
+
+    def apply(self, opts: dict) -> dict:
+        """Opções do yt-dlp com o `-progress` do ffmpeg apontando para o arquivo desta tentativa."""
+        args = dict(opts.get('external_downloader_args') or {})
+        args['ffmpeg_o'] = list(args.get('ffmpeg_o', [])) + ['-progress', self.progress_path, '-stats_period', '0.5']
+        return dict(opts, external_downloader_args=args)
+
+    def _read_progress(self) -> dict:
+        """Último bloco `chave=valor` do -progress (o arquivo cresce com um bloco por período)."""
+        try:
+            with open(self.progress_path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 4096))
+                lines = f.read().decode('utf-8', 'replace').splitlines()
+        except OSError:
+            return {}
+        values = {}
+        for line in lines:
+            key, sep, value = line.partition('=')
+            if sep: values[key.strip()] = value.strip()
+        return values
+
+    def _run(self, filename: str, info: dict, token):
+        stall_watchdog.bind(token)
+        started = time.monotonic()
+        kbps = info.get('tbr') or ((info.get('vbr') or 0) + (info.get('abr') or 0)) or self.DEFAULT_KBPS
+        last_bytes = None
+        while not self.done.wait(self.INTERVAL):
+            progress = self._read_progress()
+            try:
+                out_time = max(0, int(progress.get('out_time_us', 0))) / 1e6
+                written = int(progress.get('total_size', 0))
+            except ValueError:
+                continue
+            downloaded = max(written, int(out_time * kbps * 125))  # kbit/s -> bytes
+            if not downloaded: continue
+            elapsed = max(time.monotonic() - started, 1e-3)
+            speed = downloaded / elapsed
+            d = {'status': 'downloading', 'downloaded_bytes': downloaded, 'filename': filename,
+                 'tmpfilename': filename + '.part', 'info_dict': info, 'elapsed': elapsed, 'speed': speed,
+                 'section_time': out_time,
+                 '_downloaded_bytes_str': yt_dlp.utils.format_bytes(downloaded),
+                 '_speed_str': f"{yt_dlp.utils.format_bytes(speed)}/s" if downloaded != last_bytes else None}
+            last_bytes = downloaded
+            try:
+                for hook in self.hooks: hook(d)
+            except Exception as e:
+                # Travado, abandonado ou cancelado: para de alimentar. Sem hooks, o vigia escala para
+                # "hung" e o worker_loop abandona a thread presa no ffmpeg
+                print(f"      \033[90m[trecho] Sonda de progresso parada: {str(e).splitlines()[0][:80]}\033[0m")
+                return
+
+    def start(self, filename: str, info: dict):
+        self.stop()
+        self.done.clear()
+        self.thread = threading.Thread(target=self._run, args=(filename, info, stall_watchdog.current_token()),
+                                       daemon=True, name="section-probe")
+        self.thread.start()
+
+    def progress_hook(self, d):
+        if d.get('status') == 'finished': self.done.set()
+
+    def stop(self):
+        self.done.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        try: os.remove(self.progress_path)
+        except OSError: pass
+
+    def attach(self, ydl):
+        probe = self
 
+        class SectionProbePP(PostProcessor):
+            def run(self, info):
+                probe.start(ydl.prepare_filename(info), info)
+                return [], info
+
+        ydl.add_post_processor(SectionProbePP(ydl), when='before_dl')
+        ydl.add_progress_hook(self.progress_hook)
+
+def stage_youtube_tags(txn: TagTransaction, info: dict, request):
+    """
+    O que o FFmpegMetadata gravava (título, canal, data, URL), agora só registrado: as etapas
+    seguintes sobrescrevem o que tiverem de melhor.
+    """
+    txn.set(title=info.get('title'), artist=info.get('artist') or info.get('uploader'),
+            album=info.get('album'), date=info.get('upload_date'), comment=info.get('webpage_url'))
+    txn.stage("youtube")
+
+# ffmpeg que o pipeline antigo rodava por faixa de áudio: FFmpegThumbnailsConvertor (crop), EmbedThumbnail, FFmpegMetadata
+LEGACY_AUDIO_FFMPEG_RUNS = 3
+
+def stage_cover(txn: TagTransaction, info: dict, request) -> str:
+    """
+    Capa pela ordem de autoridade: a do iTunes (já registrada pelo apply_metadata) vence e a thumbnail
+    do YouTube nem é baixada; sem ela, thumbnail quadrada do cover_cache. Registra as execuções de
+    ffmpeg evitadas em relação ao pipeline antigo e devolve a origem da capa.
+    """
+    legacy_runs = LEGACY_AUDIO_FFMPEG_RUNS
+    if request.cover_path and os.path.exists(request.cover_path):
+        source, ffmpeg_runs = "custom", 0
+        legacy_runs = 1  # sem thumbnail, o pipeline antigo só rodava o FFmpegMetadata
+    elif txn.cover:
+        source, ffmpeg_runs = "itunes", 0
+    else:
+        url = info.get('thumbnail')
+        ffmpeg_runs = 0 if cover_cache.cached_path(url, 1000) else 1
+        txn.set_cover(cover_cache.get(url, 1000))
+        source = "thumbnail" if txn.cover else "none"
+        if txn.cover: txn.stage("thumbnail")
+    record_cover_source(source, legacy_runs - ffmpeg_runs)
+    return source
+
+def finalize_download(job_id: str, request, info: dict, pp_opts: Dict[str, Any], strat_name: str):
+    """
+    Etapa de pós-processamento, fora do slot de download (roda no postprocess_pool):
+    FFmpegExtractAudio, limpeza do nome, medição de loudness gravada como tags ReplayGain/R128
+    (replaygain.py, sem reencode), capa, tags do iTunes e letra, tudo numa única TagTransaction.
+    """
     st = jobs.get(job_id)
     if not st or st.status == "cancelled": return
+    st.status = "processing"
+    st.processing_state = "running"
+    downloaded = (info.get('requested_downloads') or [info])[0]
+    with ydl_pool.lease(pp_opts) as ydl:
+        ydl.post_process(downloaded.get('filepath') or ydl.prepare_filename(downloaded), dict(downloaded))
+        filename = ydl.prepare_filename(info)
+
+    base_path, _ = os.path.splitext(filename)
+
+    full_final_path = base_path + audio_extension(request)
+
+    final_filename_relative = os.path.relpath(full_final_path, get_downloads_dir())
+
+    # Clean filename by removing YouTube tags
+    if request.mode != 'video':
+        from metadata_fetcher import clean_title
+        original_name = os.path.basename(base_path)
+        cleaned_name = clean_title(original_name)
+
+        if cleaned_name != original_name and cleaned_name.strip():
+            new_base_path = os.path.join(os.path.dirname(base_path), cleaned_name)
+            new_full_final_path = new_base_path + audio_extension(request)
+
+            try:
+                if os.path.exists(full_final_path) and not os.path.exists(new_full_final_path):
+                    os.rename(full_final_path, new_full_final_path)
+                    full_final_path = new_full_final_path
+                    final_filename_relative = os.path.relpath(full_final_path, get_downloads_dir())
+            except Exception as e:
+                print(f"  \033[33mWARN Erro ao renomear arquivo limpo: {e}\033[0m")
+
+    # Tags de todas as etapas abaixo vão para o arquivo numa única gravação (tag_transaction.py)
+    txn = TagTransaction(full_final_path)
+    if request.mode != 'video':
+        try:
+            stage_youtube_tags(txn, info, request)
+        except Exception as e:
+            print(f"  \033[33mWARN Falha ao preparar tags do YouTube: {e}\033[0m")
+
+    # O áudio não é normalizado no encode: a loudness vira tag para o player
+    if request.mode != 'video' and os.path.exists(full_final_path):
+        try:
+            loudness = replaygain.apply(full_final_path, txn)
+            print(f"  \033[94m-> ReplayGain: {loudness['integrated_lufs']:.1f} LUFS, pico {loudness['true_peak_dbtp']:.1f} dBTP\033[0m")
+        except Exception as e:
+            print(f"  \033[33mWARN Falha ao medir loudness: {e}\033[0m")
+
+    # Apply Premium Metadata
+    if request.mode != 'video':
+        print(f"  \033[94m-> Buscando metadados premium no iTunes...\033[0m")
+        success = apply_metadata(full_final_path, info.get('title', ''), txn)
+        if success:
+            print(f"    \033[32mOK Capa High-Res e Tags do iTunes encontradas!\033[0m")
+        try:
+            if stage_cover(txn, info, request) == "thumbnail":
+                print(f"    \033[90mSem capa do iTunes, usando a thumbnail do YouTube\033[0m")
+        except Exception as e:
+            print(f"  \033[33mWARN Falha ao preparar a capa: {e}\033[0m")
+
+        # Inject Lyrics
+        title = info.get('title', '') or getattr(request, 'title', '') or ''
+        artist = info.get('uploader', '') or info.get('artist', '') or getattr(request, 'artist', '') or ''
+        if title:
+            print(f"  \033[94m-> Buscando letra da musica...\033[0m")
+            lyrics_ok = fetch_and_embed_lyrics(full_final_path, title, artist, txn)
+            if lyrics_ok:
+                print(f"    \033[32mOK Letra encontrada!\033[0m")
+            else:
+                print(f"    Letra nao encontrada, continuando sem ela.")
+
+        if os.path.exists(full_final_path) and txn.commit():
+            print(f"    \033[32mOK Tags, capa e letra gravadas de uma vez!\033[0m")
+
+    # Extract the real YouTube video ID from yt-dlp info (authoritative source)
+    real_video_id = info.get('id') or getattr(request, 'video_id', None)
+
+    # Arquivo pronto vira objeto do content store; a pasta de destino fica com um link para ele
+    try:
+        content_store.ingest(real_video_id, content_store.profile_for(request), full_final_path, info)
+    except Exception as e:
+        print(f"  \033[33mWARN Falha ao registrar no store: {e}\033[0m")
+
+    st.status = "done"
+    st.progress = 100.0
+    st.filename = final_filename_relative
+
+    real_playlist_id = getattr(request, 'playlist_id', None) or info.get('playlist_id')
+
+    mark_downloaded_db(real_playlist_id, real_video_id, info.get('title', 'Unknown'), final_filename_relative, request.url)
+    print(f"  \033[32mOK SUCESSO! Download concluído usando o método: {strat_name}\033[0m\n")
+
+def download_with_retries(job_id: str, request):
+    print(f"\n\033[1;35m[+] INICIANDO SMART DOWNLOAD:\033[0m \033[36m{request.url}\033[0m")
+    st = jobs.get(job_id)
+    if not st or st.status == "cancelled": return
+
+    # Vídeo que já falhou de forma permanente (removido, privado, bloqueado...) não gasta nenhuma estratégia
+    video_id = video_id_for(request)
+    failure = video_memo.cached_failure(video_id)
+    if failure:
+        st.status = "error"
+        st.error = f"{failure['message']} (em cache, nova tentativa a partir de {time.strftime('%d/%m %H:%M', time.localtime(failure['expires_at']))})"
+        mark_error_db(getattr(request, 'playlist_id', None), getattr(request, 'video_id', None), "Cached failure", st.error)
+        print(f"  \033[1;31mERR {video_id}: falha permanente em cache ({failure['failure_class']}), pulando as estratégias.\033[0m\n")
+        return
+
+    # Ordem adaptativa: o cliente que está funcionando agora vai primeiro (ver strategy_scoreboard.py),
+    # exceto pela estratégia que já funcionou para este vídeo (video_memo.py)
+    strategies = video_memo.apply_memo(strategy_scoreboard.order_strategies(build_strategies(request)), video_id)
+    resume = PartialResume(st)
+    permanent_hits = {}
 
     for idx, strat in enumerate(strategies, start=1):
         if st.status == "cancelled": return
         strat_name = strat['name'].upper()
+        attempt_started = time.time()
+        stall_watchdog.arm(job_id)
         print(f"  \033[33m-> [{idx}/{len(strategies)}] Testando método: \033[1;33m{strat_name}\033[0m")
         st.error = None
         if idx > 1:
@@ -340,6 +960,12 @@ def download_with_retries(job_id: str, request):
         
         try:
             ydl_opts = build_ydl_opts_for_strategy(job_id, request, strat)
+            ydl_opts['progress_hooks'] = ydl_opts['progress_hooks'] + [resume.progress_hook]
+            if 'format' not in strat:
+                ydl_opts['format'] = resume.preferred_format(ydl_opts.get('format'))
+            # Conversão, capa e tags ficam para o postprocess_pool: o slot é liberado assim que os bytes estão no disco
+            deferred_postprocessors = ydl_opts['postprocessors']
+            ydl_opts['postprocessors'] = []
             
             def execute_ydl(opts):
                 target_url = request.url
@@ -357,100 +983,28 @@ def download_with_retries(job_id: str, request):
                     target_url = f"ytmsearch1:{clean_title}"
                     print(f"      \033[94m-> Buscando áudio puro no YT Music: {target_url}\033[0m")
 
-                with yt_dlp.YoutubeDL(opts) as ydl:
-                    info = ydl.extract_info(target_url, download=True)
+                probe = SectionProbe(opts['progress_hooks']) if section_range(request) else None
+                with ydl_pool.lease(probe.apply(opts) if probe else opts) as ydl:
+                    resume.attach(ydl)
+                    if probe: probe.attach(ydl)
+                    try:
+                        info = ydl.extract_info(target_url, download=True)
+                    finally:
+                        if probe: probe.stop()
                     if 'entries' in info:
                         entries = list(info['entries'])
                         if not entries:
                             raise Exception(f"Nenhum resultado encontrado na busca do YouTube para: {target_url}")
                         
-                        # --- Lumina M3U Generator ---
-                        if len(entries) > 1 and getattr(request, 'organize_by_playlist', False):
-                            playlist_title = info.get('title', 'Playlist').replace('/', '_').replace('\\', '_')
-                            first_file = ydl.prepare_filename(entries[0])
-                            playlist_dir = os.path.dirname(first_file)
-                            m3u_path = os.path.join(playlist_dir, f"{playlist_title}.m3u")
-                            
-                            try:
-                                with open(m3u_path, "w", encoding="utf-8") as f:
-                                    f.write("#EXTM3U\n")
-                                    for entry in entries:
-                                        if entry is None: continue
-                                        entry_file = ydl.prepare_filename(entry)
-                                        base_p, _ = os.path.splitext(entry_file)
-                                        if request.mode == 'video': final_p = base_p + '.mp4'
-                                        elif request.quality == 'flac': final_p = base_p + '.flac'
-                                        elif request.quality == 'best': final_p = base_p + '.m4a'
-                                        else: final_p = base_p + '.mp3'
-                                        rel_path = os.path.basename(final_p)
-                                        f.write(f"#EXTINF:-1,{entry.get('title', 'Unknown')}\n")
-                                        f.write(f"{rel_path}\n")
-                            except Exception as e:
-                                print(f"  \033[33mWARN Erro ao gerar playlist M3U: {e}\033[0m")
-                        
                         info = entries[0]
                         if info is None:
                             raise Exception(f"Resultado vazio retornado pelo YouTube para: {target_url}")
-                    filename = ydl.prepare_filename(info)
-                    
-                    base_path, _ = os.path.splitext(filename)
-                    
-                    if request.mode == 'video': full_final_path = base_path + '.mp4'
-                    elif request.quality == 'flac': full_final_path = base_path + '.flac'
-                    elif request.quality == 'best': full_final_path = base_path + '.m4a'
-                    else: full_final_path = base_path + '.mp3'
-                    
-                    final_filename_relative = os.path.relpath(full_final_path, get_downloads_dir())
-
-                    # Clean filename by removing YouTube tags
-                    if request.mode != 'video':
-                        from metadata_fetcher import clean_title
-                        original_name = os.path.basename(base_path)
-                        cleaned_name = clean_title(original_name)
-                        
-                        if cleaned_name != original_name and cleaned_name.strip():
-                            new_base_path = os.path.join(os.path.dirname(base_path), cleaned_name)
-                            if request.quality == 'flac': new_full_final_path = new_base_path + '.flac'
-                            elif request.quality == 'best': new_full_final_path = new_base_path + '.m4a'
-                            else: new_full_final_path = new_base_path + '.mp3'
-                            
-                            try:
-                                if os.path.exists(full_final_path) and not os.path.exists(new_full_final_path):
-                                    os.rename(full_final_path, new_full_final_path)
-                                    full_final_path = new_full_final_path
-                                    final_filename_relative = os.path.relpath(full_final_path, get_downloads_dir())
-                            except Exception as e:
-                                print(f"  \033[33mWARN Erro ao renomear arquivo limpo: {e}\033[0m")
-
-                    # Apply Premium Metadata
-                    if request.mode != 'video':
-                        st.status = "processing"
-                        print(f"  \033[94m-> Buscando metadados premium no iTunes...\033[0m")
-                        success = apply_metadata(full_final_path, info.get('title', ''))
-                        if success:
-                            print(f"    \033[32mOK Capa High-Res e Tags injetadas com sucesso!\033[0m")
-                        
-                        # Inject Lyrics
-                        title = info.get('title', '') or getattr(request, 'title', '') or ''
-                        artist = info.get('uploader', '') or info.get('artist', '') or getattr(request, 'artist', '') or ''
-                        if title:
-                            print(f"  \033[94m-> Buscando letra da musica...\033[0m")
-                            lyrics_ok = fetch_and_embed_lyrics(full_final_path, title, artist)
-                            if lyrics_ok:
-                                print(f"    \033[32mOK Letra injetada com sucesso!\033[0m")
-                            else:
-                                print(f"    Letra nao encontrada, continuando sem ela.")
-                    
-                    st.status = "done"
-                    st.progress = 100.0
-                    st.filename = final_filename_relative
-                    
-                    # Extract the real YouTube video ID from yt-dlp info (authoritative source)
-                    real_video_id = info.get('id') or getattr(request, 'video_id', None)
-                    real_playlist_id = getattr(request, 'playlist_id', None) or info.get('playlist_id')
-                    
-                    mark_downloaded_db(real_playlist_id, real_video_id, info.get('title', 'Unknown'), final_filename_relative, request.url)
-                    print(f"  \033[32mOK SUCESSO! Download concluído usando o método: {strat_name}\033[0m\n")
+                    if stall_watchdog.abandoned():
+                        raise stall_watchdog.StallError("abandoned", "Tentativa abandonada pelo vigia de travamentos")
+                    print(f"  \033[32mOK Bytes no disco ({strat_name}), liberando o slot de download\033[0m")
+                    pp_opts = dict(opts, postprocessors=deferred_postprocessors)
+                    pp_opts.pop('proxy', None)
+                    return functools.partial(finalize_download, job_id, request, info, pp_opts, strat_name)
 
             
             if strat.get("use_proxy"):
@@ -461,11 +1015,16 @@ def download_with_retries(job_id: str, request):
                     proxy = get_random_proxy()
                     if not proxy: break
                     ydl_opts['proxy'] = proxy
+                    if proxy_attempt > 1: stall_watchdog.arm(job_id)
                     print(f"      \033[94m[proxy] Tentativa de sobrevivência {proxy_attempt}/5 com proxy: {proxy}\033[0m")
                     try:
-                        execute_ydl(ydl_opts)
-                        return # SUCESSO!
+                        finalize = execute_ydl(ydl_opts)
+                        strategy_scoreboard.record(strat['name'], True, time.time() - attempt_started)
+                        video_memo.remember_success(video_id, strat['name'])
+                        download_sem.on_success()
+                        return finalize # SUCESSO!
                     except Exception as proxy_err:
+                        if stall_watchdog.abandoned(): raise
                         last_proxy_err = proxy_err
                         print(f"      \033[31m[proxy:err] Proxy falhou: {str(proxy_err).splitlines()[0][:80]}...\033[0m")
                         time.sleep(1)
@@ -474,18 +1033,30 @@ def download_with_retries(job_id: str, request):
                     if last_proxy_err: raise last_proxy_err
                     else: raise Exception("Todos os proxies disponíveis falharam na conexão.")
             else:
-                execute_ydl(ydl_opts)
-                return 
+                finalize = execute_ydl(ydl_opts)
+                strategy_scoreboard.record(strat['name'], True, time.time() - attempt_started)
+                video_memo.remember_success(video_id, strat['name'])
+                download_sem.on_success()
+                return finalize
 
         except Exception as e:
             msg = str(e)
+            # O worker_loop já desistiu desta thread e o job pode estar rodando de novo: não mexe no JobState
+            if stall_watchdog.abandoned(): return
+            stall = stall_watchdog.is_stall(e)
+            if st.status != "cancelled":
+                strategy_scoreboard.record(strat['name'], False, time.time() - attempt_started, "stall" if stall else classify_error(msg))
             
             # Formatar erro resumido para o log
             short_msg = msg.split('\n')[0]
             if len(short_msg) > 100: short_msg = short_msg[:97] + "..."
             print(f"  \033[31mERR Falha no método {strat_name}: {short_msg}\033[0m")
 
+            permanent = video_memo.classify_permanent(msg)
+            if permanent: permanent_hits[permanent] = permanent_hits.get(permanent, 0) + 1
+
             if is_match(msg, TRANSIENT_ERRORS):
+                download_sem.on_rate_limited()
                 st.status = "rate_limited" 
                 time.sleep(2) 
                 continue
@@ -493,52 +1064,257 @@ def download_with_retries(job_id: str, request):
                 st.status = "error"
                 st.error = "Login necessário (YouTube bloqueou o vídeo). Atualize o cookies.txt."
                 mark_error_db(getattr(request, 'playlist_id', None), getattr(request, 'video_id', None), "Login Required", st.error)
+                video_memo.remember_failure(video_id, permanent or "login", st.error)
                 print(f"  \033[1;31mERR Download abortado: Proteção de Login ativada.\033[0m\n")
                 return 
-            if is_match(msg, FORMAT_ERRORS):
+            if permanent and video_memo.should_stop(permanent, permanent_hits[permanent]):
+                resume.discard_all()
+                st.status = "error"
+                st.error = f"Vídeo indisponível ({permanent}): {short_msg}"
+                mark_error_db(getattr(request, 'playlist_id', None), getattr(request, 'video_id', None), "Permanent failure", st.error)
+                video_memo.remember_failure(video_id, permanent, st.error)
+                video_memo.record_early_stop()
+                print(f"  \033[1;31mERR Download abortado: falha permanente ({permanent}) confirmada por {permanent_hits[permanent]} métodos.\033[0m\n")
+                return
+            if is_match(msg, FORMAT_ERRORS) or stall:
                  continue
             time.sleep(1)
             continue
+        finally:
+            stall_watchdog.disarm(job_id)
             
+    resume.discard_all()
     st.status = "error"
     st.error = "Falha em todos os métodos de download (possível link inválido ou bloqueio de IP)."
     mark_error_db(getattr(request, 'playlist_id', None), getattr(request, 'video_id', None), "All strategies failed", st.error)
+    permanent = video_memo.final_class(permanent_hits)
+    if permanent:
+        video_memo.remember_failure(video_id, permanent, f"Vídeo indisponível ({permanent}) em todos os métodos de download.")
     print(f"  \033[1;31mERR Download permanentemente falhou para: {request.url}\033[0m\n")
 
+# Pedidos iguais (mesmo vídeo e mesmo perfil de saída) em andamento: chave -> job_id
+_inflight: Dict[tuple, str] = {}
+FINAL_STATUSES = ("done", "completed", "error", "timeout", "cancelled", "already_downloaded")
+
+def video_id_for(request) -> Optional[str]:
+    video_id = getattr(request, 'video_id', None)
+    if video_id: return video_id
+    import re
+    match = re.search(r'(?:v=|youtu\.be/|shorts/|embed/)([0-9A-Za-z_-]{11})', getattr(request, 'url', '') or '')
+    return match.group(1) if match else None
+
+def dedup_key(request) -> Optional[tuple]:
+    """(video_id, modo, qualidade, filtros): dois pedidos com a mesma chave geram o mesmo arquivo."""
+    if getattr(request, 'playlist', False): return None
+    video_id = video_id_for(request)
+    if not video_id: return None
+    is_video = request.mode == 'video'
+    return (
+        video_id, request.mode, request.quality,
+        request.pitch, request.speed, request.eq_preset or None, section_range(request),
+        getattr(request, 'video_codec', None) if is_video else None,
+        bool(getattr(request, 'compress_video', False)) if is_video else False,
+        getattr(request, 'subtitle', None) if is_video else None,
+        bool(getattr(request, 'sponsorblock_enabled', False)),
+    )
+
+def find_existing_output(request) -> Optional[str]:
+    """
+    Arquivo já baixado com o mesmo perfil, pelo banco + checagem no disco (sem rede).
+    Pitch/velocidade/EQ e recortes não ficam registrados no banco, então esses pedidos sempre baixam.
+    """
+    if getattr(request, 'playlist', False) or has_audio_filters(request) or section_range(request): return None
+    video_id = video_id_for(request)
+    if not video_id: return None
+    downloads_dir = get_downloads_dir()
+    ext = audio_extension(request)
+    for file_path in find_downloaded_file(video_id):
+        abs_path = file_path if os.path.isabs(file_path) else os.path.join(downloads_dir, file_path)
+        if abs_path.lower().endswith(ext) and os.path.exists(abs_path):
+            return file_path
+    return None
+
+def _attach_inflight(request, priority: str) -> Optional[JobState]:
+    key = dedup_key(request)
+    existing_id = _inflight.get(key) if key else None
+    if not existing_id: return None
+    st = jobs.get(existing_id)
+    if not st or st.status in FINAL_STATUSES:
+        _inflight.pop(key, None)
+        return None
+    st.coalesced += 1
+    # Mesmo arquivo, outra pasta (ex.: a mesma faixa em duas playlists): link quando o job terminar
+    content_store.link_when_done(existing_id, request)
+    # Um clique manual sobre um job de assinatura ainda na fila promove a prioridade dele
+    if st.status == "queued" and PRIORITIES.index(priority) < PRIORITIES.index(st.priority or PRIORITY_INTERACTIVE):
+        reprioritize_job(existing_id, priority)
+    print(f"[Fila] Pedido repetido de {key[0]} anexado ao job {existing_id[:8]}")
+    return st
+
+def _existing_file(request) -> Optional[str]:
+    """Link do content store ou arquivo já no disco. Bloqueante (stat, hardlink/cópia): roda numa thread."""
+    return content_store.materialize(request) or find_existing_output(request)
+
+async def enqueue_job(job_id: str, request, priority: str = PRIORITY_INTERACTIVE, created_at: float = None):
+    """
+    Registra o JobState, coloca o pedido na fila com a prioridade dada e o inclui na fila persistente.
+    Um pedido igual a um job em andamento é anexado a ele, e um pedido cujo arquivo já existe termina
+    na hora como "already_downloaded". Em ambos os casos o JobState retornado pode ter outro id.
+    """
+    if priority not in PRIORITIES: priority = PRIORITY_INTERACTIVE
+    group_id = getattr(request, 'group_id', None)
+
+    attached = _attach_inflight(request, priority)
+    if attached:
+        if group_id: playlist_groups.register_child(group_id, attached.id, request)
+        return attached
+
+    st = jobs[job_id] = JobState(id=job_id, status="queued", progress=0.0, created_at=created_at or time.time(), title=getattr(request, 'title', None),
+                                 priority=priority, playlist_id=getattr(request, 'playlist_id', None), group_id=group_id)
+    if group_id:
+        playlist_groups.register_child(group_id, job_id, request)
+    # Registrado antes da busca no disco: pedidos iguais que chegarem enquanto ela roda se anexam a este job
+    key = dedup_key(request)
+    if key: _inflight[key] = job_id
+
+    existing_file = await asyncio.to_thread(_existing_file, request)
+    if existing_file:
+        st.status = "already_downloaded"
+        st.progress = 100.0
+        st.filename = existing_file
+        st.finished_at = time.time()
+        mark_downloaded_db(getattr(request, 'playlist_id', None), video_id_for(request), st.title or os.path.basename(existing_file), existing_file, request.url)
+    if st.status in FINAL_STATUSES:
+        # Já no disco ou cancelado durante a busca: links dos pedidos anexados nesse meio-tempo (ou descarte)
+        await asyncio.to_thread(content_store.job_finished, job_id, st.status)
+        return st
+
+    download_queue.put_nowait(job_id, request, priority)
+    job_store.track(job_id, request, priority)
+    return jobs[job_id]
+
+def reprioritize_job(job_id: str, priority: str) -> bool:
+    if not download_queue.reprioritize(job_id, priority):
+        return False
+    if job_id in jobs:
+        jobs[job_id].priority = priority
+    return True
+
+# "thread": asyncio.to_thread no mesmo processo (padrão, único modo nos builds congelados/Android)
+# "process": pool de processos separado do servidor (ver process_backend.py)
+DOWNLOAD_BACKEND = "thread"
+
+def set_download_backend(backend: str) -> str:
+    global DOWNLOAD_BACKEND
+    import process_backend
+    if backend == "process" and process_backend.is_supported():
+        DOWNLOAD_BACKEND = "process"
+    else:
+        if DOWNLOAD_BACKEND == "process":
+            process_backend.shutdown()
+        DOWNLOAD_BACKEND = "thread"
+    return DOWNLOAD_BACKEND
+
+async def expand_playlist_job(job_id: str, request):
+    """Transforma o job da playlist no pai de um grupo com um job por faixa."""
+    st = jobs.get(job_id)
+    title, playlist_id, entries = await asyncio.to_thread(playlist_groups.expand_playlist, request)
+    if st and st.status == "cancelled": return
+    children = playlist_groups.child_requests(job_id, request, title, playlist_id, entries)
+    if st:
+        st.title = title
+        st.playlist_id = getattr(request, 'playlist_id', None) or playlist_id
+        st.children_total = len(children)
+        st.status = "downloading"
+    # O pai não volta para a fila persistente: os filhos carregam o group_id e recriam o grupo
+    job_store.forget(job_id)
+    priority = (st.priority if st else None) or PRIORITY_INTERACTIVE
+    playlist_groups.open_group(job_id, children)
+    try:
+        for child in children:
+            await enqueue_job(str(uuid.uuid4()), child, priority)
+    finally:
+        playlist_groups.expansion_done(job_id)
+    print(f"[Playlist] '{title}' expandida em {len(children)} jobs")
+
 async def run_download(job_id: str, request):
-    is_twitch = "twitch.tv" in getattr(request, 'url', '')
-    if is_twitch:
-        async with twitch_sem:
-            await asyncio.to_thread(download_with_retries, job_id, request)
+    if getattr(request, 'playlist', False):
+        await expand_playlist_job(job_id, request)
+    elif DOWNLOAD_BACKEND == "process":
+        import process_backend
+        await process_backend.run_in_process(job_id, request, MAX_CONCURRENT_CEILING)
     else:
-        await asyncio.to_thread(download_with_retries, job_id, request)
+        return await asyncio.to_thread(download_with_retries, job_id, request)
+
+# Última barreira para um job no slot; downloads parados são resolvidos antes pelo stall_watchdog
+JOB_TIMEOUT_BACKSTOP = 14400
+
+async def wait_download(st, task) -> str:
+    """Espera o download: "done", "timeout" (barreira de 4 horas) ou "hung" (thread presa, ver stall_watchdog)."""
+    deadline = time.monotonic() + JOB_TIMEOUT_BACKSTOP
+    while True:
+        done, _ = await asyncio.wait([task], timeout=stall_watchdog.CHECK_INTERVAL)
+        if done: return "done"
+        if time.monotonic() > deadline: return "timeout"
+        # No backend de processos o filho não pode ser abandonado: lá vale o abort pelo hook + a barreira
+        if st and st.stalled == "hung" and DOWNLOAD_BACKEND == "thread": return "hung"
+
+def requeue_stalled(job_id: str, request, st: JobState):
+    """Job travado volta para a fila (até stall_watchdog.MAX_REQUEUES vezes) ou vira erro."""
+    if st.stall_requeues >= stall_watchdog.MAX_REQUEUES:
+        st.status = "error"
+        st.error = f"Download travado {st.stalls} vez(es) sem receber dados; desistindo."
+        st.finished_at = time.time()
+        st.progress = 100.0
+        mark_error_db(getattr(request, 'playlist_id', None), getattr(request, 'video_id', None), "Stalled", st.error)
+        return
+    st.stall_requeues += 1
+    st.status = "queued"
+    st.stalled = None
+    st.speed_str = None
+    download_queue.put_nowait(job_id, request, st.priority or PRIORITY_INTERACTIVE)
+    print(f"[Vigia] Job {job_id[:8]} travado voltou para a fila ({st.stall_requeues}/{stall_watchdog.MAX_REQUEUES})")
 
 async def worker_loop():
     while True:
-        job_id, request = await download_queue.get()
-        st = jobs.get(job_id)
-        if st and st.status == "cancelled":
-            download_queue.task_done()
-            continue
-        
+        # Worker ocioso não segura slot: espera haver job, pega o slot e só então escolhe o job,
+        # então a prioridade é decidida no momento em que há vaga (e "active" conta só downloads).
+        await download_queue.wait_ready()
         async with download_sem:
+            entry = download_queue.get_nowait()
+            if entry is None: continue  # outro worker levou o job enquanto este esperava o slot
+            job_id, request = entry.job_id, entry.request
+            st = jobs.get(job_id)
+            if st and st.status == "cancelled":
+                download_queue.task_done(entry)
+                continue
+
             if st:
                 st.status = "running"
                 st.started_at = time.time()
                 
             try:
                 task = asyncio.create_task(run_download(job_id, request))
-                done, pending = await asyncio.wait([task], timeout=14400) # 4 hours timeout for large 4K files
+                outcome = await wait_download(st, task)
 
-                if pending:
-                    for t in pending: t.cancel()
+                if outcome == "timeout":
+                    task.cancel()
                     if st:
                         st.status = "timeout"
                         st.error = "Download cancelado por tempo excedido (timeout 4 horas)"
+                elif outcome == "hung":
+                    # A thread presa no yt-dlp não pode ser interrompida: é abandonada e o slot liberado
+                    stall_watchdog.abandon(job_id)
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                    requeue_stalled(job_id, request, st)
                 else:
                     try:
-                        await task
-                        if st and st.status not in ["error", "timeout"]: 
+                        finalize = await task
+                        if finalize and st and st.status not in ["error", "timeout", "cancelled"]:
+                            # Bytes no disco: o pós-processamento segue no postprocess_pool e o slot é liberado
+                            postprocess_pool.submit(job_id, request, finalize)
+                        # Pais de playlist terminam quando o último filho termina (playlist_groups)
+                        elif st and st.status not in ["error", "timeout"] and not st.children_total:
                              st.status = "done"
                              st.finished_at = time.time()
                     except Exception as task_error:
@@ -553,4 +1329,6 @@ async def worker_loop():
                     st.finished_at = time.time()
                     st.progress = 100.0
             finally:
-                download_queue.task_done()
+                download_queue.task_done(entry)
+                if st and st.status in FINAL_STATUSES:
+                    await asyncio.to_thread(content_store.job_finished, job_id, st.status)
@@ -0,0 +1,104 @@
+"""
+hedged_extractor.py
+Extração de metadados "hedged" (em corrida) entre vários player clients do YouTube.
+Em vez de testar um cliente por vez, dispara o primeiro, espera HEDGE_DELAY segundos e,
+se ainda não houver resposta, dispara o próximo (até HEDGE_WIDTH ao mesmo tempo).
+A primeira resposta válida vence e o restante é descartado.
+Todas as extrações passam pelo mesmo pool limitado, então o total de chamadas
+simultâneas ao YouTube nunca passa de MAX_CONCURRENT_EXTRACTIONS.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import ydl_pool
+
+# Quantos clientes podem correr ao mesmo tempo para UMA requisição (1 = modo sequencial antigo)
+HEDGE_WIDTH = 3
+# Tempo (s) esperando o cliente atual antes de disparar o próximo em paralelo
+HEDGE_DELAY = 0.75
+# Teto global de extrações simultâneas, somando todas as requisições
+MAX_CONCURRENT_EXTRACTIONS = 4
+
+_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_EXTRACTIONS, thread_name_prefix="hedge")
+_pool_lock = threading.Lock()
+
+
+def configure(width: int = None, delay: float = None, max_concurrent: int = None):
+    """Atualiza os parâmetros em tempo de execução (chamado pela API de settings e no startup)."""
+    global HEDGE_WIDTH, HEDGE_DELAY, MAX_CONCURRENT_EXTRACTIONS, _pool
+    if width is not None:
+        HEDGE_WIDTH = max(1, min(8, int(width)))
+    if delay is not None:
+        HEDGE_DELAY = max(0.0, min(30.0, float(delay)))
+    if max_concurrent is not None:
+        value = max(1, min(16, int(max_concurrent)))
+        if value != MAX_CONCURRENT_EXTRACTIONS:
+            with _pool_lock:
+                old_pool = _pool
+                _pool = ThreadPoolExecutor(max_workers=value, thread_name_prefix="hedge")
+                MAX_CONCURRENT_EXTRACTIONS = value
+            old_pool.shutdown(wait=False)
+    return get_config()
+
+
+def get_config() -> dict:
+    return {"width": HEDGE_WIDTH, "delay": HEDGE_DELAY, "max_concurrent": MAX_CONCURRENT_EXTRACTIONS}
+
+
+def _is_cookie_error(err_msg: str) -> bool:
+    return "does not look like a Netscape format cookies file" in err_msg or "cookie" in err_msg.lower()
+
+
+def _extract_with_client(url: str, base_opts: dict, client: str):
+    opts = dict(base_opts)
+    if client != 'web':
+        opts['extractor_args'] = {'youtube': {'player_client': [client]}}
+    else:
+        opts.pop('extractor_args', None)
+    try:
+        with ydl_pool.lease(opts) as ydl:
+            return ydl.extract_info(url, download=False)
+    except Exception as e:
+        if not _is_cookie_error(str(e)) or 'cookiefile' not in opts:
+            raise
+        print(f"Cookie error in hedged extract ({client}), retrying without cookies: {e}")
+        opts.pop('cookiefile', None)
+        with ydl_pool.lease(opts) as ydl:
+            return ydl.extract_info(url, download=False)
+
+
+def extract_hedged(url: str, base_opts: dict, clients: list, delay: float = None, width: int = None):
+    """
+    Bloqueante. Retorna (info, client) do primeiro cliente que responder com sucesso.
+    Levanta Exception com o último erro se todos falharem.
+    Extrações já em andamento não podem ser interrompidas no meio pelo yt-dlp:
+    as que perderem a corrida são apenas descartadas; as que ainda estão na fila são canceladas.
+    """
+    delay = HEDGE_DELAY if delay is None else delay
+    width = max(1, HEDGE_WIDTH if width is None else width)
+    pending = list(clients)
+    running = {}
+    last_err = None
+    try:
+        while pending or running:
+            timeout = None
+            if pending and len(running) < width:
+                client = pending.pop(0)
+                with _pool_lock:
+                    future = _pool.submit(_extract_with_client, url, base_opts, client)
+                running[future] = client
+                if pending and len(running) < width:
+                    timeout = delay
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                client = running.pop(future)
+                try:
+                    info = future.result()
+                except Exception as e:
+                    last_err = str(e)
+                    continue
+                if info:
+                    return info, client
+        raise Exception(last_err or "Nenhum cliente retornou informações.")
+    finally:
+        for future in running:
+            future.cancel()
@@ -0,0 +1,121 @@
+"""
+itunes_cache.py
+Cache persistente das buscas no iTunes feitas pelo metadata_fetcher.
+A chave é a consulta do clean_title normalizada (caixa, acentos compostos, espaços); a resposta
+fica na tabela itunes_cache do downloads.db com TTL, inclusive os "não encontrado" (TTL menor).
+Jobs simultâneos com a mesma consulta (álbum, playlist) compartilham uma única requisição
+(single-flight): o primeiro busca, os outros esperam o resultado dele.
+Erros de rede e throttling (403/429) não entram no cache.
+"""
+import json
+import threading
+import unicodedata
+from database import get_itunes_cache, save_itunes_cache, prune_itunes_cache, get_itunes_cache_summary
+
+SEARCH_URL = "https://itunes.apple.com/search"
+FOUND_TTL = 30 * 24 * 3600
+NOT_FOUND_TTL = 24 * 3600
+# Quanto um job espera pela requisição de outro antes de desistir (sem metadados)
+FLIGHT_TIMEOUT = 30
+
+_flights = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "coalesced": 0, "requests": 0, "errors": 0}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+def normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKC", query or "").casefold()
+    return " ".join(query.split())
+
+
+def _cached(key: str):
+    """(True, resultado) se há entrada válida, (False, None) se não."""
+    row = get_itunes_cache(key)
+    if row is None: return False, None
+    if row["result"] is None:
+        _count("negative_hits")
+        return True, None
+    _count("hits")
+    return True, json.loads(row["result"])
+
+
+def _fetch(query: str):
+    """Consulta o iTunes. Retorna o primeiro resultado ou None; levanta em erro de rede/throttling."""
+    import urllib.parse
+    from curl_cffi import requests
+    from config import CHROME_IMPERSONATE
+    _count("requests")
+    url = f"{SEARCH_URL}?term={urllib.parse.quote(query)}&entity=song&limit=1"
+    res = requests.get(url, timeout=15, impersonate=CHROME_IMPERSONATE)
+    if res.status_code != 200:
+        raise Exception(f"iTunes respondeu HTTP {res.status_code}")
+    results = res.json().get('results') or []
+    return results[0] if results else None
+
+
+def lookup(query: str):
+    """Primeiro resultado do iTunes para a consulta (dict da API) ou None."""
+    key = normalize_query(query)
+    if not key: return None
+    hit, result = _cached(key)
+    if hit: return result
+
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            _stats["misses"] += 1
+        else:
+            _stats["coalesced"] += 1
+    if not leader:
+        flight.done.wait(FLIGHT_TIMEOUT)
+        return flight.result
+
+    try:
+        # Outro líder pode ter acabado de gravar entre a leitura do cache e o registro do voo
+        hit, result = _cached(key)
+        if not hit:
+            result = _fetch(query)
+            save_itunes_cache(key, json.dumps(result) if result else None, FOUND_TTL if result else NOT_FOUND_TTL)
+        flight.result = result
+        return result
+    except Exception as e:
+        _count("errors")
+        print(f"      \033[90m[metadata:warn] Busca no iTunes falhou (fora do cache): {e}\033[0m")
+        return None
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def clear(expired_only: bool = True) -> int:
+    return prune_itunes_cache(clear_all=not expired_only)
+
+
+def snapshot() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        in_flight = len(_flights)
+    lookups = stats["hits"] + stats["negative_hits"] + stats["misses"] + stats["coalesced"]
+    served = stats["hits"] + stats["negative_hits"] + stats["coalesced"]
+    return {
+        **stats,
+        **get_itunes_cache_summary(),
+        "in_flight": in_flight,
+        "hit_ratio": round(served / lookups, 3) if lookups else 0.0,
+        "found_ttl_seconds": FOUND_TTL,
+        "not_found_ttl_seconds": NOT_FOUND_TTL,
+    }
@@ -0,0 +1,97 @@
+"""
+job_store.py
+Fila de downloads persistente (tabela job_queue do downloads.db).
+Jobs na fila, rodando e com falha sobrevivem a reinícios do sidecar (update, crash, Tauri relaunch)
+com o DownloadRequest completo, e são restaurados no startup_event na ordem em que entraram.
+As gravações são em lote: o enqueue só registra o job em memória e o flush_loop grava
+a cada FLUSH_INTERVAL segundos apenas o que mudou, numa única transação.
+"""
+import json
+import time
+import asyncio
+import threading
+from database import save_job_rows, load_job_rows
+
+FLUSH_INTERVAL = 1.0
+
+# Status que tiram o job da fila persistente
+FINISHED_STATUSES = ("done", "completed", "cancelled", "already_downloaded")
+FAILED_STATUSES = ("error", "timeout")
+
+# job_id -> {"request": json, "priority": str, "written": (status, priority) ou None}
+_tracked = {}
+_lock = threading.Lock()
+
+
+def _request_json(request) -> str:
+    data = request.dict() if hasattr(request, 'dict') else dict(vars(request))
+    return json.dumps(data)
+
+
+def track(job_id: str, request, priority: str):
+    with _lock:
+        _tracked[job_id] = {"request": _request_json(request), "priority": priority, "written": None}
+
+
+def forget(job_id: str):
+    """Tira um job da fila persistente mesmo que ainda esteja rodando (apaga a linha no próximo flush)."""
+    with _lock:
+        entry = _tracked.get(job_id)
+        if entry: entry["forget"] = True
+
+
+def _stored_status(status: str) -> str:
+    if status == "queued": return "queued"
+    if status in FAILED_STATUSES: return "failed"
+    return "running"
+
+
+def _collect():
+    from downloader import jobs
+    upserts, deletes = [], []
+    with _lock:
+        for job_id, entry in list(_tracked.items()):
+            st = jobs.get(job_id)
+            if st is None or st.status in FINISHED_STATUSES or entry.get("forget"):
+                if entry["written"] is not None: deletes.append(job_id)
+                del _tracked[job_id]
+                continue
+            state = (_stored_status(st.status), st.priority or entry["priority"])
+            if state == entry["written"]: continue
+            entry["written"] = state
+            upserts.append((job_id, entry["request"], state[1], state[0], st.title, st.error, st.created_at))
+    return upserts, deletes
+
+
+def flush():
+    upserts, deletes = _collect()
+    save_job_rows(upserts, deletes)
+    return len(upserts) + len(deletes)
+
+
+async def flush_loop():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(flush)
+        except Exception as e:
+            print(f"[JobStore] Erro no flush: {e}")
+
+
+def load() -> list:
+    """Linhas salvas, mais antigas primeiro, com o request já decodificado."""
+    rows = []
+    for row in load_job_rows():
+        try:
+            row["request"] = json.loads(row["request"])
+        except Exception:
+            continue
+        rows.append(row)
+    return rows
+
+
+def mark_written(job_id: str, status: str, priority: str):
+    """Marca um job restaurado como já gravado, para não reescrever a mesma linha no próximo flush."""
+    with _lock:
+        if job_id in _tracked:
+            _tracked[job_id]["written"] = (status, priority)
@@ -0,0 +1,341 @@
+"""
+loudness.py
+Motor de análise de loudness EBU R128 / ITU-R BS.1770 em NumPy.
+O áudio é decodificado uma única vez pelo ffmpeg (f32le, 48 kHz, nos canais originais) e processado em
+blocos vetorizados: ponderação K (os dois biquads da norma convertidos em FIR e aplicados por
+FFT com overlap-add), potência por janelas de 100 ms, gating absoluto/relativo em blocos de
+400 ms e true peak com sobreamostragem 4x polifásica.
+Os canais entram na soma com os pesos da norma (surround +1,5 dB, LFE fora). Uma faixa mono
+é medida como mono: convertida para estéreo ela soaria 3 LU mais alta e levaria 3 dB a menos de ganho.
+Substitui o loudnorm por arquivo: o resultado vira tag ReplayGain/R128 (replaygain.py).
+
+Uso em lote numa biblioteca existente (pool de processos, ganho de álbum por pasta):
+    python loudness.py scan <pasta> [--workers N] [--no-album] [--dry-run]
+"""
+import os
+import sys
+import time
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+SAMPLE_RATE = 48000
+# Quando o mutagen não informa os canais do arquivo
+CHANNELS = 2
+MAX_CHANNELS = 8
+SURROUND_WEIGHT = 1.41
+HOP_FRAMES = SAMPLE_RATE // 10          # 100 ms
+BLOCK_HOPS = 4                          # blocos de 400 ms com 75% de sobreposição
+CHUNK_FRAMES = 1 << 18                  # ~5.5 s por leitura do ffmpeg
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+SILENCE_LUFS = -70.0
+
+# BS.1770 a 48 kHz: shelf de pré-filtro + passa-altas RLB
+K_SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285], [1.0, -1.69065929318241, 0.73248077421585])
+K_HIGHPASS = ([1.0, -2.0, 1.0], [1.0, -1.99004745483398, 0.99007225036621])
+# A resposta ao impulso do K decai abaixo de 1e-9 bem antes disso
+K_FIR_TAPS = 4096
+
+TRUE_PEAK_OVERSAMPLE = 4
+TRUE_PEAK_TAPS = 48
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.flac', '.opus', '.ogg', '.aac')
+
+# Blocos gated das últimas análises, para o ganho de álbum não decodificar tudo de novo
+BLOCK_CACHE_SIZE = 512
+_block_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _biquad_impulse(b, a, x: np.ndarray) -> np.ndarray:
+    y = np.zeros_like(x)
+    x1 = x2 = y1 = y2 = 0.0
+    for i, xi in enumerate(x):
+        yi = b[0] * xi + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        x2, x1, y2, y1 = x1, xi, y1, yi
+        y[i] = yi
+    return y
+
+
+def _k_weighting_fir() -> np.ndarray:
+    impulse = np.zeros(K_FIR_TAPS)
+    impulse[0] = 1.0
+    return _biquad_impulse(*K_HIGHPASS, _biquad_impulse(*K_SHELF, impulse))
+
+
+def _true_peak_phases() -> np.ndarray:
+    n = np.arange(TRUE_PEAK_TAPS) - (TRUE_PEAK_TAPS - 1) / 2.0
+    h = np.sinc(n / TRUE_PEAK_OVERSAMPLE) * np.hanning(TRUE_PEAK_TAPS)
+    phases = h.reshape(-1, TRUE_PEAK_OVERSAMPLE).T
+    # Cada fase com ganho DC unitário
+    return phases / phases.sum(axis=1, keepdims=True)
+
+
+K_FIR = _k_weighting_fir()
+TP_PHASES = _true_peak_phases()
+_fft_cache = {}
+
+
+def _k_fir_fft(size: int) -> np.ndarray:
+    if size not in _fft_cache:
+        _fft_cache[size] = np.fft.rfft(K_FIR, size)
+    return _fft_cache[size]
+
+
+def channel_weights(channels: int) -> np.ndarray:
+    """
+    Pesos G da BS.1770 na ordem de canais do ffmpeg para cada contagem (layout padrão):
+    L, R, C = 1,0; surround = 1,41; LFE (4º canal a partir do 5.1) fica fora da soma.
+    """
+    if channels <= 3: return np.ones(channels)
+    lfe = [0.0] if channels >= 6 else []
+    return np.array([1.0, 1.0, 1.0] + lfe + [SURROUND_WEIGHT] * (channels - 3 - len(lfe)))
+
+
+class R128Meter:
+    """Medidor incremental: feed() com blocos (frames, canais) em float, result() no fim."""
+
+    def __init__(self, channels: int = CHANNELS):
+        self.channels = channels
+        self.weights = channel_weights(channels)
+        self.tail = np.zeros((K_FIR_TAPS - 1, channels))
+        self.pending = np.zeros(0)
+        self.hops = []
+        self.tp_history = np.zeros((TRUE_PEAK_TAPS // TRUE_PEAK_OVERSAMPLE - 1, channels))
+        self.peak = 0.0
+        self.frames = 0
+
+    def _k_filter(self, x: np.ndarray) -> np.ndarray:
+        n = len(x)
+        size = 1 << int(np.ceil(np.log2(n + K_FIR_TAPS - 1)))
+        y = np.fft.irfft(np.fft.rfft(x, size, axis=0) * _k_fir_fft(size)[:, None], size, axis=0)[:n + K_FIR_TAPS - 1]
+        y[:K_FIR_TAPS - 1] += self.tail
+        self.tail = y[n:].copy()
+        return y[:n]
+
+    def _accumulate(self, y: np.ndarray):
+        energy = np.concatenate([self.pending, (np.square(y) * self.weights).sum(axis=1)])
+        full = len(energy) // HOP_FRAMES * HOP_FRAMES
+        if full:
+            self.hops.append(energy[:full].reshape(-1, HOP_FRAMES).mean(axis=1))
+        self.pending = energy[full:]
+
+    def _true_peak(self, x: np.ndarray):
+        padded = np.concatenate([self.tp_history, x])
+        self.tp_history = padded[-len(self.tp_history):]
+        peak = float(np.abs(x).max())
+        for ch in range(self.channels):
+            for phase in TP_PHASES:
+                peak = max(peak, float(np.abs(np.convolve(padded[:, ch], phase, mode='valid')).max()))
+        self.peak = max(self.peak, peak)
+
+    def feed(self, x: np.ndarray):
+        if not len(x): return
+        x = x.astype(np.float64, copy=False)
+        self.frames += len(x)
+        self._accumulate(self._k_filter(x))
+        self._true_peak(x)
+
+    def blocks(self) -> np.ndarray:
+        """Potência média (soma ponderada dos canais) de cada bloco de 400 ms."""
+        hops = np.concatenate(self.hops) if self.hops else np.zeros(0)
+        if len(hops) < BLOCK_HOPS:
+            # Trecho mais curto que um bloco: mede o que existe como um bloco só
+            frames = len(hops) * HOP_FRAMES + len(self.pending)
+            return np.array([(hops.sum() * HOP_FRAMES + self.pending.sum()) / frames]) if frames else np.zeros(0)
+        return np.convolve(hops, np.ones(BLOCK_HOPS) / BLOCK_HOPS, mode='valid')
+
+    def result(self) -> dict:
+        blocks = self.blocks()
+        return {
+            "integrated_lufs": gated_loudness(blocks),
+            "true_peak_dbtp": _to_db(self.peak),
+            "duration": self.frames / SAMPLE_RATE,
+            "blocks": blocks,
+        }
+
+
+def _to_db(linear: float) -> float:
+    return round(20.0 * np.log10(linear), 2) if linear > 0 else SILENCE_LUFS
+
+
+def _block_loudness(power: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10.0 * np.log10(power)
+
+
+def gated_loudness(blocks: np.ndarray) -> float:
+    """Loudness integrada com gating absoluto (-70 LUFS) e relativo (-10 LU)."""
+    if not len(blocks): return SILENCE_LUFS
+    gated = blocks[_block_loudness(blocks) > ABSOLUTE_GATE_LUFS]
+    if not len(gated): return SILENCE_LUFS
+    relative_gate = _block_loudness(np.array([gated.mean()]))[0] + RELATIVE_GATE_LU
+    gated = gated[_block_loudness(gated) > relative_gate]
+    if not len(gated): return SILENCE_LUFS
+    return round(float(_block_loudness(np.array([gated.mean()]))[0]), 2)
+
+
+def _ffmpeg_binary() -> str:
+    from replaygain import ffmpeg_binary
+    return ffmpeg_binary()
+
+
+def probe_channels(path: str) -> int:
+    """Canais do primeiro stream de áudio pelo cabeçalho (mutagen), sem rodar o ffprobe."""
+    try:
+        from mutagen import File
+        channels = getattr(getattr(File(path), 'info', None), 'channels', None)
+    except Exception:
+        channels = None
+    if not channels or channels > MAX_CHANNELS: return CHANNELS
+    return int(channels)
+
+
+def measure_file(path: str) -> dict:
+    """Decodifica o arquivo uma vez pelo ffmpeg e mede tudo no mesmo passe."""
+    channels = probe_channels(path)
+    cmd = [_ffmpeg_binary(), "-v", "error", "-i", path, "-map", "0:a:0",
+           "-f", "f32le", "-acodec", "pcm_f32le", "-ac", str(channels), "-ar", str(SAMPLE_RATE), "-"]
+    flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=flags)
+    meter = R128Meter(channels)
+    frame_bytes = 4 * channels
+    try:
+        while True:
+            data = proc.stdout.read(CHUNK_FRAMES * frame_bytes)
+            if not data: break
+            usable = len(data) - len(data) % frame_bytes
+            meter.feed(np.frombuffer(data[:usable], dtype='<f4').reshape(-1, channels))
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode(errors="replace")
+        proc.stderr.close()
+        proc.wait()
+    if proc.returncode != 0 or not meter.frames:
+        raise Exception(f"ffmpeg não decodificou {os.path.basename(path)}: {stderr.strip()[:200]}")
+    return meter.result()
+
+
+def _cache_blocks(path: str, result: dict):
+    key = os.path.abspath(path)
+    with _cache_lock:
+        _block_cache[key] = (result["blocks"], result["true_peak_dbtp"])
+        _block_cache.move_to_end(key)
+        while len(_block_cache) > BLOCK_CACHE_SIZE:
+            _block_cache.popitem(last=False)
+
+
+def analyze(path: str) -> dict:
+    """{"integrated_lufs", "true_peak_dbtp", "duration"} de um arquivo."""
+    result = measure_file(path)
+    _cache_blocks(path, result)
+    return {k: v for k, v in result.items() if k != "blocks"}
+
+
+def album_loudness(results: list) -> dict:
+    """Ganho de álbum: gating sobre todos os blocos das faixas juntos, pico máximo."""
+    blocks = np.concatenate([r["blocks"] for r in results]) if results else np.zeros(0)
+    return {
+        "integrated_lufs": gated_loudness(blocks),
+        "true_peak_dbtp": max((r["true_peak_dbtp"] for r in results), default=SILENCE_LUFS),
+    }
+
+
+def analyze_album(paths: list) -> tuple:
+    """Retorna ({path: análise da faixa}, análise do álbum). Reaproveita blocos já medidos."""
+    tracks, results = {}, []
+    for path in paths:
+        with _cache_lock:
+            cached = _block_cache.get(os.path.abspath(path))
+        if cached:
+            blocks, peak = cached
+            result = {"integrated_lufs": gated_loudness(blocks), "true_peak_dbtp": peak, "blocks": blocks}
+        else:
+            result = measure_file(path)
+            _cache_blocks(path, result)
+        results.append(result)
+        tracks[path] = {k: v for k, v in result.items() if k != "blocks"}
+    return tracks, album_loudness(results)
+
+
+# ---------------------------------------------------------------- lote (biblioteca existente)
+
+def _scan_worker(path: str):
+    try:
+        return path, measure_file(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def scan_library(root: str, workers: int = None, album_by_folder: bool = True, dry_run: bool = False, log=print) -> dict:
+    """
+    Analisa todos os áudios de `root` num pool de processos e grava as tags de ganho.
+    Com album_by_folder, cada pasta é tratada como um álbum (ganho de álbum + faixa).
+    """
+    from replaygain import write_tags
+    paths = [os.path.join(d, f) for d, _, files in os.walk(root) for f in files if f.lower().endswith(AUDIO_EXTENSIONS)]
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    started = time.time()
+    results, failed = {}, {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_scan_worker, p) for p in paths]
+        for done, future in enumerate(as_completed(futures), start=1):
+            path, result, error = future.result()
+            if error: failed[path] = error
+            else: results[path] = result
+            if done % 25 == 0 or done == len(paths):
+                log(f"[loudness] {done}/{len(paths)} analisados")
+
+    folders = {}
+    for path in results:
+        folders.setdefault(os.path.dirname(path) if album_by_folder else path, []).append(path)
+
+    tagged = 0
+    for folder_paths in folders.values():
+        album = album_loudness([results[p] for p in folder_paths]) if album_by_folder and len(folder_paths) > 1 else None
+        for path in folder_paths:
+            if dry_run: continue
+            try:
+                write_tags(path, results[path], album)
+                tagged += 1
+            except Exception as e:
+                failed[path] = str(e)
+
+    elapsed = time.time() - started
+    audio_seconds = sum(r["duration"] for r in results.values())
+    return {
+        "files": len(paths),
+        "analyzed": len(results),
+        "tagged": tagged,
+        "failed": failed,
+        "workers": workers,
+        "seconds": round(elapsed, 2),
+        "realtime_factor": round(audio_seconds / elapsed, 1) if elapsed else None,
+    }
+
+
+def _main(argv: list) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description="Análise EBU R128 e tags ReplayGain/R128 em lote.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan = sub.add_parser("scan", help="Analisa e marca uma biblioteca existente")
+    scan.add_argument("root")
+    scan.add_argument("--workers", type=int, default=None)
+    scan.add_argument("--no-album", action="store_true", help="Só ganho de faixa")
+    scan.add_argument("--dry-run", action="store_true", help="Mede sem gravar tags")
+    args = parser.parse_args(argv)
+
+    summary = scan_library(args.root, args.workers, not args.no_album, args.dry_run)
+    for path, error in summary["failed"].items():
+        print(f"  ERR {path}: {error}")
+    print(f"{summary['analyzed']}/{summary['files']} arquivos em {summary['seconds']} s "
+          f"({summary['realtime_factor']}x tempo real, {summary['workers']} processos), {summary['tagged']} marcados")
+    return 0 if not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
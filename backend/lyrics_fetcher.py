@@ -69,16 +69,17 @@ def _build_search_query(title: str, artist: str) -> str:
     return clean
 
 
-def fetch_and_embed_lyrics(file_path: str, title: str, artist: str = '') -> bool:
+def fetch_and_embed_lyrics(file_path: str, title: str, artist: str = '', txn=None) -> bool:
     """
     Busca a letra da música e embute no arquivo de áudio.
+    Com `txn` (TagTransaction), a letra só é registrada e gravada junto com as outras tags.
     Retorna True se conseguiu injetar a letra, False caso contrário.
     """
     if not file_path or not os.path.exists(file_path):
         return False
 
     ext = os.path.splitext(file_path)[1].lower()
-    if ext not in ('.mp3', '.flac', '.m4a', '.aac', '.ogg'):
+    if ext not in ('.mp3', '.flac', '.m4a', '.aac', '.ogg', '.opus'):
         return False
 
     try:
@@ -149,49 +150,23 @@ def fetch_and_embed_lyrics(file_path: str, title: str, artist: str = '') -> bool
         print(f"  [lyrics] Letra nao encontrada em nenhum lugar para: '{search_query}'")
         return False
 
+    if txn is not None:
+        txn.set_lyrics(lyrics_text)
+        txn.stage("letra")
+        return True
+
     return _embed_lyrics(file_path, ext, lyrics_text)
 
 
 
 def _embed_lyrics(file_path: str, ext: str, lyrics_text: str) -> bool:
     """Embeds lyrics into the audio file using mutagen."""
-    try:
-        if ext == '.mp3':
-            from mutagen.mp3 import MP3
-            from mutagen.id3 import ID3, USLT, Encoding
-            audio = MP3(file_path, ID3=ID3)
-            if audio.tags is None:
-                audio.add_tags()
-            audio.tags.delall('USLT')
-            audio.tags.add(USLT(
-                encoding=Encoding.UTF8,
-                lang='und',
-                desc='Lyrics',
-                text=lyrics_text
-            ))
-            audio.save()
-            print(f"  [lyrics] OK Letra injetada no MP3")
-            return True
-
-        elif ext == '.flac':
-            from mutagen.flac import FLAC
-            audio = FLAC(file_path)
-            audio['LYRICS'] = lyrics_text
-            audio.save()
-            print(f"  [lyrics] OK Letra injetada no FLAC")
-            return True
-
-        elif ext in ('.m4a', '.aac'):
-            from mutagen.mp4 import MP4
-            audio = MP4(file_path)
-            audio['\xa9lyr'] = [lyrics_text]
-            audio.save()
-            print(f"  [lyrics] OK Letra injetada no M4A")
-            return True
-
-    except Exception as e:
-        print(f"  [lyrics] Erro ao injetar letra: {e}")
-
+    from tag_transaction import TagTransaction
+    txn = TagTransaction(file_path)
+    txn.set_lyrics(lyrics_text)
+    if txn.commit():
+        print(f"  [lyrics] OK Letra injetada no {ext.lstrip('.').upper()}")
+        return True
     return False
 
 
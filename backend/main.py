@@ -59,11 +59,30 @@ from dataclasses import asdict
 from utils import get_base_dir, get_resource_path, get_data_dir, get_downloads_dir, get_cookies_path
 from database import init_db, get_conn, get_downloaded_ids, mark_missing_db, get_download_record, sync_db_with_disk, add_favorite, remove_favorite, get_favorites, is_favorite
 from voice_engine import VoiceEngine
-from downloader import jobs, download_queue, worker_loop, MAX_CONCURRENT_DOWNLOADS, JobState
+import hedged_extractor
+import job_store
+import playlist_groups
+import postprocess_pool
+import ydl_pool
+import video_memo
+import itunes_cache
+import cover_cache
+import tag_padding
+from downloader import jobs, download_queue, worker_loop, MAX_CONCURRENT_DOWNLOADS, JobState, enqueue_job, reprioritize_job
+from download_scheduler import PRIORITIES, PRIORITY_INTERACTIVE, PRIORITY_RETRY
 from urllib.parse import urlparse
 
 app = FastAPI()
 
+# Executor dedicado para trabalho bloqueante (yt-dlp, curl_cffi, urllib) dos handlers async,
+# para que uma chamada de rede lenta nunca trave o event loop (ws_broadcast_loop, worker_loop etc.)
+from concurrent.futures import ThreadPoolExecutor
+blocking_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="api-io")
+
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, func, *args)
+
 origins = ["http://localhost:5173", "http://localhost:3000", "http://localhost:8000", "*"]
 
 app.add_middleware(
@@ -74,24 +93,126 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Fila de envio por conexão: um cliente lento nunca trava o ws_broadcast_loop.
+# Se a fila encher, os deltas pendentes são descartados e o cliente recebe um snapshot ao alcançar.
+WS_SEND_QUEUE_SIZE = 16
+
+class Subscriber:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        # "legacy": dict completo {job_id: estado} (frontend antigo); "delta": só campos alterados
+        self.mode = "legacy"
+        self.job_ids = None
+        self.playlist_ids = None
+        self.dropped = 0
+        self.sender = None
+
+    @property
+    def filtered(self) -> bool:
+        return self.job_ids is not None or self.playlist_ids is not None
+
+    def wants(self, job_id: str, state: dict) -> bool:
+        if not self.filtered: return True
+        if self.job_ids and job_id in self.job_ids: return True
+        return bool(self.playlist_ids and state and state.get("playlist_id") in self.playlist_ids)
+
+    def offer(self, kind: str, payload=None):
+        try:
+            self.queue.put_nowait((kind, payload))
+        except asyncio.QueueFull:
+            # Cliente lento: joga fora os deltas (mantém mensagens de controle) e cai para snapshot
+            self.dropped += 1
+            kept = []
+            while not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item[0] == "control": kept.append(item)
+            for item in kept[-(WS_SEND_QUEUE_SIZE - 2):]:
+                self.queue.put_nowait(item)
+            self.queue.put_nowait(("snapshot", None))
+            if kind == "control": self.queue.put_nowait((kind, payload))
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.subscribers: dict = {}
+        # Último estado enviado de cada job (base para os deltas e para os snapshots)
+        self.job_cache: dict = {}
+
+    @property
+    def active_connections(self) -> list:
+        return list(self.subscribers.keys())
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> Subscriber:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        sub = Subscriber(websocket)
+        self.subscribers[websocket] = sub
+        sub.sender = asyncio.create_task(self._send_loop(sub))
+        sub.offer("snapshot")
+        return sub
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        sub = self.subscribers.pop(websocket, None)
+        if sub and sub.sender and sub.sender is not asyncio.current_task():
+            sub.sender.cancel()
+
+    def subscribe(self, sub: Subscriber, data: dict):
+        sub.mode = "delta" if data.get("mode", "delta") == "delta" else "legacy"
+        sub.job_ids = set(data["job_ids"]) if data.get("job_ids") is not None else None
+        sub.playlist_ids = set(data["playlist_ids"]) if data.get("playlist_ids") is not None else None
+        sub.offer("snapshot")
+
+    def _snapshot_text(self, sub: Subscriber) -> str:
+        states = {job_id: state for job_id, state in self.job_cache.items() if sub.wants(job_id, state)}
+        if sub.mode == "legacy": return json.dumps(states)
+        return json.dumps({"type": "jobs_snapshot", "jobs": states})
+
+    async def _send_loop(self, sub: Subscriber):
+        try:
+            while True:
+                kind, payload = await sub.queue.get()
+                if kind == "snapshot":
+                    await sub.websocket.send_text(self._snapshot_text(sub))
+                elif kind == "text":
+                    await sub.websocket.send_text(payload)
+                else:
+                    await sub.websocket.send_json(payload)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.disconnect(sub.websocket)
+
+    def publish_jobs(self, changed: dict, removed: list):
+        """Aplica as mudanças no cache e enfileira para cada assinante só o que interessa a ele."""
+        for job_id, fields in changed.items():
+            self.job_cache.setdefault(job_id, {}).update(fields)
+        for job_id in removed:
+            self.job_cache.pop(job_id, None)
+        if not changed and not removed: return
+
+        shared_delta = None
+        shared_full = None
+        for sub in list(self.subscribers.values()):
+            if sub.mode == "legacy":
+                if sub.filtered:
+                    if any(sub.wants(j, self.job_cache.get(j)) for j in changed): sub.offer("snapshot")
+                    continue
+                if shared_full is None:
+                    shared_full = json.dumps(self.job_cache)
+                sub.offer("text", shared_full)
+                continue
+            if not sub.filtered:
+                if shared_delta is None:
+                    shared_delta = json.dumps({"type": "jobs_delta", "changed": changed, "removed": removed})
+                sub.offer("text", shared_delta)
+                continue
+            mine = {j: f for j, f in changed.items() if sub.wants(j, self.job_cache.get(j))}
+            gone = [j for j in removed if sub.job_ids and j in sub.job_ids]
+            if mine or gone:
+                sub.offer("text", json.dumps({"type": "jobs_delta", "changed": mine, "removed": gone}))
 
     async def broadcast_json(self, data: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(data)
-            except:
-                pass
+        for sub in list(self.subscribers.values()):
+            sub.offer("control", data)
 
 manager = ConnectionManager()
 
@@ -168,71 +289,90 @@ async def sync_db():
 async def get_version():
     return {"version": APP_VERSION}
 
+def _fetch_latest_release() -> dict:
+    import urllib.request
+    req = urllib.request.Request(
+        f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest",
+        headers={'User-Agent': 'Mozilla/5.0'}
+    )
+    with urllib.request.urlopen(req, timeout=15) as response:
+        return json.loads(response.read().decode())
+
 @app.get("/check_update")
 async def check_update():
-    import urllib.request
-    import json
     try:
-        req = urllib.request.Request(
-            f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest",
-            headers={'User-Agent': 'Mozilla/5.0'}
-        )
-        with urllib.request.urlopen(req) as response:
-            data = json.loads(response.read().decode())
-            latest_version = data.get("tag_name", "").replace("v", "")
-            
-            # Simple version comparison (assumes format x.y.z)
-            current_parts = [int(p) for p in APP_VERSION.split(".")]
-            latest_parts = [int(p) for p in latest_version.split(".")]
-            
-            update_available = False
-            for i in range(max(len(current_parts), len(latest_parts))):
-                c = current_parts[i] if i < len(current_parts) else 0
-                l = latest_parts[i] if i < len(latest_parts) else 0
-                if l > c:
-                    update_available = True
-                    break
-                elif c > l:
-                    break
+        data = await run_blocking(_fetch_latest_release)
+        latest_version = data.get("tag_name", "").replace("v", "")
+        
+        # Simple version comparison (assumes format x.y.z)
+        current_parts = [int(p) for p in APP_VERSION.split(".")]
+        latest_parts = [int(p) for p in latest_version.split(".")]
+        
+        update_available = False
+        for i in range(max(len(current_parts), len(latest_parts))):
+            c = current_parts[i] if i < len(current_parts) else 0
+            l = latest_parts[i] if i < len(latest_parts) else 0
+            if l > c:
+                update_available = True
+                break
+            elif c > l:
+                break
 
-            return {
-                "update_available": update_available,
-                "current_version": APP_VERSION,
-                "latest_version": latest_version,
-                "release_notes": data.get("body", "Sem notas de lançamento disponíveis."),
-                "download_url": data.get("html_url", f"https://github.com/{GITHUB_REPO}/releases/latest")
-            }
+        return {
+            "update_available": update_available,
+            "current_version": APP_VERSION,
+            "latest_version": latest_version,
+            "release_notes": data.get("body", "Sem notas de lançamento disponíveis."),
+            "download_url": data.get("html_url", f"https://github.com/{GITHUB_REPO}/releases/latest")
+        }
     except Exception as e:
         print(f"Update check failed: {e}")
         return {"update_available": False, "error": str(e)}
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    sub = await manager.connect(websocket)
     import os
     if "LUMINA_INITIAL_FILE" in os.environ:
         try:
-            await websocket.send_json({"type": "PLAY_EXTERNAL", "file_path": os.environ["LUMINA_INITIAL_FILE"]})
+            sub.offer("control", {"type": "PLAY_EXTERNAL", "file_path": os.environ["LUMINA_INITIAL_FILE"]})
             del os.environ["LUMINA_INITIAL_FILE"]
         except Exception:
             pass
     try:
         while True:
             data = await websocket.receive_text()
+            # {"type": "subscribe", "mode": "delta", "job_ids": [...], "playlist_ids": [...]}
+            try:
+                msg = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(msg, dict) and msg.get("type") == "subscribe":
+                manager.subscribe(sub, msg)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
 async def ws_broadcast_loop():
+    import downloader
     while True:
         await asyncio.sleep(1)
-        if manager.active_connections:
-            jobs_data = {job_id: asdict(state) for job_id, state in jobs.items()}
-            await manager.broadcast_json(jobs_data)
+        # Só os jobs alterados desde o último tick são serializados (ver JobState.__setattr__)
+        changed = {}
+        for job_id in downloader.pop_dirty_jobs():
+            st = jobs.get(job_id)
+            if st is None: continue
+            state = asdict(st)
+            previous = manager.job_cache.get(job_id)
+            diff = state if previous is None else {k: v for k, v in state.items() if previous.get(k) != v}
+            if diff: changed[job_id] = diff
+        removed = [job_id for job_id in manager.job_cache if job_id not in jobs]
+        manager.publish_jobs(changed, removed)
 
 @app.on_event("startup")
 async def startup_event():
     init_db()
     
-    # Initialize download_sem from database so it respects the saved user settings on boot
+    # Initialize the download_sem ceiling from database so it respects the saved user settings on boot
     import downloader
     try:
         conn = get_conn()
@@ -242,13 +382,92 @@ async def startup_event():
         conn.close()
         if row:
             value = max(1, min(8, int(row['value'])))
-            downloader.download_sem = asyncio.Semaphore(value)
-            print(f"[Startup] Concurrent downloads restored to {value}")
+            downloader.download_sem.set_ceiling(value)
+            print(f"[Startup] Concurrent downloads ceiling restored to {value}")
     except Exception as e:
         print(f"[Startup] Error loading concurrent downloads setting: {e}")
 
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = 'download_backend'")
+        row = cur.fetchone()
+        conn.close()
+        if row:
+            print(f"[Startup] Download backend: {downloader.set_download_backend(row['value'])}")
+    except Exception as e:
+        print(f"[Startup] Error loading download backend setting: {e}")
+
+    try:
+        import rate_limiter
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = 'rate_limits'")
+        row = cur.fetchone()
+        conn.close()
+        if row:
+            rate_limiter.configure(json.loads(row['value']))
+    except Exception as e:
+        print(f"[Startup] Error loading rate limits setting: {e}")
+
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = 'info_hedge'")
+        row = cur.fetchone()
+        conn.close()
+        if row:
+            saved = json.loads(row['value'])
+            hedged_extractor.configure(saved.get("width"), saved.get("delay"), saved.get("max_concurrent"))
+    except Exception as e:
+        print(f"[Startup] Error loading info hedge setting: {e}")
+
+    try:
+        import stall_watchdog
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = 'stall_watchdog'")
+        row = cur.fetchone()
+        conn.close()
+        if row:
+            saved = json.loads(row['value'])
+            stall_watchdog.configure(saved.get("window"), saved.get("startup_window"), saved.get("hang_grace"), saved.get("max_requeues"))
+    except Exception as e:
+        print(f"[Startup] Error loading stall watchdog setting: {e}")
+
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = 'cover_cache'")
+        row = cur.fetchone()
+        conn.close()
+        if row:
+            cover_cache.configure(json.loads(row['value']).get("max_mb"))
+    except Exception as e:
+        print(f"[Startup] Error loading cover cache setting: {e}")
+
+    try:
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_settings WHERE key = 'tag_padding'")
+        row = cur.fetchone()
+        conn.close()
+        if row:
+            tag_padding.configure(json.loads(row['value']).get("padding_kb"))
+    except Exception as e:
+        print(f"[Startup] Error loading tag padding setting: {e}")
+
+    removed = itunes_cache.clear(expired_only=True)
+    if removed:
+        print(f"[Startup] {removed} entradas vencidas removidas do cache do iTunes")
+
+    await restore_persisted_jobs()
+
     for _ in range(20):
         asyncio.create_task(worker_loop())
+    asyncio.create_task(job_store.flush_loop())
+    asyncio.create_task(playlist_groups.group_monitor_loop())
+    postprocess_pool.start()
     asyncio.create_task(ws_broadcast_loop())
     
     # Start Playlist Monitor
@@ -303,6 +522,39 @@ class DownloadRequest(BaseModel):
     organize_by_playlist: bool = False
     sponsorblock_enabled: bool = False
     subtitle: Optional[str] = "none"
+    priority: Optional[str] = None
+    # Preenchidos pela expansão de playlists (playlist_groups.py)
+    group_id: Optional[str] = None
+    playlist_title: Optional[str] = None
+    playlist_index: Optional[int] = None
+    # Playlists de áudio recebem ReplayGain de álbum além do de faixa
+    album_gain: bool = True
+
+async def restore_persisted_jobs():
+    """Recoloca na fila os jobs salvos em job_queue (na ordem original) e recria os que falharam."""
+    restored = 0
+    for row in job_store.load():
+        job_id = row["job_id"]
+        if job_id in jobs: continue
+        try:
+            req = DownloadRequest(**row["request"])
+        except Exception as e:
+            print(f"[Startup] Job {job_id} ignorado (request inválido): {e}")
+            continue
+        priority = row["priority"] or PRIORITY_INTERACTIVE
+        if row["status"] == "failed":
+            jobs[job_id] = JobState(id=job_id, status="error", progress=100.0, created_at=row["created_at"] or time.time(),
+                                    title=row["title"], error=row["error"], priority=priority, last_update=time.time())
+            job_store.track(job_id, req, priority)
+        else:
+            st = await enqueue_job(job_id, req, priority, created_at=row["created_at"])
+            if st.id != job_id or st.status == "already_downloaded":
+                # Anexado a outro job restaurado ou já no disco: a linha sai da fila persistente
+                job_store.track(job_id, req, priority)
+            restored += 1
+        job_store.mark_written(job_id, row["status"], priority)
+    if restored:
+        print(f"[Startup] {restored} downloads restaurados da fila persistente")
 
 class InfoRequest(BaseModel):
     url: str
@@ -320,6 +572,93 @@ class RetryRequest(BaseModel):
 async def get_all_jobs():
     return {job_id: asdict(state) for job_id, state in jobs.items()}
 
+@app.get("/api/strategies")
+def get_strategy_scoreboard():
+    """Saúde atual de cada estratégia/cliente do yt-dlp (janela deslizante)."""
+    import strategy_scoreboard
+    return {"strategies": strategy_scoreboard.snapshot(), "window_seconds": strategy_scoreboard.WINDOW_SECONDS}
+
+@app.get("/api/strategies/videos")
+def get_video_memo_status():
+    """Memo de estratégia por vídeo e falhas permanentes em cache, por classe."""
+    return video_memo.snapshot()
+
+@app.post("/api/strategies/videos/clear_failures")
+def clear_video_failures(body: dict):
+    """Apaga o cache negativo de um vídeo ({"video_id": ...}), de classes ({"classes": [...]}) ou todo."""
+    if body.get("video_id"):
+        removed = video_memo.forget_failure(body["video_id"])
+    else:
+        removed = video_memo.clear_failures(tuple(body.get("classes") or ()) or None)
+    return {"status": "ok", "removed": removed}
+
+@app.get("/api/metadata/itunes_cache")
+def get_itunes_cache_status():
+    """Acertos/erros do cache de buscas no iTunes e buscas coalescidas (single-flight)."""
+    return itunes_cache.snapshot()
+
+@app.post("/api/metadata/itunes_cache/clear")
+def clear_itunes_cache(body: dict):
+    """Apaga as entradas vencidas ({"expired_only": true}, padrão) ou o cache inteiro."""
+    removed = itunes_cache.clear(expired_only=body.get("expired_only", True))
+    return {"status": "ok", "removed": removed}
+
+@app.get("/api/metadata/covers")
+def get_cover_cache_status():
+    """Capas em cache (arquivos, espaço em disco) e quantos downloads/recortes foram evitados."""
+    return cover_cache.snapshot()
+
+@app.get("/api/metadata/pipeline")
+def get_metadata_pipeline_status():
+    """Origem das capas (iTunes x thumbnail), pré-buscas durante o download e execuções de ffmpeg evitadas."""
+    import metadata_fetcher
+    return metadata_fetcher.pipeline_snapshot()
+
+@app.get("/api/settings/cover_cache")
+def get_cover_cache_setting():
+    return cover_cache.get_config()
+
+@app.post("/api/settings/cover_cache")
+def set_cover_cache_setting(body: dict):
+    try:
+        config = cover_cache.configure(body.get("max_mb"))
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('cover_cache', ?)", (json.dumps({"max_mb": config["max_mb"]}),))
+        conn.commit()
+        conn.close()
+        print(f"[Settings] Cover cache limit updated to {config['max_mb']} MB")
+        return {"status": "ok", **config}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/settings/tag_padding")
+def get_tag_padding_setting():
+    return tag_padding.get_config()
+
+@app.post("/api/settings/tag_padding")
+def set_tag_padding_setting(body: dict):
+    try:
+        config = tag_padding.configure(body.get("padding_kb"))
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('tag_padding', ?)", (json.dumps(config),))
+        conn.commit()
+        conn.close()
+        print(f"[Settings] Tag padding updated to {config['padding_kb']} KB")
+        return {"status": "ok", **config}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/library/repad")
+def start_library_repad():
+    """Dá padding aos arquivos antigos da biblioteca para que edições de tags fiquem in-place."""
+    return tag_padding.start_repad()
+
+@app.get("/api/library/repad")
+def get_library_repad():
+    return tag_padding.repad_status()
+
 # --- Subscriptions API ---
 import subscriptions
 
@@ -580,6 +919,69 @@ def save_preset(preset: PresetData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _search_ytmusic(query: str, limit: int) -> list:
+    """Busca direto na API interna do YouTube Music (cliente ANDROID_MUSIC). Bloqueante."""
+    results = []
+    import requests as cffi_requests
+    api_url = "https://music.youtube.com/youtubei/v1/search?prettyPrint=false"
+    headers = {
+        "Content-Type": "application/json",
+        "User-Agent": "com.google.android.apps.youtube.music/6.20.51 (Linux; U; Android 13; en_US) gzip"
+    }
+    payload = {
+        "context": {
+            "client": {
+                "clientName": "ANDROID_MUSIC",
+                "clientVersion": "6.20.51",
+                "androidSdkVersion": 33,
+                "osName": "Android",
+                "osVersion": "13",
+            }
+        },
+        "query": query
+    }
+    res = cffi_requests.post(api_url, json=payload, headers=headers, impersonate="chrome120", timeout=10)
+    if res.status_code == 200:
+        data = res.json()
+        contents = data.get("contents", {}).get("tabbedSearchResultsRenderer", {}).get("tabs", [{}])[0].get("tabRenderer", {}).get("content", {}).get("sectionListRenderer", {}).get("contents", [])
+        for section in contents:
+            if "musicShelfRenderer" in section:
+                items = section["musicShelfRenderer"].get("contents", [])
+                for item in items:
+                    if "musicResponsiveListItemRenderer" in item:
+                        info = item["musicResponsiveListItemRenderer"]
+                        columns = info.get("flexColumns", [])
+                        if len(columns) > 0:
+                            first_col = columns[0].get("musicResponsiveListItemFlexColumnRenderer", {}).get("text", {}).get("runs", [{}])[0]
+                            name = first_col.get("text", "Desconhecido")
+                            video_id = first_col.get("navigationEndpoint", {}).get("watchEndpoint", {}).get("videoId")
+                            if video_id:
+                                uploader = "YouTube Music"
+                                if len(columns) > 1:
+                                    second_col_runs = columns[1].get("musicResponsiveListItemFlexColumnRenderer", {}).get("text", {}).get("runs", [])
+                                    if second_col_runs:
+                                        uploader = "".join([r.get("text", "") for r in second_col_runs])
+
+                                thumbnail = f"https://i.ytimg.com/vi/{video_id}/mqdefault.jpg"
+                                thumbnails = info.get("thumbnail", {}).get("musicThumbnailRenderer", {}).get("thumbnail", {}).get("thumbnails", [])
+                                if thumbnails:
+                                    thumbnail = thumbnails[-1].get("url", thumbnail)
+
+                                results.append({
+                                    "id": video_id,
+                                    "title": name,
+                                    "uploader": uploader,
+                                    "duration_string": "",
+                                    "url": f"https://music.youtube.com/watch?v={video_id}",
+                                    "thumbnail": thumbnail,
+                                    "view_count": 0
+                                })
+                                if len(results) >= limit:
+                                    break
+                if len(results) >= limit:
+                    break
+    return results
+
 @app.post("/search")
 async def search_youtube(request: SearchRequest):
     query = request.query.strip()
@@ -593,68 +995,9 @@ async def search_youtube(request: SearchRequest):
 
     if is_ytm:
         try:
-            import json
-            import requests as cffi_requests
-            api_url = "https://music.youtube.com/youtubei/v1/search?prettyPrint=false"
-            headers = {
-                "Content-Type": "application/json",
-                "User-Agent": "com.google.android.apps.youtube.music/6.20.51 (Linux; U; Android 13; en_US) gzip"
-            }
-            payload = {
-                "context": {
-                    "client": {
-                        "clientName": "ANDROID_MUSIC",
-                        "clientVersion": "6.20.51",
-                        "androidSdkVersion": 33,
-                        "osName": "Android",
-                        "osVersion": "13",
-                    }
-                },
-                "query": query
-            }
-            res = cffi_requests.post(api_url, json=payload, headers=headers, impersonate="chrome120", timeout=10)
-            if res.status_code == 200:
-                data = res.json()
-                results = []
-                contents = data.get("contents", {}).get("tabbedSearchResultsRenderer", {}).get("tabs", [{}])[0].get("tabRenderer", {}).get("content", {}).get("sectionListRenderer", {}).get("contents", [])
-                for section in contents:
-                    if "musicShelfRenderer" in section:
-                        items = section["musicShelfRenderer"].get("contents", [])
-                        for item in items:
-                            if "musicResponsiveListItemRenderer" in item:
-                                info = item["musicResponsiveListItemRenderer"]
-                                columns = info.get("flexColumns", [])
-                                if len(columns) > 0:
-                                    first_col = columns[0].get("musicResponsiveListItemFlexColumnRenderer", {}).get("text", {}).get("runs", [{}])[0]
-                                    name = first_col.get("text", "Desconhecido")
-                                    video_id = first_col.get("navigationEndpoint", {}).get("watchEndpoint", {}).get("videoId")
-                                    if video_id:
-                                        uploader = "YouTube Music"
-                                        if len(columns) > 1:
-                                            second_col_runs = columns[1].get("musicResponsiveListItemFlexColumnRenderer", {}).get("text", {}).get("runs", [])
-                                            if second_col_runs:
-                                                uploader = "".join([r.get("text", "") for r in second_col_runs])
-                                        
-                                        thumbnail = f"https://i.ytimg.com/vi/{video_id}/mqdefault.jpg"
-                                        thumbnails = info.get("thumbnail", {}).get("musicThumbnailRenderer", {}).get("thumbnail", {}).get("thumbnails", [])
-                                        if thumbnails:
-                                            thumbnail = thumbnails[-1].get("url", thumbnail)
-                                            
-                                        results.append({
-                                            "id": video_id,
-                                            "title": name,
-                                            "uploader": uploader,
-                                            "duration_string": "",
-                                            "url": f"https://music.youtube.com/watch?v={video_id}",
-                                            "thumbnail": thumbnail,
-                                            "view_count": 0
-                                        })
-                                        if len(results) >= request.limit:
-                                            break
-                        if len(results) >= request.limit:
-                            break
-                if results:
-                    return {"results": results}
+            results = await run_blocking(_search_ytmusic, query, request.limit)
+            if results:
+                return {"results": results}
         except Exception as e:
             print(f"YT Music search failed: {e}. Falling back to yt-dlp.")
 
@@ -666,7 +1009,7 @@ async def search_youtube(request: SearchRequest):
     query_str = f"ytsearch{request.limit}:{query}"
     
     def perform_search(opts):
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with ydl_pool.lease(opts) as ydl:
             info = ydl.extract_info(query_str, download=False)
             if 'entries' in info:
                 results = []
@@ -687,14 +1030,14 @@ async def search_youtube(request: SearchRequest):
             return {"results": []}
 
     try:
-        return perform_search(ydl_opts)
+        return await run_blocking(perform_search, ydl_opts)
     except Exception as e:
         error_msg = str(e)
         if "does not look like a Netscape format cookies file" in error_msg or "cookie" in error_msg.lower():
             print(f"Cookie error in search, falling back without cookies: {error_msg}")
             ydl_opts.pop('cookiefile', None)
             try:
-                return perform_search(ydl_opts)
+                return await run_blocking(perform_search, ydl_opts)
             except Exception as e2:
                 print(f"Fallback search error: {e2}")
                 raise HTTPException(status_code=500, detail=str(e2))
@@ -725,11 +1068,13 @@ def clean_url(url: str) -> str:
     except:
         return url
 
+INFO_CLIENTS = ['android_vr', 'tv_embedded', 'web_embedded', 'ios_music', 'android_music', 'tv', 'web', 'web_creator']
+
 @app.post("/info")
 async def get_info(request: DownloadRequest):
     try:
         url = clean_url(request.url)
-        url, pseudo_playlist, is_magic, magic_source, magic_cover = await asyncio.to_thread(parse_magic_url, url)
+        url, pseudo_playlist, is_magic, magic_source, magic_cover = await run_blocking(parse_magic_url, url)
 
         if pseudo_playlist:
             info = pseudo_playlist
@@ -749,31 +1094,11 @@ async def get_info(request: DownloadRequest):
                 'writeautomaticsub': True
             }
             
-            info = None
-            last_err = None
-            for client in ['android_vr', 'tv_embedded', 'web_embedded', 'ios_music', 'android_music', 'tv', 'web', 'web_creator']:
-                try:
-                    if client != 'web': ydl_opts['extractor_args'] = {'youtube': {'player_client': [client]}}
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(url, download=False)
-                    break
-                except Exception as e: 
-                    last_err = str(e)
-                    if "does not look like a Netscape format cookies file" in last_err or "cookie" in last_err.lower():
-                        if 'cookiefile' in ydl_opts:
-                            print(f"Cookie error in get_info, retrying without cookies: {last_err}")
-                            ydl_opts.pop('cookiefile', None)
-                            try:
-                                with yt_dlp.YoutubeDL(ydl_opts) as ydl2:
-                                    info = ydl2.extract_info(url, download=False)
-                                break
-                            except Exception as e2:
-                                last_err = str(e2)
-                
-            if not info: 
-                err_msg = "Falha ao extrair info."
-                if last_err: err_msg += f" Detalhes: {last_err}"
-                raise HTTPException(status_code=500, detail=err_msg)
+            # Corrida entre clientes (ver hedged_extractor.py): o primeiro que responder vence
+            try:
+                info, _client = await run_blocking(hedged_extractor.extract_hedged, url, ydl_opts, INFO_CLIENTS)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Falha ao extrair info. Detalhes: {e}")
                 
             if is_magic and not pseudo_playlist and 'entries' in info:
                 if len(info['entries']) > 0:
@@ -847,7 +1172,7 @@ def get_playlist_details(request: InfoRequest):
             for client in ['web_embedded', 'tv_embedded', 'web', 'android']:
                 try:
                     if client != 'web': ydl_opts['extractor_args'] = {'youtube': {'player_client': [client]}}
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    with ydl_pool.lease(ydl_opts) as ydl:
                         playlist_info = ydl.extract_info(url, download=False)
                     break
                 except Exception as e:
@@ -857,7 +1182,7 @@ def get_playlist_details(request: InfoRequest):
                             print(f"Cookie error in playlist details, retrying without cookies: {err_str}")
                             ydl_opts.pop('cookiefile', None)
                             try:
-                                with yt_dlp.YoutubeDL(ydl_opts) as ydl2:
+                                with ydl_pool.lease(ydl_opts) as ydl2:
                                     playlist_info = ydl2.extract_info(url, download=False)
                                 break
                             except Exception: pass
@@ -901,26 +1226,43 @@ async def retry_download(req: RetryRequest):
     rec = get_download_record(req.playlist_id, req.video_id)
     if not rec: raise HTTPException(status_code=404, detail="Não encontrado no histórico")
     mark_missing_db(req.playlist_id, req.video_id)
+    # Retry manual ignora a falha permanente em cache (o vídeo pode ter voltado)
+    video_memo.forget_failure(req.video_id)
     url = rec.get("url") or f"https://www.youtube.com/watch?v={rec['video_id']}"
     
     dreq = DownloadRequest(url=url, playlist_id=req.playlist_id, video_id=req.video_id, title=rec.get("title"))
     job_id = str(uuid.uuid4())
-    jobs[job_id] = JobState(id=job_id, status="queued", progress=0.0, created_at=time.time(), title=rec.get("title"))
-    await download_queue.put((job_id, dreq))
-    return {"status": "ok", "job_id": job_id}
+    st = await enqueue_job(job_id, dreq, PRIORITY_RETRY)
+    return {"status": "ok", "job_id": st.id}
 
 @app.post("/download/enqueue")
 @app.post("/download")
 async def enqueue_download(req: DownloadRequest):
     req.url = clean_url(req.url)
     job_id = str(uuid.uuid4())
-    jobs[job_id] = JobState(id=job_id, status="queued", progress=0.0, created_at=time.time(), title=req.title)
-    await download_queue.put((job_id, req))
-    return {"job_id": job_id}
+    priority = req.priority if req.priority in PRIORITIES else PRIORITY_INTERACTIVE
+    # Pode voltar um job já existente (pedido repetido) ou já concluído (arquivo no disco)
+    st = await enqueue_job(job_id, req, priority)
+    return {"job_id": st.id, "status": st.status}
+
+@app.get("/download/queue")
+async def get_download_queue():
+    return download_queue.snapshot()
+
+@app.post("/download/priority/{job_id}")
+async def set_download_priority(job_id: str, body: dict):
+    priority = body.get("priority")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Prioridade inválida. Use uma de: {', '.join(PRIORITIES)}")
+    if not reprioritize_job(job_id, priority):
+        raise HTTPException(status_code=404, detail="Job não está na fila")
+    return {"job_id": job_id, "priority": priority}
 
 @app.post("/download/cancel/{job_id}")
 async def cancel_download(job_id: str):
     if job_id in jobs:
+        download_queue.remove(job_id)
+        playlist_groups.cancel_group(job_id)
         jobs[job_id].status = "cancelled"
         jobs[job_id].error = "Cancelado pelo usuário"
         return {"job_id": job_id, "status": "cancelled"}
@@ -959,7 +1301,7 @@ def api_radio_next(req: RadioRequest):
     }
     
     try:
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with ydl_pool.lease(opts) as ydl:
             # We search "{seed} mix auto-generated" or "audio" to get similar songs
             info = ydl.extract_info(f"ytsearch5:{req.seed_title} audio", download=False)
             if 'entries' in info and len(info['entries']) > 0:
@@ -1003,6 +1345,9 @@ async def upload_cookies(file: UploadFile = File(...)):
         with open(cookie_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
             
+        # Instâncias do pool guardam o cookiejar antigo em memória
+        ydl_pool.invalidate()
+        video_memo.clear_failures(video_memo.COOKIE_CLASSES)
         print("[Upload] Cookies salvos com sucesso!")
         return {"status": "success"}
     except Exception as e:
@@ -1058,9 +1403,110 @@ def set_concurrent_downloads(body: dict):
         cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('concurrent_downloads', ?)", (str(value),))
         conn.commit()
         conn.close()
-        # Update the live semaphore so it takes effect immediately without restart
-        downloader.download_sem = asyncio.Semaphore(value)
-        print(f"[Settings] Concurrent downloads updated to {value}")
+        # Update the live limiter ceiling so it takes effect immediately without restart
+        downloader.download_sem.set_ceiling(value)
+        print(f"[Settings] Concurrent downloads ceiling updated to {value}")
+        return {"status": "ok", "value": value}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/downloads/concurrency")
+def get_download_concurrency():
+    """Limite atual do controlador AIMD e os últimos ajustes."""
+    import downloader
+    return downloader.download_sem.snapshot()
+
+@app.get("/api/downloads/postprocess")
+def get_postprocess_pool():
+    """Fila e workers do pós-processamento (conversão, tags, letras)."""
+    return postprocess_pool.snapshot()
+
+@app.get("/api/downloads/ydl_pool")
+def get_ydl_pool():
+    """Reuso das instâncias YoutubeDL e das conexões HTTP com o YouTube."""
+    return ydl_pool.snapshot()
+
+@app.get("/api/downloads/stalls")
+def get_download_stalls():
+    """Tentativas vigiadas agora (bytes/s, tempo parado) e contadores de travamentos."""
+    import stall_watchdog
+    return stall_watchdog.snapshot()
+
+@app.get("/api/settings/stall_watchdog")
+def get_stall_watchdog():
+    import stall_watchdog
+    return stall_watchdog.get_config()
+
+@app.post("/api/settings/stall_watchdog")
+def set_stall_watchdog(body: dict):
+    import stall_watchdog
+    try:
+        config = stall_watchdog.configure(body.get("window"), body.get("startup_window"), body.get("hang_grace"), body.get("max_requeues"))
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('stall_watchdog', ?)", (json.dumps(config),))
+        conn.commit()
+        conn.close()
+        print(f"[Settings] Stall watchdog updated to {config}")
+        return {"status": "ok", **config}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/settings/info_hedge")
+def get_info_hedge():
+    return hedged_extractor.get_config()
+
+@app.post("/api/settings/info_hedge")
+def set_info_hedge(body: dict):
+    try:
+        config = hedged_extractor.configure(body.get("width"), body.get("delay"), body.get("max_concurrent"))
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('info_hedge', ?)", (json.dumps(config),))
+        conn.commit()
+        conn.close()
+        print(f"[Settings] Info hedge updated to {config}")
+        return {"status": "ok", **config}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/settings/rate_limits")
+def get_rate_limits():
+    import rate_limiter
+    return {"buckets": rate_limiter.snapshot()}
+
+@app.post("/api/settings/rate_limits")
+def set_rate_limits(body: dict):
+    import rate_limiter
+    try:
+        config = rate_limiter.configure(body.get("buckets", body))
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('rate_limits', ?)", (json.dumps(config),))
+        conn.commit()
+        conn.close()
+        print(f"[Settings] Rate limits updated: {config}")
+        return {"status": "ok", "buckets": config}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/settings/download_backend")
+def get_download_backend():
+    import downloader
+    import process_backend
+    return {"value": downloader.DOWNLOAD_BACKEND, "process_supported": process_backend.is_supported()}
+
+@app.post("/api/settings/download_backend")
+def set_download_backend(body: dict):
+    import downloader
+    try:
+        value = downloader.set_download_backend(body.get("value", "thread"))
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("INSERT OR REPLACE INTO app_settings (key, value) VALUES ('download_backend', ?)", (value,))
+        conn.commit()
+        conn.close()
+        print(f"[Settings] Download backend set to {value}")
         return {"status": "ok", "value": value}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2145,7 +2591,7 @@ def api_downloads_list(token: str = None):
         files = []
         if os.path.exists(d_dir):
             for f in os.listdir(d_dir):
-                if f.lower().endswith(('.mp3', '.m4a', '.flac', '.mp4')):
+                if f.lower().endswith(('.mp3', '.m4a', '.flac', '.opus', '.mp4')):
                     filepath = os.path.join(d_dir, f)
                     stat = os.stat(filepath)
                     files.append({
@@ -1,10 +1,14 @@
-from curl_cffi import requests
 import re
-import urllib.parse
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC
-from mutagen.mp4 import MP4, MP4Cover
-from mutagen.flac import FLAC, Picture
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import itunes_cache
+import cover_cache
+from tag_transaction import TagTransaction
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="metadata-prefetch")
+_prefetch_lock = threading.Lock()
+_prefetched = set()
+_pipeline_stats = {"prefetched": 0, "thumbnail_fetches_avoided": 0, "ffmpeg_runs_avoided": 0, "covers": {}}
 
 
 def clean_title(title: str) -> str:
@@ -149,7 +153,55 @@ def clean_title_for_tag(title: str) -> str:
     return title.strip(' -–—|')
 
 
-def apply_metadata(filepath: str, raw_title: str) -> bool:
+def _hires_cover_url(artwork_url: str) -> str:
+    # iTunes art is already square: the 1000x1000 rendition needs no ffmpeg crop
+    return artwork_url.replace('100x100bb', '1000x1000bb')
+
+
+def _warm(search_query: str):
+    try:
+        track = itunes_cache.lookup(search_query)
+        if track and track.get('artworkUrl100'):
+            cover_cache.get_path(_hires_cover_url(track['artworkUrl100']), 1000, crop=False)
+    except Exception as e:
+        print(f"      \033[90m[metadata:warn] Pre-busca no iTunes falhou: {e}\033[0m")
+
+
+def prefetch(raw_title: str):
+    """
+    Resolves iTunes tags and cover while the audio is still downloading, so finalize_download
+    finds both in cache and knows early whether the YouTube thumbnail is needed at all.
+    """
+    search_query = clean_title(raw_title)
+    if not search_query: return
+    with _prefetch_lock:
+        if search_query in _prefetched: return
+        if len(_prefetched) > 1000: _prefetched.clear()
+        _prefetched.add(search_query)
+        _pipeline_stats["prefetched"] += 1
+    _prefetch_executor.submit(_warm, search_query)
+
+
+def record_cover_source(source: str, ffmpeg_avoided: int):
+    """finalize_download: where the cover came from ("itunes", "thumbnail", "custom", "none") and ffmpeg runs saved."""
+    with _prefetch_lock:
+        _pipeline_stats["covers"][source] = _pipeline_stats["covers"].get(source, 0) + 1
+        _pipeline_stats["ffmpeg_runs_avoided"] += ffmpeg_avoided
+        if source != "thumbnail": _pipeline_stats["thumbnail_fetches_avoided"] += 1
+
+
+def pipeline_snapshot() -> dict:
+    with _prefetch_lock:
+        return {**_pipeline_stats, "covers": dict(_pipeline_stats["covers"])}
+
+
+def apply_metadata(filepath: str, raw_title: str, txn: TagTransaction = None) -> bool:
+    """
+    Title/artist/album/cover from iTunes. With `txn`, values are only staged and written later
+    together with the other stages (see tag_transaction.py); without it, written right away.
+    """
+    own_txn = txn is None
+    if own_txn: txn = TagTransaction(filepath)
     try:
         search_query = clean_title(raw_title)
         if not search_query: return False
@@ -157,10 +209,8 @@ def apply_metadata(filepath: str, raw_title: str) -> bool:
         # Fallback clean title to use if iTunes doesn't find a match
         fallback_title = clean_title_for_tag(raw_title)
         
-        # Request from iTunes API
-        url = f"https://itunes.apple.com/search?term={urllib.parse.quote(search_query)}&entity=song&limit=1"
-        from config import CHROME_IMPERSONATE
-        res = requests.get(url, timeout=15, impersonate=CHROME_IMPERSONATE)
+        # iTunes API lookup (persistent cache + single-flight, see itunes_cache.py)
+        track = itunes_cache.lookup(search_query)
         
         itunes_found = False
         track_name = fallback_title
@@ -168,58 +218,23 @@ def apply_metadata(filepath: str, raw_title: str) -> bool:
         album_name = ''
         cover_data = None
 
-        if res.status_code == 200:
-            data = res.json()
-            if data.get('results'):
-                track = data['results'][0]
-                track_name = track.get('trackName', fallback_title)
-                artist_name = track.get('artistName', '')
-                album_name = track.get('collectionName', '')
-                cover_url = track.get('artworkUrl100', '')
-                itunes_found = True
-                
-                # Get 1000x1000 High Res cover
-                if cover_url:
-                    cover_url = cover_url.replace('100x100bb', '1000x1000bb')
-                    cover_res = requests.get(cover_url, timeout=15, impersonate=CHROME_IMPERSONATE)
-                    cover_data = cover_res.content if cover_res.status_code == 200 else None
+        if track:
+            track_name = track.get('trackName', fallback_title)
+            artist_name = track.get('artistName', '')
+            album_name = track.get('collectionName', '')
+            cover_url = track.get('artworkUrl100', '')
+            itunes_found = True
+            
+            # Get 1000x1000 High Res cover (shared by every track of the album, see cover_cache.py)
+            if cover_url:
+                cover_data = cover_cache.get(_hires_cover_url(cover_url), 1000, crop=False)
 
         # Always write at minimum the cleaned title (even if iTunes failed)
-        if filepath.lower().endswith('.mp3'):
-            audio = MP3(filepath, ID3=ID3)
-            if audio.tags is None: audio.add_tags()
-            audio.tags.add(TIT2(encoding=3, text=track_name))
-            if artist_name:
-                audio.tags.add(TPE1(encoding=3, text=artist_name))
-            if album_name:
-                audio.tags.add(TALB(encoding=3, text=album_name))
-            if cover_data:
-                audio.tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover_data))
-            audio.save()
-            
-        elif filepath.lower().endswith('.m4a') or filepath.lower().endswith('.mp4'):
-            audio = MP4(filepath)
-            audio.tags['©nam'] = track_name
-            if artist_name: audio.tags['©ART'] = artist_name
-            if album_name: audio.tags['©alb'] = album_name
-            if cover_data:
-                audio.tags['covr'] = [MP4Cover(cover_data, imageformat=MP4Cover.FORMAT_JPEG)]
-            audio.save()
-            
-        elif filepath.lower().endswith('.flac'):
-            audio = FLAC(filepath)
-            audio['title'] = track_name
-            if artist_name: audio['artist'] = artist_name
-            if album_name: audio['album'] = album_name
-            if cover_data:
-                pic = Picture()
-                pic.type = 3
-                pic.mime = 'image/jpeg'
-                pic.desc = 'Cover'
-                pic.data = cover_data
-                audio.clear_pictures()
-                audio.add_picture(pic)
-            audio.save()
+        txn.set(title=track_name, artist=artist_name, album=album_name)
+        txn.set_cover(cover_data)
+        txn.stage("itunes" if itunes_found else "titulo")
+        if own_txn and not txn.commit():
+            return False
             
         if itunes_found:
             return True
@@ -0,0 +1,269 @@
+"""
+playlist_groups.py
+Expansão de playlists em jobs individuais.
+O job da playlist faz uma única extração plana (extract_flat) e enfileira cada faixa como
+um job próprio com group_id = id do job pai. Assim as faixas disputam slots do download_sem
+em paralelo, e uma faixa que falha não reinicia a playlist inteira na próxima estratégia.
+O job pai vira o agregador do grupo: progresso médio, contagem de concluídas/falhas e,
+quando a última faixa termina, o M3U gerado a partir dos arquivos que realmente foram baixados
+e o ReplayGain de álbum das faixas de áudio.
+As faixas concluídas vão para a tabela playlist_group_tracks enquanto o grupo está aberto: depois
+de um reinício, o grupo é remontado só com os filhos restaurados da fila, e o M3U e o ganho de
+álbum precisam também das faixas que terminaram antes dele.
+"""
+import os
+import time
+import asyncio
+import functools
+import ydl_pool
+from utils import get_downloads_dir, get_cookies_path
+from database import save_group_tracks, load_group_tracks, delete_group_tracks
+
+GROUP_POLL_INTERVAL = 1.0
+
+# Status finais de um job filho
+CHILD_DONE_STATUSES = ("done", "completed", "already_downloaded")
+CHILD_FINAL_STATUSES = CHILD_DONE_STATUSES + ("error", "timeout", "cancelled")
+
+# group_id -> {"children": {job_id: índice na playlist}, "finished": {job_id: (índice, título, arquivo)},
+#              "title": str, "organize_by_playlist": bool, "album_gain": bool,
+#              "expected": nº de faixas enquanto a expansão enfileira (None depois)}
+groups = {}
+
+# Gravações pendentes da playlist_group_tracks, feitas fora do event loop pelo group_monitor_loop
+_pending_tracks = []
+_closed_groups = []
+
+
+def _request_data(request) -> dict:
+    return request.dict() if hasattr(request, 'dict') else dict(vars(request))
+
+
+def expand_playlist(request) -> tuple:
+    """Extração plana da playlist (bloqueante). Retorna (título, id, [entradas])."""
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'ignoreerrors': True,
+        'cookiefile': getattr(request, 'cookies_path', None) or get_cookies_path(),
+    }
+    with ydl_pool.lease(opts) as ydl:
+        info = ydl.extract_info(request.url, download=False)
+    if not info:
+        raise Exception(f"Não foi possível ler a playlist: {request.url}")
+    entries = [e for e in (info.get('entries') or []) if e and (e.get('url') or e.get('id'))]
+    if not entries:
+        raise Exception(f"Playlist vazia ou indisponível: {request.url}")
+    return info.get('title') or 'Playlist', info.get('id'), entries
+
+
+def child_requests(group_id: str, request, playlist_title: str, playlist_id: str, entries: list) -> list:
+    """Um DownloadRequest por faixa, herdando as opções do pedido da playlist."""
+    base = _request_data(request)
+    children = []
+    for index, entry in enumerate(entries, start=1):
+        video_id = entry.get('id')
+        url = entry.get('url') or entry.get('webpage_url') or f"https://www.youtube.com/watch?v={video_id}"
+        if not url.startswith('http') and video_id:
+            url = f"https://www.youtube.com/watch?v={video_id}"
+        data = dict(base)
+        data.update({
+            'url': url,
+            'playlist': False,
+            'playlist_id': base.get('playlist_id') or playlist_id,
+            'video_id': video_id,
+            'title': entry.get('title'),
+            'priority': None,
+            'group_id': group_id,
+            'playlist_title': playlist_title,
+            'playlist_index': index,
+        })
+        children.append(type(request)(**data))
+    return children
+
+
+def _group(group_id: str, request) -> dict:
+    group = groups.get(group_id)
+    if group is None:
+        group = groups[group_id] = {
+            "children": {},
+            # Faixas que terminaram antes de um reinício (vazio numa playlist nova)
+            "finished": {row["job_id"]: (row["playlist_index"], row["title"], row["filename"])
+                         for row in load_group_tracks(group_id)},
+            "title": getattr(request, 'playlist_title', None) or 'Playlist',
+            "organize_by_playlist": getattr(request, 'organize_by_playlist', False),
+            "album_gain": getattr(request, 'album_gain', True) and getattr(request, 'mode', 'audio') != 'video',
+            "expected": None,
+        }
+    return group
+
+
+def open_group(group_id: str, children: list):
+    """
+    Chamado pelo expand_playlist_job antes de enfileirar as faixas: enquanto a expansão não termina
+    (expansion_done), o grupo só fecha quando len(children) faixas terminarem. Sem isso, faixas que
+    já estão no disco terminam na hora e o grupo fecharia com as poucas registradas até então.
+    """
+    _group(group_id, children[0])["expected"] = len(children)
+
+
+def expansion_done(group_id: str):
+    """Todas as faixas registradas (faixas repetidas na playlist contam uma vez só): vale o que foi registrado."""
+    group = groups.get(group_id)
+    if group: group["expected"] = None
+
+
+def register_child(group_id: str, job_id: str, request):
+    """Chamado pelo enqueue_job (inclusive na restauração da fila persistente)."""
+    from downloader import jobs, JobState
+    group = _group(group_id, request)
+    group["children"][job_id] = getattr(request, 'playlist_index', None) or len(group["children"]) + 1
+
+    parent = jobs.get(group_id)
+    if parent is None:
+        # Pai perdido num reinício: recriado a partir dos filhos restaurados
+        parent = JobState(id=group_id, status="downloading", progress=0.0, created_at=time.time(),
+                          title=group["title"], playlist_id=getattr(request, 'playlist_id', None))
+        jobs[group_id] = parent
+    parent.children_total = max(len(group["children"]) + len(_restored(group)), group["expected"] or 0)
+
+
+def _restored(group: dict) -> list:
+    """job_ids concluídos antes do reinício que não voltaram para a fila."""
+    return [job_id for job_id in group["finished"] if job_id not in group["children"]]
+
+
+def cancel_group(group_id: str) -> int:
+    """Cancela as faixas ainda não finalizadas de um grupo."""
+    from downloader import jobs, download_queue
+    group = groups.get(group_id)
+    if not group: return 0
+    cancelled = 0
+    for job_id in group["children"]:
+        st = jobs.get(job_id)
+        if st and st.status not in CHILD_FINAL_STATUSES:
+            download_queue.remove(job_id)
+            st.status = "cancelled"
+            st.error = "Cancelado pelo usuário"
+            cancelled += 1
+    return cancelled
+
+
+def finished_files(group: dict) -> list:
+    """[(título, caminho absoluto)] das faixas concluídas (inclusive antes de um reinício), na ordem da playlist."""
+    from downloader import jobs
+    downloads_dir = get_downloads_dir()
+    tracks = dict(group["finished"])
+    for job_id, index in group["children"].items():
+        st = jobs.get(job_id)
+        if st and st.status in CHILD_DONE_STATUSES and st.filename:
+            tracks[job_id] = (index, st.title, st.filename)
+    files = []
+    for index, title, filename in sorted(tracks.values(), key=lambda track: track[0] or 0):
+        path = os.path.join(downloads_dir, filename)
+        if os.path.exists(path):
+            files.append((title or os.path.splitext(os.path.basename(path))[0], path))
+    return files
+
+
+def write_m3u(group: dict):
+    """M3U com os arquivos que realmente terminaram, na ordem da playlist."""
+    if not group["organize_by_playlist"]: return None
+    files = finished_files(group)
+    if not files: return None
+
+    playlist_dir = os.path.commonpath([os.path.dirname(p) for _, p in files])
+    safe_title = group["title"].replace('/', '_').replace('\\', '_')
+    m3u_path = os.path.join(playlist_dir, f"{safe_title}.m3u")
+    try:
+        with open(m3u_path, "w", encoding="utf-8") as f:
+            f.write("#EXTM3U\n")
+            for title, path in files:
+                f.write(f"#EXTINF:-1,{title}\n")
+                f.write(f"{os.path.relpath(path, playlist_dir)}\n")
+    except Exception as e:
+        print(f"  \033[33mWARN Erro ao gerar playlist M3U: {e}\033[0m")
+        return None
+    return m3u_path
+
+
+def update_groups():
+    from downloader import jobs
+    for group_id, group in list(groups.items()):
+        parent = jobs.get(group_id)
+        states = [jobs.get(job_id) for job_id in group["children"]]
+        if parent is None or not (states or group["expected"]):
+            groups.pop(group_id, None)
+            continue
+
+        for job_id, index in group["children"].items():
+            st = jobs.get(job_id)
+            if st and st.status in CHILD_DONE_STATUSES and st.filename and job_id not in group["finished"]:
+                group["finished"][job_id] = (index, st.title, st.filename)
+                _pending_tracks.append((group_id, job_id, index, st.title, st.filename))
+
+        restored = len(_restored(group))
+        # Durante a expansão, as faixas ainda não registradas contam como pendentes
+        total = max(len(states) + restored, group["expected"] or 0)
+        done = restored + sum(1 for st in states if st and st.status in CHILD_DONE_STATUSES)
+        final = restored + sum(1 for st in states if st is None or st.status in CHILD_FINAL_STATUSES)
+        progress = round((100.0 * restored + sum(100.0 if (st is None or st.status in CHILD_FINAL_STATUSES) else st.progress for st in states)) / total, 1)
+
+        if parent.progress != progress: parent.progress = progress
+        if parent.children_done != done: parent.children_done = done
+        if parent.children_failed != final - done: parent.children_failed = final - done
+
+        if final < total:
+            if parent.status not in ("downloading", "cancelled"): parent.status = "downloading"
+            continue
+
+        groups.pop(group_id, None)
+        _closed_groups.append(group_id)
+        write_m3u(group)
+        if parent.status != "cancelled" and done and group["album_gain"]:
+            # Ganho de álbum roda no postprocess_pool; o pai aparece em "processing" até terminar
+            import postprocess_pool
+            postprocess_pool.submit(group_id, None, functools.partial(apply_album_gain, group_id, group))
+            continue
+        if parent.status != "cancelled":
+            parent.status = "done" if done else "error"
+            if not done: parent.error = "Nenhuma faixa da playlist foi baixada"
+        parent.finished_at = time.time()
+
+
+def apply_album_gain(group_id: str, group: dict):
+    """ReplayGain de álbum sobre as faixas concluídas (os blocos medidos no download são reaproveitados)."""
+    from downloader import jobs
+    import replaygain
+    paths = [path for _, path in finished_files(group) if not path.lower().endswith('.mp4')]
+    try:
+        album = replaygain.apply_album(paths) if len(paths) > 1 else None
+        if album:
+            print(f"[Playlist] Ganho de álbum '{group['title']}': {album['integrated_lufs']:.1f} LUFS em {len(paths)} faixas")
+    except Exception as e:
+        print(f"[Playlist] Falha no ganho de álbum de '{group['title']}': {e}")
+    parent = jobs.get(group_id)
+    if parent and parent.status != "cancelled":
+        parent.status = "done"
+
+
+def flush_tracks():
+    """Grava as faixas concluídas e apaga as de grupos encerrados (roda numa thread)."""
+    rows, closed = list(_pending_tracks), list(_closed_groups)
+    del _pending_tracks[:len(rows)]
+    del _closed_groups[:len(closed)]
+    save_group_tracks(rows)
+    for group_id in closed:
+        delete_group_tracks(group_id)
+
+
+async def group_monitor_loop():
+    while True:
+        await asyncio.sleep(GROUP_POLL_INTERVAL)
+        try:
+            update_groups()
+            if _pending_tracks or _closed_groups:
+                await asyncio.to_thread(flush_tracks)
+        except Exception as e:
+            print(f"[PlaylistGroups] Erro ao atualizar grupos: {e}")
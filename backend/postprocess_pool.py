@@ -0,0 +1,88 @@
+"""
+postprocess_pool.py
+Fila e pool próprios para o pós-processamento dos downloads.
+O download_with_retries devolve o finalize_download assim que os bytes estão no disco; o
+worker_loop libera o slot do download_sem e entrega o job aqui. Conversão (FFmpegExtractAudio),
+medição de loudness para as tags ReplayGain/R128, capa, tags do iTunes e letra (Lrclib/Genius)
+rodam em MAX_WORKERS threads dimensionadas pelos núcleos da máquina, sem ocupar vagas de rede.
+"""
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import content_store
+import tag_transaction
+
+# ffmpeg roda em subprocesso: uma thread por núcleo basta para manter a CPU ocupada
+MAX_WORKERS = max(2, min(os.cpu_count() or 2, 8))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="postprocess")
+_queue = None
+_running = set()
+_stats = {"completed": 0, "failed": 0, "total_seconds": 0.0}
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    return _queue
+
+
+def submit(job_id: str, request, finalize):
+    """Enfileira o pós-processamento de um job (chamado no event loop pelo worker_loop)."""
+    from downloader import jobs
+    st = jobs.get(job_id)
+    if st:
+        st.status = "processing"
+        st.processing_state = "queued"
+    _get_queue().put_nowait((job_id, request, finalize))
+
+
+async def _worker():
+    from downloader import jobs
+    from database import mark_error_db
+    queue = _get_queue()
+    loop = asyncio.get_running_loop()
+    while True:
+        job_id, request, finalize = await queue.get()
+        st = jobs.get(job_id)
+        started = time.time()
+        try:
+            if st and st.status == "cancelled": continue
+            if st: st.processing_started_at = started
+            _running.add(job_id)
+            await loop.run_in_executor(_executor, finalize)
+            _stats["completed"] += 1
+        except Exception as e:
+            _stats["failed"] += 1
+            print(f"  \033[31mERR Falha no pós-processamento de {job_id}: {(str(e).splitlines() or [''])[0][:100]}\033[0m")
+            if st and st.status != "cancelled":
+                st.status = "error"
+                st.error = f"Falha no pós-processamento: {e}"
+                mark_error_db(getattr(request, 'playlist_id', None), getattr(request, 'video_id', None), "Postprocessing failed", st.error)
+        finally:
+            _running.discard(job_id)
+            _stats["total_seconds"] += time.time() - started
+            if st:
+                st.processing_state = None
+                if st.status in ("done", "error"):
+                    st.progress = 100.0
+                    st.finished_at = time.time()
+                await loop.run_in_executor(_executor, content_store.job_finished, job_id, st.status)
+            queue.task_done()
+
+
+def start():
+    for _ in range(MAX_WORKERS):
+        asyncio.create_task(_worker())
+
+
+def snapshot() -> dict:
+    return {
+        "workers": MAX_WORKERS,
+        "queued": _get_queue().qsize(),
+        "running": sorted(_running),
+        **{k: round(v, 2) if isinstance(v, float) else v for k, v in _stats.items()},
+        "tags": tag_transaction.snapshot(),
+    }
@@ -0,0 +1,240 @@
+"""
+process_backend.py
+Backend opcional que roda cada download (yt-dlp, hooks de progresso, clean_title, tags do mutagen)
+num pool de processos, fora do GIL do servidor FastAPI.
+O processo filho executa o mesmo `download_with_retries` e devolve pelo canal IPC:
+  - ("state", job_id, {campo: valor})     campos do JobState que o filho mudou, a cada 0.5 s
+  - ("strategy", None, (args, kwargs))    tentativas para o strategy_scoreboard do pai
+  - ("aimd", None, "success"|"rate_limited") sinais para o controlador de concorrência
+  - ("log", None, texto)                  stdout do filho para o visualizador de logs
+O filho parte de uma cópia do JobState do pai (título, playlist_id...) e só devolve o que mudou:
+o que o pai altera durante o download (coalesced, por exemplo) não é sobrescrito.
+O cancelamento vai no sentido contrário por um dict compartilhado (Manager).
+Os baldes do rate_limiter também moram no Manager (rate_limiter.SharedBuckets): pai e filhos
+reservam fichas do mesmo balde, então o ritmo por host continua global e os limites alterados
+em /api/settings valem para os filhos já em execução.
+Builds congelados (PyInstaller) e Android continuam no backend de threads.
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import multiprocessing
+from types import SimpleNamespace
+from dataclasses import asdict
+from multiprocessing.managers import SyncManager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import rate_limiter
+
+# Campos que o pai mantém e o filho não pode sobrescrever
+PARENT_OWNED_FIELDS = ("id", "created_at", "priority", "group_id")
+
+_pool = None
+_manager = None
+_channel = None
+_cancel_flags = None
+_shared_buckets = None
+_listener = None
+_pool_lock = threading.Lock()
+
+
+class _Manager(SyncManager):
+    pass
+
+
+_Manager.register('SharedBuckets', rate_limiter.SharedBuckets)
+
+
+def is_supported() -> bool:
+    if getattr(sys, 'frozen', False):
+        return False
+    try:
+        from com.chaquo.python import Python
+        return False
+    except:
+        return True
+
+
+# ---------------------------------------------------------------- processo filho
+
+class _ChannelWriter:
+    """stdout do filho: tudo que seria impresso vai para o pai, que imprime pelo LogInterceptor."""
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, text):
+        if text: self.channel.put(("log", None, text))
+
+    def flush(self):
+        pass
+
+
+class _ForwardingLimiter:
+    """Substitui o AIMDLimiter no filho: os sinais são aplicados no limitador do pai."""
+    def __init__(self, channel):
+        self.channel = channel
+
+    def on_success(self):
+        self.channel.put(("aimd", None, "success"))
+
+    def on_rate_limited(self):
+        self.channel.put(("aimd", None, "rate_limited"))
+
+
+def _init_child(channel, cancel_flags, shared_buckets):
+    global _channel, _cancel_flags
+    _channel = channel
+    _cancel_flags = cancel_flags
+    sys.stdout = _ChannelWriter(channel)
+    sys.stderr = _ChannelWriter(channel)
+    rate_limiter.share(shared_buckets)
+    import downloader
+    import strategy_scoreboard
+    downloader.download_sem = _ForwardingLimiter(channel)
+    strategy_scoreboard.record = lambda *args, **kwargs: channel.put(("strategy", None, (args, kwargs)))
+
+
+def _changes(st, baseline: dict) -> dict:
+    """Campos do JobState diferentes do último envio; atualiza `baseline`."""
+    state = asdict(st)
+    changed = {key: value for key, value in state.items() if baseline.get(key) != value}
+    baseline.update(changed)
+    return changed
+
+
+def _run_job_in_child(job_id: str, request_data: dict, watchdog_config: dict, parent_state: dict) -> dict:
+    import downloader
+    import strategy_scoreboard
+    import stall_watchdog
+    from downloader import jobs, JobState, download_with_retries
+
+    # O pai persiste as tentativas no banco; relê a janela para ordenar com dados frescos
+    strategy_scoreboard.reload()
+    # Janelas do vigia de travamentos configuradas no pai (o vigia roda no filho, junto do hook)
+    stall_watchdog.configure(**watchdog_config)
+
+    baseline = dict(parent_state)
+    st = JobState(**{**parent_state, "status": "running", "started_at": time.time()})
+    jobs[job_id] = st
+    stop = threading.Event()
+
+    def pump():
+        while not stop.wait(0.5):
+            if _cancel_flags.get(job_id): st.status = "cancelled"
+            changed = _changes(st, baseline)
+            if changed: _channel.put(("state", job_id, changed))
+
+    pump_thread = threading.Thread(target=pump, daemon=True)
+    pump_thread.start()
+    try:
+        # O filho já está fora do GIL do servidor: o pós-processamento roda ali mesmo
+        finalize = download_with_retries(job_id, SimpleNamespace(**request_data))
+        if finalize: finalize()
+    finally:
+        stop.set()
+        pump_thread.join()
+        jobs.pop(job_id, None)
+    return _changes(st, baseline)
+
+
+# ---------------------------------------------------------------- processo pai
+
+def _apply_state(job_id: str, state: dict):
+    from downloader import jobs
+    st = jobs.get(job_id)
+    if not st or st.status == "cancelled": return
+    for key, value in state.items():
+        if key in PARENT_OWNED_FIELDS: continue
+        setattr(st, key, value)
+
+
+def _listen(channel):
+    import downloader
+    import strategy_scoreboard
+    while True:
+        try:
+            kind, job_id, payload = channel.get()
+        except (EOFError, OSError):
+            return
+        try:
+            if kind == "state":
+                _apply_state(job_id, payload)
+            elif kind == "strategy":
+                args, kwargs = payload
+                strategy_scoreboard.record(*args, **kwargs)
+            elif kind == "aimd":
+                if payload == "success": downloader.download_sem.on_success()
+                else: downloader.download_sem.on_rate_limited()
+            elif kind == "log":
+                sys.stdout.write(payload)
+        except Exception as e:
+            print(f"[process_backend] Erro ao aplicar mensagem {kind}: {e}")
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    global _pool, _manager, _channel, _cancel_flags, _shared_buckets, _listener
+    with _pool_lock:
+        if _pool is None:
+            ctx = multiprocessing.get_context("spawn")
+            if _manager is None:
+                _manager = _Manager(ctx=ctx)
+                _manager.start()
+                _cancel_flags = _manager.dict()
+                # Baldes com a configuração atual; daí em diante o pai também reserva por eles
+                _shared_buckets = _manager.SharedBuckets(rate_limiter.get_config())
+                rate_limiter.share(_shared_buckets)
+                _channel = ctx.Queue()
+                _listener = threading.Thread(target=_listen, args=(_channel,), daemon=True, name="process-backend-ipc")
+                _listener.start()
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, initializer=_init_child,
+                                        initargs=(_channel, _cancel_flags, _shared_buckets))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def shutdown():
+    _reset_pool()
+
+
+def _request_to_dict(request) -> dict:
+    if hasattr(request, 'dict'): return request.dict()
+    return dict(vars(request))
+
+
+async def run_in_process(job_id: str, request, max_workers: int):
+    from downloader import jobs
+    pool = _get_pool(max_workers)
+    loop = asyncio.get_running_loop()
+    import stall_watchdog
+    st = jobs.get(job_id)
+    parent_state = asdict(st) if st else {"id": job_id, "status": "queued", "progress": 0.0}
+    future = loop.run_in_executor(pool, _run_job_in_child, job_id, _request_to_dict(request), stall_watchdog.get_config(),
+                                  parent_state)
+    try:
+        while True:
+            done, _ = await asyncio.wait([future], timeout=0.5)
+            if done: break
+            if st and st.status == "cancelled":
+                _cancel_flags[job_id] = True
+        _apply_state(job_id, future.result())
+    except asyncio.CancelledError:
+        # Timeout do worker_loop: o filho não pode ser interrompido à força, então pede cancelamento
+        _cancel_flags[job_id] = True
+        raise
+    except BrokenProcessPool:
+        _reset_pool()
+        raise Exception("O processo de download foi encerrado inesperadamente.")
+    finally:
+        if not future.done():
+            future.add_done_callback(lambda _f: _cancel_flags.pop(job_id, None))
+        else:
+            _cancel_flags.pop(job_id, None)
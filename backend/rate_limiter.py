@@ -0,0 +1,252 @@
+"""
+rate_limiter.py
+Limitador global por host (token bucket) consultado por TODAS as instâncias do YoutubeDL.
+Substitui o sleep_interval/sleep_requests fixo de cada job: em vez de cada download dormir
+6-25 s às cegas, cada requisição HTTP pega uma ficha do balde do host. Enquanto estamos longe
+do limite não há espera nenhuma; quando o YouTube responde 429, o balde daquele host
+desacelera sozinho e volta ao normal aos poucos.
+No backend de processos (process_backend.py) os baldes moram no processo do Manager
+(SharedBuckets): o pai e todos os filhos pegam fichas do mesmo balde, e as mudanças de
+configuração valem para todos na hora.
+"""
+import time
+import threading
+from urllib.parse import urlparse
+
+# rate = fichas por segundo, burst = tamanho do balde.
+# A chave é o sufixo do host; o sufixo mais específico vence (music.youtube.com antes de youtube.com).
+DEFAULT_BUCKETS = {
+    "youtube.com":       {"rate": 2.0,  "burst": 10},
+    "music.youtube.com": {"rate": 2.0,  "burst": 10},
+    "googlevideo.com":   {"rate": 20.0, "burst": 60},
+    "ytimg.com":         {"rate": 10.0, "burst": 30},
+    "soundcloud.com":    {"rate": 2.0,  "burst": 10},
+    "sndcdn.com":        {"rate": 20.0, "burst": 60},
+    "default":           {"rate": 10.0, "burst": 30},
+}
+
+# Penalidade adaptativa: 429 divide a taxa pela metade; cada sucesso recupera 5%.
+PENALTY_FACTOR = 0.5
+RECOVERY_FACTOR = 1.05
+MIN_RATE_FACTOR = 0.05
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.factor = 1.0
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate * self.factor)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Reserva uma ficha e devolve quantos segundos esperar antes de usá-la."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            self.requests += 1
+            wait = -self.tokens / (self.rate * self.factor) if self.tokens < 0 else 0.0
+            self.waited += wait
+        return wait
+
+    def acquire(self):
+        """Reserva uma ficha e dorme o necessário (fora do lock) para respeitar a taxa."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def penalize(self):
+        with self._lock:
+            self.factor = max(MIN_RATE_FACTOR, self.factor * PENALTY_FACTOR)
+            self.throttled += 1
+
+    def reward(self):
+        if self.factor >= 1.0: return
+        with self._lock:
+            self.factor = min(1.0, self.factor * RECOVERY_FACTOR)
+
+    def configure(self, rate: float = None, burst: int = None):
+        with self._lock:
+            self._refill(time.monotonic())
+            if rate is not None: self.rate = max(0.01, float(rate))
+            if burst is not None:
+                self.burst = max(1, int(burst))
+                self.tokens = min(self.tokens, self.burst)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "effective_rate": round(self.rate * self.factor, 3),
+                "tokens": round(self.tokens, 2),
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "total_wait_seconds": round(self.waited, 2),
+            }
+
+
+class SharedBuckets:
+    """
+    Baldes servidos pelo Manager do process_backend. Só reserva: quem pediu a ficha dorme no
+    próprio processo, então uma espera longa não segura o Manager.
+    """
+    def __init__(self, config: dict):
+        self.buckets = {name: TokenBucket(cfg["rate"], cfg["burst"]) for name, cfg in config.items()}
+
+    def _bucket(self, name: str) -> TokenBucket:
+        return self.buckets.get(name) or self.buckets["default"]
+
+    def reserve(self, name: str) -> float:
+        return self._bucket(name).reserve()
+
+    def penalize(self, name: str):
+        self._bucket(name).penalize()
+
+    def reward(self, name: str):
+        self._bucket(name).reward()
+
+    def configure(self, settings: dict) -> dict:
+        _configure(self.buckets, settings)
+        return self.get_config()
+
+    def get_config(self) -> dict:
+        return {name: {"rate": b.rate, "burst": b.burst} for name, b in self.buckets.items()}
+
+    def snapshot(self) -> dict:
+        return {name: b.snapshot() for name, b in self.buckets.items()}
+
+
+_buckets = {name: TokenBucket(cfg["rate"], cfg["burst"]) for name, cfg in DEFAULT_BUCKETS.items()}
+# Proxy de SharedBuckets quando o backend de processos está ativo (None = baldes locais)
+_shared = None
+_installed = False
+
+
+def bucket_name_for(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    matches = [n for n in list(_buckets) if n != "default" and (host == n or host.endswith("." + n))]
+    return max(matches, key=len) if matches else "default"
+
+
+def _request_url(req) -> str:
+    if isinstance(req, str): return req
+    if hasattr(req, "url"): return req.url
+    if hasattr(req, "get_full_url"): return req.get_full_url()
+    return ""
+
+
+def share(shared):
+    """
+    Passa a pegar as fichas nos baldes compartilhados (pai ao criar o pool, filhos no initializer).
+    Os baldes locais ficam só com os nomes (para bucket_name_for) e como reserva se o Manager cair.
+    """
+    global _shared
+    _configure(_buckets, shared.get_config())
+    _shared = shared
+
+
+def _acquire(name: str):
+    if _shared is not None:
+        try:
+            wait = _shared.reserve(name)
+            if wait > 0: time.sleep(wait)
+            return
+        except Exception:
+            pass  # Manager encerrado: segue com o balde local
+    _buckets[name].acquire()
+
+
+def _signal(name: str, method: str):
+    if _shared is not None:
+        try:
+            return getattr(_shared, method)(name)
+        except Exception:
+            pass
+    getattr(_buckets[name], method)()
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """HTTP 429 pelo status (HTTPError do yt-dlp/urllib) ou pela mensagem "HTTP Error 429" do yt-dlp, inclusive embrulhado."""
+    seen = 0
+    while error is not None and seen < 5:
+        if getattr(error, "status", None) == 429 or getattr(error, "code", None) == 429: return True
+        if "HTTP Error 429" in str(error): return True
+        error = getattr(error, "cause", None) or error.__cause__
+        seen += 1
+    return False
+
+
+def install():
+    """
+    Faz o YoutubeDL.urlopen passar pelo limitador. Extratores, downloader HTTP e fragmentos
+    DASH/HLS usam ydl.urlopen, então toda instância (downloads, /search, /info, rádio,
+    assinaturas) compartilha os mesmos baldes. Idempotente.
+    """
+    global _installed
+    if _installed: return
+    import yt_dlp
+    original_urlopen = yt_dlp.YoutubeDL.urlopen
+
+    def urlopen(self, req):
+        name = bucket_name_for(_request_url(req))
+        _acquire(name)
+        try:
+            res = original_urlopen(self, req)
+        except Exception as e:
+            if is_rate_limited(e):
+                _signal(name, "penalize")
+            raise
+        _signal(name, "reward")
+        return res
+
+    yt_dlp.YoutubeDL.urlopen = urlopen
+    _installed = True
+
+
+def _configure(buckets: dict, settings: dict):
+    for name, cfg in (settings or {}).items():
+        if not isinstance(cfg, dict): continue
+        if name not in buckets:
+            buckets[name] = TokenBucket(cfg.get("rate", DEFAULT_BUCKETS["default"]["rate"]), cfg.get("burst", DEFAULT_BUCKETS["default"]["burst"]))
+        else:
+            buckets[name].configure(cfg.get("rate"), cfg.get("burst"))
+
+
+def configure(settings: dict) -> dict:
+    """Atualiza baldes em tempo de execução: {"youtube.com": {"rate": 1, "burst": 5}, ...}."""
+    _configure(_buckets, settings)
+    if _shared is not None:
+        try:
+            _shared.configure(settings)
+        except Exception as e:
+            print(f"[RateLimiter] Baldes compartilhados indisponíveis: {e}")
+    return get_config()
+
+
+def get_config() -> dict:
+    if _shared is not None:
+        try:
+            return _shared.get_config()
+        except Exception:
+            pass
+    return {name: {"rate": b.rate, "burst": b.burst} for name, b in _buckets.items()}
+
+
+def snapshot() -> dict:
+    if _shared is not None:
+        try:
+            return _shared.snapshot()
+        except Exception:
+            pass
+    return {name: b.snapshot() for name, b in _buckets.items()}
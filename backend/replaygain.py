@@ -0,0 +1,120 @@
+"""
+replaygain.py
+Loudness como metadado em vez de loudnorm aplicado no áudio.
+O volume do arquivo não é alterado: mede-se a loudness integrada (EBU R128) e o pico, e o
+player aplica o ganho a partir das tags ReplayGain 2.0 (MP3/M4A/FLAC) ou R128_*_GAIN
+(Opus, RFC 7845). Playlists inteiras também recebem o ganho de álbum (apply_album).
+"""
+import os
+import re
+import subprocess
+from utils import get_base_dir
+
+# ReplayGain 2.0 usa -18 LUFS como referência; o R128_*_GAIN do Opus usa -23 LUFS em Q7.8
+REPLAYGAIN_REFERENCE_LUFS = -18.0
+R128_REFERENCE_LUFS = -23.0
+
+
+def ffmpeg_binary() -> str:
+    ffmpeg_path = os.path.join(get_base_dir(), "ffmpeg.exe")
+    if not os.path.exists(ffmpeg_path):
+        ffmpeg_path = "ffmpeg"  # Fallback to system ffmpeg
+    return ffmpeg_path
+
+
+def analyze(path: str) -> dict:
+    """Loudness integrada e true peak pelo motor NumPy (loudness.py); sem NumPy, pelo ebur128 do ffmpeg."""
+    try:
+        import loudness
+    except ImportError:
+        return analyze_ffmpeg(path)
+    return loudness.analyze(path)
+
+
+def analyze_ffmpeg(path: str) -> dict:
+    """
+    Mede loudness integrada e true peak com o filtro ebur128 do ffmpeg (só decodifica, sem encode).
+    Retorna {"integrated_lufs": float, "true_peak_dbtp": float}.
+    """
+    cmd = [ffmpeg_binary(), "-hide_banner", "-nostats", "-i", path, "-map", "0:a:0",
+           "-af", "ebur128=peak=true", "-f", "null", "-"]
+    flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+    proc = subprocess.run(cmd, capture_output=True, text=True, errors="replace", creationflags=flags)
+    # O resumo fica no fim do stderr: "I: -14.2 LUFS" ... "Peak: -0.4 dBFS"
+    summary = proc.stderr[proc.stderr.rfind("Summary:"):]
+    integrated = re.search(r"I:\s*(-?[\d.]+|-inf)\s*LUFS", summary)
+    peak = re.search(r"Peak:\s*(-?[\d.]+|-inf)\s*dBFS", summary)
+    if proc.returncode != 0 or not integrated:
+        raise Exception(f"ffmpeg ebur128 falhou para {os.path.basename(path)}")
+    lufs = float(integrated.group(1)) if integrated.group(1) != "-inf" else -70.0
+    true_peak = float(peak.group(1)) if peak and peak.group(1) != "-inf" else -70.0
+    return {"integrated_lufs": lufs, "true_peak_dbtp": true_peak}
+
+
+def _gain_str(gain_db: float) -> str:
+    return f"{gain_db:+.2f} dB"
+
+
+def _peak_str(peak_dbtp: float) -> str:
+    return f"{10 ** (peak_dbtp / 20.0):.6f}"
+
+
+def _r128_q78(lufs: float) -> str:
+    value = int(round((R128_REFERENCE_LUFS - lufs) * 256))
+    return str(max(-32768, min(32767, value)))
+
+
+def stage_tags(txn, track: dict, album: dict = None):
+    """Registra as tags de ganho do formato do arquivo numa TagTransaction. `track`/`album` vêm de analyze()."""
+    ext = txn.ext
+    scopes = [("TRACK", track)] + ([("ALBUM", album)] if album else [])
+
+    if ext not in ('.mp3', '.m4a', '.mp4', '.aac', '.flac', '.ogg', '.opus'):
+        raise Exception(f"Formato sem suporte a ReplayGain: {ext}")
+
+    if ext in ('.opus', '.ogg'):
+        from mutagen import File
+        from mutagen.oggopus import OggOpus
+        if ext == '.opus' or isinstance(File(txn.path), OggOpus):
+            # RFC 7845: Opus não usa REPLAYGAIN_*, só R128_*_GAIN relativo ao output gain
+            for scope, data in scopes:
+                txn.set_custom(f"R128_{scope}_GAIN", _r128_q78(data["integrated_lufs"]))
+            txn.stage("replaygain")
+            return
+
+    for scope, data in scopes:
+        txn.set_custom(f"REPLAYGAIN_{scope}_GAIN", _gain_str(REPLAYGAIN_REFERENCE_LUFS - data["integrated_lufs"]))
+        txn.set_custom(f"REPLAYGAIN_{scope}_PEAK", _peak_str(data["true_peak_dbtp"]))
+    txn.stage("replaygain")
+
+
+def write_tags(path: str, track: dict, album: dict = None):
+    """Grava as tags de ganho do formato do arquivo. `track`/`album` vêm de analyze()."""
+    from tag_transaction import TagTransaction
+    txn = TagTransaction(path)
+    stage_tags(txn, track, album)
+    if not txn.commit():
+        raise Exception(f"Falha ao gravar ReplayGain em {os.path.basename(path)}")
+
+
+def apply(path: str, txn=None) -> dict:
+    """Analisa e grava o ganho de faixa (ou só registra em `txn`). Retorna a análise."""
+    track = analyze(path)
+    if txn is not None:
+        stage_tags(txn, track)
+    else:
+        write_tags(path, track)
+    return track
+
+
+def apply_album(paths: list) -> dict:
+    """Ganho de faixa + álbum para um grupo de arquivos (playlist). Sem NumPy, só o de faixa."""
+    try:
+        import loudness
+    except ImportError:
+        for path in paths: apply(path)
+        return None
+    tracks, album = loudness.analyze_album(paths)
+    for path, track in tracks.items():
+        write_tags(path, track, album)
+    return album
@@ -1,16 +1,14 @@
 import asyncio
 import os
-import aiohttp
+import cover_cache
+import tag_padding
 from shazamio import Shazam
 from mutagen.mp3 import MP3
 from mutagen.id3 import ID3, TIT2, TPE1, TCON, APIC, error
 
 async def _download_image(url: str) -> bytes:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                return await response.read()
-    return None
+    # Square JPEG from the shared cover cache (same cover across tracks is fetched once)
+    return await asyncio.to_thread(cover_cache.get, url, 1000)
 
 async def fix_mp3_metadata(file_path: str) -> dict:
     if not os.path.exists(file_path) or not file_path.lower().endswith(".mp3"):
@@ -61,7 +59,7 @@ async def fix_mp3_metadata(file_path: str) -> dict:
                 data=img_data
             ))
 
-    audio.save()
+    audio.save(padding=tag_padding.policy)
     
     return {
         "success": True, 
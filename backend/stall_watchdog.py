@@ -0,0 +1,244 @@
+"""
+stall_watchdog.py
+Vigia de downloads travados, alimentado pelo local_progress_hook (e, nos downloads por trecho,
+que o ffmpeg faz sem hooks de progresso, pelo SectionProbe do downloader).
+Cada tentativa de download é "armada" aqui; o hook informa os bytes recebidos e o vigia mede
+bytes/s numa janela deslizante. Sem nenhum byte novo por STALL_WINDOW segundos (ou sem o
+primeiro byte em STARTUP_WINDOW), a tentativa é marcada como travada e o próximo hook levanta
+StallError: o download_with_retries passa para a próxima estratégia.
+Se nem o hook volta (leitura presa no socket), depois de HANG_GRACE o job vira "hung" e o
+worker_loop abandona a tentativa e recoloca o job na fila. O timeout de 4 horas do worker_loop
+fica só como última barreira.
+"""
+import time
+import threading
+from collections import deque
+
+# Segundos sem nenhum byte novo antes de abortar a tentativa
+STALL_WINDOW = 60.0
+# Extração + primeiro byte (inclui esperas do rate_limiter e cliques de estratégia lenta)
+STARTUP_WINDOW = 180.0
+# Tempo extra esperando o hook voltar depois de marcar o travamento
+HANG_GRACE = 30.0
+# Vezes que um job travado pode voltar para a fila antes de virar erro
+MAX_REQUEUES = 2
+
+CHECK_INTERVAL = 1.0
+
+
+class StallError(Exception):
+    def __init__(self, cause: str, message: str):
+        super().__init__(message)
+        self.cause = cause
+
+
+def is_stall(error) -> bool:
+    """StallError direto ou embrulhado pelo yt-dlp (DownloadError guarda o original em exc_info)."""
+    for _ in range(5):
+        if error is None: return False
+        if isinstance(error, StallError): return True
+        exc_info = getattr(error, 'exc_info', None)
+        error = exc_info[1] if exc_info else (error.__cause__ or error.__context__)
+    return False
+
+
+class _Watch:
+    def __init__(self, token: int):
+        now = time.monotonic()
+        self.token = token
+        self.armed_at = now
+        self.last_bytes = None
+        self.last_progress_at = None
+        self.last_hook_at = now
+        self.paused = False
+        self.cause = None
+        self.flagged_at = None
+        self.samples = deque()
+
+
+_watches = {}
+# Tokens de tentativas abandonadas pelo worker_loop (únicos, nunca reaproveitados)
+_abandoned_tokens = set()
+_lock = threading.Lock()
+_local = threading.local()
+_next_token = 0
+_monitor = None
+_stats = {"armed": 0, "stalls": 0, "hung": 0}
+
+
+def configure(window: float = None, startup_window: float = None, hang_grace: float = None, max_requeues: int = None) -> dict:
+    """Atualiza os limites em tempo de execução (API de settings e startup)."""
+    global STALL_WINDOW, STARTUP_WINDOW, HANG_GRACE, MAX_REQUEUES
+    if window is not None:
+        STALL_WINDOW = max(10.0, min(3600.0, float(window)))
+    if startup_window is not None:
+        STARTUP_WINDOW = max(30.0, min(3600.0, float(startup_window)))
+    if hang_grace is not None:
+        HANG_GRACE = max(5.0, min(600.0, float(hang_grace)))
+    if max_requeues is not None:
+        MAX_REQUEUES = max(0, min(10, int(max_requeues)))
+    return get_config()
+
+
+def get_config() -> dict:
+    return {"window": STALL_WINDOW, "startup_window": STARTUP_WINDOW, "hang_grace": HANG_GRACE, "max_requeues": MAX_REQUEUES}
+
+
+def arm(job_id: str):
+    """Início de uma tentativa (na thread que vai rodar o yt-dlp)."""
+    global _next_token
+    with _lock:
+        _next_token += 1
+        token = _next_token
+        _watches[job_id] = _Watch(token)
+        _stats["armed"] += 1
+    _local.token = token
+    _ensure_monitor()
+    from downloader import jobs
+    st = jobs.get(job_id)
+    if st and st.stalled: st.stalled = None
+
+
+def disarm(job_id: str):
+    with _lock:
+        watch = _watches.get(job_id)
+        if watch and watch.token == getattr(_local, 'token', None):
+            _watches.pop(job_id, None)
+
+
+def abandon(job_id: str):
+    """O worker_loop desistiu da thread presa: qualquer hook ou retorno dela passa a ser ignorado."""
+    with _lock:
+        watch = _watches.pop(job_id, None)
+        if watch: _abandoned_tokens.add(watch.token)
+
+
+def current_token():
+    """Token da tentativa desta thread (para threads auxiliares herdarem via bind)."""
+    return getattr(_local, 'token', None)
+
+
+def bind(token):
+    """Thread auxiliar de uma tentativa (SectionProbe) passa a ser cortada junto com ela se for abandonada."""
+    _local.token = token
+
+
+def abandoned() -> bool:
+    """True na thread de uma tentativa abandonada (o job pode já estar rodando de novo em outra thread)."""
+    with _lock:
+        return getattr(_local, 'token', None) in _abandoned_tokens
+
+
+def feed(job_id: str, d: dict):
+    """
+    Chamado pelo local_progress_hook. Levanta StallError se a tentativa travou ou foi abandonada.
+    A tentativa é achada pelo job_id: o FragmentFD do yt-dlp chama os hooks das threads do seu
+    ThreadPoolExecutor (HLS/DASH), que nunca passaram pelo arm(). O token da thread só serve para
+    cortar a thread de uma tentativa abandonada.
+    """
+    now = time.monotonic()
+    with _lock:
+        if getattr(_local, 'token', None) in _abandoned_tokens:
+            raise StallError("abandoned", "Tentativa abandonada pelo vigia de travamentos")
+        watch = _watches.get(job_id)
+        if watch is None: return
+        watch.last_hook_at = now
+        if d.get('status') == 'finished':
+            # Merge/ffmpeg do yt-dlp depois do download não recebe bytes: não conta como travamento
+            watch.paused = True
+            return
+        watch.paused = False
+        if watch.cause:
+            raise StallError(watch.cause, _message(watch.cause))
+        downloaded = d.get('downloaded_bytes')
+        if downloaded is None: return
+        if watch.last_bytes is None or downloaded > watch.last_bytes:
+            watch.last_bytes = downloaded
+            watch.last_progress_at = now
+        watch.samples.append((now, downloaded))
+        while watch.samples and now - watch.samples[0][0] > STALL_WINDOW:
+            watch.samples.popleft()
+
+
+def throughput(job_id: str) -> float:
+    """Bytes/s da tentativa atual na janela STALL_WINDOW."""
+    with _lock:
+        watch = _watches.get(job_id)
+        if not watch or len(watch.samples) < 2: return 0.0
+        (t0, b0), (t1, b1) = watch.samples[0], watch.samples[-1]
+    return max(0.0, (b1 - b0) / (t1 - t0)) if t1 > t0 else 0.0
+
+
+def _message(cause: str) -> str:
+    if cause == "no_first_byte":
+        return f"Nenhum byte recebido em {STARTUP_WINDOW:.0f}s (download travado)"
+    if cause == "hung":
+        return f"Download preso sem resposta por {STALL_WINDOW + HANG_GRACE:.0f}s"
+    return f"Vazão zero por {STALL_WINDOW:.0f}s (download travado)"
+
+
+def _stall_cause(watch: _Watch, now: float):
+    if watch.paused: return None
+    if watch.last_progress_at is None:
+        return "no_first_byte" if now - watch.armed_at > STARTUP_WINDOW else None
+    return "zero_throughput" if now - watch.last_progress_at > STALL_WINDOW else None
+
+
+def _record(job_id: str, cause: str):
+    from downloader import jobs
+    st = jobs.get(job_id)
+    if not st: return
+    if cause != "hung": st.stalls += 1  # "hung" é a escalada do mesmo travamento
+    st.stall_causes = {**st.stall_causes, cause: st.stall_causes.get(cause, 0) + 1}
+    st.stalled = cause
+    st.speed_str = "Travado, trocando de método..." if cause != "hung" else "Travado, voltando para a fila..."
+
+
+def check():
+    """Uma passada sobre as tentativas armadas (thread do monitor)."""
+    now = time.monotonic()
+    events = []
+    with _lock:
+        for job_id, watch in _watches.items():
+            if watch.cause is None:
+                cause = _stall_cause(watch, now)
+                if cause:
+                    watch.cause = cause
+                    watch.flagged_at = now
+                    _stats["stalls"] += 1
+                    events.append((job_id, cause))
+            elif watch.cause != "hung" and watch.last_hook_at < watch.flagged_at and now - watch.flagged_at > HANG_GRACE:
+                # O hook não voltou desde a marcação: a thread está presa dentro do yt-dlp
+                watch.cause = "hung"
+                _stats["hung"] += 1
+                events.append((job_id, "hung"))
+    for job_id, cause in events:
+        print(f"  \033[33mWARN [Vigia] Job {job_id[:8]}: {_message(cause)}\033[0m")
+        _record(job_id, cause)
+
+
+def _monitor_loop():
+    while True:
+        time.sleep(CHECK_INTERVAL)
+        try:
+            check()
+        except Exception as e:
+            print(f"[Vigia] Erro ao verificar travamentos: {e}")
+
+
+def _ensure_monitor():
+    global _monitor
+    with _lock:
+        if _monitor is None:
+            _monitor = threading.Thread(target=_monitor_loop, daemon=True, name="stall-watchdog")
+            _monitor.start()
+
+
+def snapshot() -> dict:
+    with _lock:
+        active = {job_id: {"cause": w.cause, "paused": w.paused,
+                           "idle_seconds": round(time.monotonic() - (w.last_progress_at or w.armed_at), 1)}
+                  for job_id, w in _watches.items()}
+    for job_id in active:
+        active[job_id]["bytes_per_second"] = round(throughput(job_id), 1)
+    return {**get_config(), **_stats, "active": active}
@@ -0,0 +1,113 @@
+"""
+strategy_scoreboard.py
+Placar das estratégias de download do `download_with_retries`.
+Registra sucesso, classe de falha e latência de cada tentativa numa janela deslizante
+(persistida em downloads.db) e reordena a lista de estratégias para cada job novo,
+colocando primeiro o cliente que está funcionando agora.
+"""
+import time
+import threading
+from collections import defaultdict, deque
+from database import record_strategy_event, get_strategy_events
+
+# Janela deslizante: últimas N tentativas por estratégia, nunca mais velhas que WINDOW_SECONDS
+WINDOW_SECONDS = 6 * 3600
+WINDOW_SIZE = 30
+# A cada N tentativas gravadas, o banco perde as linhas mais velhas que a janela
+PRUNE_EVERY = 200
+
+# Estratégias que trocam a fonte (busca no YT Music, Invidious), rebaixam o formato
+# ou passam por proxies nunca são promovidas: continuam no fim da fila na ordem original.
+PINNED_KEYS = ("format", "use_ytmusic_search", "use_invidious", "use_proxy")
+
+_events = defaultdict(lambda: deque(maxlen=WINDOW_SIZE))
+_lock = threading.Lock()
+_loaded = False
+_recorded = 0
+
+
+def _ensure_loaded():
+    global _loaded
+    if _loaded: return
+    with _lock:
+        if _loaded: return
+        for row in get_strategy_events(time.time() - WINDOW_SECONDS):
+            _events[row["strategy"]].append((row["created_at"], bool(row["ok"]), row["error_class"], row["latency"] or 0.0))
+        _loaded = True
+
+
+def reload():
+    """Descarta o estado em memória e relê a janela do banco (usado pelos processos filhos)."""
+    global _loaded
+    with _lock:
+        _events.clear()
+        _loaded = False
+    _ensure_loaded()
+
+
+def _window(name: str, now: float) -> list:
+    return [e for e in _events.get(name, ()) if now - e[0] <= WINDOW_SECONDS]
+
+
+def record(name: str, ok: bool, latency: float, error_class: str = None):
+    """Registra uma tentativa. `error_class` vem de `downloader.classify_error` quando ok=False."""
+    _ensure_loaded()
+    global _recorded
+    event = (time.time(), ok, None if ok else (error_class or "other"), latency)
+    with _lock:
+        _events[name].append(event)
+        _recorded += 1
+        prune = _recorded % PRUNE_EVERY == 0
+    record_strategy_event(name, ok, event[2], latency, prune_before=event[0] - WINDOW_SECONDS if prune else None)
+
+
+def score(name: str, now: float = None) -> float:
+    """Taxa de sucesso suavizada (prior de Laplace): estratégia sem histórico vale 0.5."""
+    now = now or time.time()
+    with _lock:
+        window = _window(name, now)
+    successes = sum(1 for e in window if e[1])
+    return (successes + 1) / (len(window) + 2)
+
+
+def order_strategies(strategies: list) -> list:
+    """
+    Reordena as estratégias pela pontuação atual (maior primeiro).
+    Empates mantêm a ordem original, e as estratégias em PINNED_KEYS ficam no fim.
+    """
+    _ensure_loaded()
+    now = time.time()
+    movable = [s for s in strategies if not any(s.get(k) for k in PINNED_KEYS)]
+    pinned = [s for s in strategies if any(s.get(k) for k in PINNED_KEYS)]
+    ranked = sorted(enumerate(movable), key=lambda p: (-score(p[1]["name"], now), p[0]))
+    return [s for _, s in ranked] + pinned
+
+
+def snapshot() -> list:
+    """Resumo por estratégia para a API, da mais saudável para a menos saudável."""
+    _ensure_loaded()
+    now = time.time()
+    result = []
+    with _lock:
+        names = list(_events.keys())
+    for name in names:
+        with _lock:
+            window = _window(name, now)
+        if not window: continue
+        successes = [e for e in window if e[1]]
+        failures = defaultdict(int)
+        for e in window:
+            if not e[1]: failures[e[2]] += 1
+        result.append({
+            "strategy": name,
+            "attempts": len(window),
+            "successes": len(successes),
+            "success_rate": round(len(successes) / len(window), 3),
+            "score": round(score(name, now), 3),
+            "avg_success_latency": round(sum(e[3] for e in successes) / len(successes), 2) if successes else None,
+            "failures": dict(failures),
+            "last_ok": window[-1][1],
+            "last_attempt_at": window[-1][0],
+        })
+    result.sort(key=lambda r: -r["score"])
+    return result
@@ -5,6 +5,7 @@ import asyncio
 import threading
 from utils import get_data_dir
 import downloader
+import ydl_pool
 
 SUBS_FILE = os.path.join(get_data_dir(), "subscriptions.json")
 
@@ -59,7 +60,6 @@ async def check_subscriptions():
             print(f"[Monitor] Checando playlist: {sub['title']}")
             try:
                 # Extrai os dados da playlist
-                import yt_dlp
                 ydl_opts = {
                     'extract_flat': 'in_playlist',
                     'playlistend': 50,
@@ -67,7 +67,7 @@ async def check_subscriptions():
                     'ignoreerrors': True
                 }
                 def _extract():
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    with ydl_pool.lease(ydl_opts) as ydl:
                         return ydl.extract_info(sub['url'], download=False)
                 info = await asyncio.to_thread(_extract)
                 
@@ -78,9 +78,8 @@ async def check_subscriptions():
                 sub['last_checked'] = time.time()
                 save_subscriptions(subs)
                 
-                # Para cada música, verificar se já baixamos. 
-                # (Simplificação: Enfileirar. Se já existir, o downloader.py pulará sozinho 
-                # e o status ficará "already_downloaded").
+                # Para cada música, enfileirar: o enqueue_job anexa pedidos repetidos ao job em andamento
+                # e conclui na hora (status "already_downloaded") o que já está no banco e no disco.
                 
                 # Envia para a fila real do app
                 for entry in info['entries']:
@@ -94,7 +93,8 @@ async def check_subscriptions():
                     
                     # Adiciona silenciosamente ao worker queue do main.py
                     from main import DownloadRequest
-                    from downloader import jobs, download_queue, JobState
+                    from downloader import enqueue_job
+                    from download_scheduler import PRIORITY_BACKGROUND
                     import uuid
                     
                     # Simular envio
@@ -109,14 +109,8 @@ async def check_subscriptions():
                         video_id=vid
                     )
                     
-                    jobs[job_id] = JobState(
-                        id=job_id, 
-                        status="queued", 
-                        progress=0.0, 
-                        created_at=time.time(), 
-                        title=req.title
-                    )
-                    await download_queue.put((job_id, req))
+                    # Assinaturas entram como background: cliques manuais passam na frente
+                    await enqueue_job(job_id, req, PRIORITY_BACKGROUND)
                     
             except Exception as e:
                 print(f"[Monitor] Erro ao checar {sub['title']}: {e}")
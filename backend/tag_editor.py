@@ -5,6 +5,7 @@ Suporta: MP3, FLAC, M4A/AAC
 """
 import os
 import base64
+import tag_padding
 from utils import get_downloads_dir
 
 
@@ -113,7 +114,7 @@ def write_tags(filename: str, data: dict) -> dict:
                 cover_bytes = base64.b64decode(data["cover_base64"])
                 tags.delall("APIC")
                 tags.add(APIC(encoding=Encoding.UTF8, mime="image/jpeg", type=3, desc="Cover", data=cover_bytes))
-            audio.save()
+            audio.save(padding=tag_padding.policy)
 
         elif ext == ".flac":
             from mutagen.flac import FLAC, Picture
@@ -130,7 +131,7 @@ def write_tags(filename: str, data: dict) -> dict:
                 pic.mime = "image/jpeg"
                 pic.type = 3
                 audio.add_picture(pic)
-            audio.save()
+            audio.save(padding=tag_padding.policy)
 
         elif ext in (".m4a", ".aac"):
             from mutagen.mp4 import MP4, MP4Cover
@@ -143,7 +144,7 @@ def write_tags(filename: str, data: dict) -> dict:
             if "cover_base64" in data and data["cover_base64"]:
                 cover_bytes = base64.b64decode(data["cover_base64"])
                 audio.tags["covr"] = [MP4Cover(cover_bytes, imageformat=MP4Cover.FORMAT_JPEG)]
-            audio.save()
+            audio.save(padding=tag_padding.policy)
 
         # Mover para pasta edited/
         downloads_dir = get_downloads_dir()
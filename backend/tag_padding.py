@@ -0,0 +1,149 @@
+"""
+tag_padding.py
+Política de padding das tags para todo gravador do mutagen (TagTransaction, tag_editor,
+shazam_fixer; letra, ReplayGain e iTunes passam pela TagTransaction).
+Sem espaço livre depois do bloco de tags, colocar uma capa (APIC) ou letra (USLT) num arquivo
+pronto obriga o mutagen a empurrar o áudio inteiro para a frente: custo proporcional ao
+tamanho do arquivo. Com PADDING_BYTES reservados, a edição cabe no espaço livre e só o
+cabeçalho é reescrito, em tempo constante.
+  - policy(): callback `padding=` do mutagen. Se cabe, mantém o padding atual (in-place, nunca
+    encolhe); se não cabe, realoca uma vez já com PADDING_BYTES de folga.
+  - A reserva entra na primeira gravação de tags do finalize_download, logo depois do ffmpeg
+    produzir o arquivo (o muxer de MP3 do ffmpeg não tem opção de padding ID3).
+  - start_repad(): tarefa de manutenção que passa pela biblioteca e dá folga aos arquivos antigos.
+"""
+import os
+import time
+import threading
+from utils import get_downloads_dir
+
+PADDING_BYTES = 256 * 1024
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.m4a', '.aac', '.opus', '.ogg')
+
+_lock = threading.Lock()
+_job = {"status": "idle", "total": 0, "done": 0, "repadded": 0, "ok": 0, "skipped": 0, "errors": 0,
+        "bytes_added": 0, "current_file": "", "started_at": None, "finished_at": None}
+
+
+def configure(padding_kb: int = None) -> dict:
+    global PADDING_BYTES
+    if padding_kb is not None:
+        PADDING_BYTES = int(max(0, min(4096, int(padding_kb)))) * 1024
+    return get_config()
+
+
+def get_config() -> dict:
+    return {"padding_kb": PADDING_BYTES // 1024}
+
+
+def policy(info) -> int:
+    """Callback `padding=` do save() do mutagen."""
+    return info.padding if info.padding >= 0 else PADDING_BYTES
+
+
+def _open(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.mp3':
+        from mutagen.mp3 import MP3
+        from mutagen.id3 import ID3
+        audio = MP3(path, ID3=ID3)
+        if audio.tags is None: audio.add_tags()
+        return audio
+    if ext in ('.m4a', '.aac'):
+        from mutagen.mp4 import MP4
+        audio = MP4(path)
+        if audio.tags is None: audio.add_tags()
+        return audio
+    if ext == '.flac':
+        from mutagen.flac import FLAC
+        return FLAC(path)
+    from mutagen import File
+    return File(path)
+
+
+def current_padding(audio):
+    """Folga atual depois das tags, quando o formato deixa ler sem gravar (None se não dá para saber)."""
+    from mutagen.flac import FLAC, Padding
+    if isinstance(audio, FLAC):
+        return sum(block.length for block in audio.metadata_blocks if isinstance(block, Padding))
+    return getattr(audio.tags, '_padding', None)  # ID3 guarda o padding lido do arquivo
+
+
+def repad(path: str) -> tuple:
+    """
+    Garante PADDING_BYTES de folga (o padding padrão do mutagen, ~0,1% do arquivo, não cabe uma capa).
+    Retorna ("ok" | "repadded" | "skipped", bytes acrescentados).
+    """
+    if not path.lower().endswith(AUDIO_EXTENSIONS): return "skipped", 0
+    audio = _open(path)
+    if audio is None: return "skipped", 0
+    padding = current_padding(audio)
+    if padding is not None and padding >= PADDING_BYTES: return "ok", 0
+
+    seen = {}
+
+    def target(info):
+        seen["padding"] = info.padding
+        return max(info.padding, PADDING_BYTES)
+
+    size_before = os.path.getsize(path)
+    audio.save(padding=target)
+    if seen.get("padding", 0) >= PADDING_BYTES: return "ok", 0
+    return "repadded", os.path.getsize(path) - size_before
+
+
+def _library_files(root: str) -> list:
+    """Arquivos de áudio da biblioteca, uma vez por inode (views do content store são hardlinks)."""
+    files, inodes = [], set()
+    for folder, _, names in os.walk(root):
+        for name in names:
+            if not name.lower().endswith(AUDIO_EXTENSIONS): continue
+            path = os.path.join(folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in inodes: continue
+            inodes.add((st.st_dev, st.st_ino))
+            files.append(path)
+    return files
+
+
+def _run_repad(root: str):
+    files = _library_files(root)
+    with _lock:
+        _job["total"] = len(files)
+    for path in files:
+        with _lock:
+            _job["current_file"] = os.path.relpath(path, root)
+        try:
+            result, added = repad(path)
+        except Exception as e:
+            result, added = "errors", 0
+            print(f"[Repad] Falha em {os.path.basename(path)}: {e}")
+        with _lock:
+            _job[result] += 1
+            _job["done"] += 1
+            _job["bytes_added"] += added
+    with _lock:
+        _job["status"] = "done"
+        _job["current_file"] = ""
+        _job["finished_at"] = time.time()
+        summary = dict(_job)
+    print(f"[Repad] {summary['repadded']} arquivos ganharam padding, {summary['ok']} já tinham, {summary['errors']} erros")
+
+
+def start_repad() -> dict:
+    """Dispara o repad da pasta de downloads numa thread (uma execução por vez)."""
+    with _lock:
+        if _job["status"] == "running": return dict(_job)
+        _job.update({"status": "running", "total": 0, "done": 0, "repadded": 0, "ok": 0, "skipped": 0, "errors": 0,
+                     "bytes_added": 0, "current_file": "", "started_at": time.time(), "finished_at": None})
+    threading.Thread(target=_run_repad, args=(get_downloads_dir(),), daemon=True, name="repad").start()
+    return repad_status()
+
+
+def repad_status() -> dict:
+    with _lock:
+        return {**_job, **get_config()}
@@ -0,0 +1,178 @@
+"""
+tag_transaction.py
+Uma única gravação de tags por arquivo no fim do finalize_download.
+As etapas de enriquecimento (metadados do YouTube, capa, ReplayGain, iTunes, letra) só
+registram valores numa TagTransaction; o commit() abre o arquivo uma vez com o mutagen e
+grava tudo junto. Antes eram até quatro reescritas (EmbedThumbnail e FFmpegMetadata remuxando
+pelo ffmpeg, depois apply_metadata e _embed_lyrics salvando cada um pelo mutagen).
+Se o bloco de tags novo cabe no padding que o arquivo já tem, a gravação é in-place: só o
+cabeçalho é reescrito, o áudio não sai do lugar.
+Etapas posteriores sobrescrevem as anteriores (a capa do iTunes vence a thumbnail, etc.).
+"""
+import os
+import base64
+import threading
+import tag_padding
+
+FIELDS = ("title", "artist", "album", "date", "comment")
+
+_stats = {"commits": 0, "stages": 0, "in_place": 0, "resized": 0, "errors": 0}
+_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _lock:
+        _stats[name] += n
+
+
+class TagTransaction:
+    def __init__(self, path: str):
+        self.path = path
+        self.ext = os.path.splitext(path)[1].lower()
+        self.fields = {}
+        self.cover = None
+        self.lyrics = None
+        self.custom = {}
+        self.stages = []
+        self.in_place = None
+
+    def stage(self, name: str):
+        """Anota a etapa que contribuiu (só para log/estatística)."""
+        if name not in self.stages: self.stages.append(name)
+
+    def set(self, **fields):
+        for key, value in fields.items():
+            if key not in FIELDS: raise Exception(f"Campo de tag desconhecido: {key}")
+            if value: self.fields[key] = str(value)
+
+    def set_cover(self, data: bytes):
+        """Capa frontal em JPEG."""
+        if data: self.cover = data
+
+    def set_lyrics(self, text: str):
+        if text: self.lyrics = text
+
+    def set_custom(self, key: str, value: str):
+        """Tag livre (TXXX no MP3, ----:com.apple.iTunes no MP4, comentário Vorbis no FLAC/Ogg)."""
+        self.custom[key] = value
+
+    @property
+    def empty(self) -> bool:
+        return not (self.fields or self.cover or self.lyrics or self.custom)
+
+    def _padding(self, info) -> int:
+        # Cabe no padding atual: grava in-place. Senão realoca já com a folga do tag_padding.
+        self.in_place = info.padding >= 0
+        return tag_padding.policy(info)
+
+    def commit(self) -> bool:
+        """Grava tudo numa única escrita. Retorna False se o formato não é suportado ou a gravação falhou."""
+        if self.empty: return True
+        try:
+            if self.ext == '.mp3':
+                self._commit_id3()
+            elif self.ext in ('.m4a', '.mp4', '.aac'):
+                self._commit_mp4()
+            elif self.ext == '.flac':
+                self._commit_flac()
+            elif self.ext in ('.opus', '.ogg'):
+                self._commit_ogg()
+            else:
+                return False
+        except Exception as e:
+            _count("errors")
+            print(f"      \033[90m[tags:warn] Falha ao gravar tags em {os.path.basename(self.path)}: {e}\033[0m")
+            return False
+        _count("commits")
+        _count("stages", len(self.stages))
+        _count("in_place" if self.in_place else "resized")
+        if len(self.stages) > 1:
+            mode = "in-place" if self.in_place else "com realocação do padding"
+            print(f"      \033[90m[tags] {len(self.stages)} etapas ({', '.join(self.stages)}) em 1 gravação, {mode}\033[0m")
+        return True
+
+    def _commit_id3(self):
+        from mutagen.mp3 import MP3
+        from mutagen.id3 import ID3, TIT2, TPE1, TALB, TDRC, COMM, APIC, USLT, TXXX, Encoding
+        audio = MP3(self.path, ID3=ID3)
+        if audio.tags is None: audio.add_tags()
+        tags = audio.tags
+        frames = {"title": TIT2, "artist": TPE1, "album": TALB, "date": TDRC}
+        for key, value in self.fields.items():
+            if key == "comment":
+                tags.delall("COMM")
+                tags.add(COMM(encoding=3, lang='eng', desc='', text=value))
+            else:
+                tags.add(frames[key](encoding=3, text=value))
+        if self.cover:
+            tags.delall("APIC")
+            tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=self.cover))
+        if self.lyrics:
+            tags.delall("USLT")
+            tags.add(USLT(encoding=Encoding.UTF8, lang='und', desc='Lyrics', text=self.lyrics))
+        for key, value in self.custom.items():
+            tags.delall(f"TXXX:{key}")
+            tags.add(TXXX(encoding=3, desc=key, text=value))
+        audio.save(padding=self._padding)
+
+    def _commit_mp4(self):
+        from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
+        audio = MP4(self.path)
+        if audio.tags is None: audio.add_tags()
+        atoms = {"title": "\xa9nam", "artist": "\xa9ART", "album": "\xa9alb", "date": "\xa9day", "comment": "\xa9cmt"}
+        for key, value in self.fields.items():
+            audio.tags[atoms[key]] = [value]
+        if self.cover:
+            audio.tags['covr'] = [MP4Cover(self.cover, imageformat=MP4Cover.FORMAT_JPEG)]
+        if self.lyrics:
+            audio.tags['\xa9lyr'] = [self.lyrics]
+        for key, value in self.custom.items():
+            audio.tags[f"----:com.apple.iTunes:{key.lower()}"] = [MP4FreeForm(value.encode("utf-8"))]
+        audio.save(padding=self._padding)
+
+    def _picture(self):
+        from mutagen.flac import Picture
+        pic = Picture()
+        pic.type = 3
+        pic.mime = 'image/jpeg'
+        pic.desc = 'Cover'
+        pic.data = self.cover
+        return pic
+
+    def _vorbis_comments(self, audio):
+        for key, value in self.fields.items():
+            audio[key] = value
+        if self.lyrics:
+            audio['LYRICS'] = self.lyrics
+        for key, value in self.custom.items():
+            audio[key] = value
+
+    def _commit_flac(self):
+        from mutagen.flac import FLAC
+        audio = FLAC(self.path)
+        self._vorbis_comments(audio)
+        if self.cover:
+            audio.clear_pictures()
+            audio.add_picture(self._picture())
+        audio.save(padding=self._padding)
+
+    def _commit_ogg(self):
+        from mutagen import File
+        audio = File(self.path)
+        if audio is None: raise Exception("arquivo Ogg não reconhecido")
+        self._vorbis_comments(audio)
+        if self.cover:
+            audio['metadata_block_picture'] = [base64.b64encode(self._picture().write()).decode('ascii')]
+        audio.save(padding=self._padding)
+
+
+def snapshot() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    commits = stats["commits"]
+    return {
+        **stats,
+        # Gravações que deixaram de acontecer por juntar as etapas
+        "writes_saved": max(0, stats["stages"] - commits),
+        "in_place_ratio": round(stats["in_place"] / commits, 3) if commits else 0.0,
+    }
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+import asyncio
+import pytest
+
+# Os módulos do backend se importam pelo nome (rodam com backend/ como diretório de trabalho)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class LoopLag:
+    """Heartbeat no event loop enquanto o bloco `async with` roda; `max` é o maior atraso observado."""
+    HEARTBEAT = 0.01
+
+    def __init__(self):
+        self.lags = []
+
+    async def __aenter__(self):
+        self._done = asyncio.Event()
+        self._task = asyncio.create_task(self._beat())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._done.set()
+        await self._task
+
+    async def _beat(self):
+        while not self._done.is_set():
+            start_time = time.monotonic()
+            await asyncio.sleep(self.HEARTBEAT)
+            self.lags.append(time.monotonic() - start_time - self.HEARTBEAT)
+
+    @property
+    def max(self) -> float:
+        return max(self.lags, default=0.0)
+
+
+@pytest.fixture
+def event_loop_lag():
+    """Fábrica de LoopLag: `async with event_loop_lag() as lag: ...`, depois `lag.max`."""
+    return LoopLag
@@ -0,0 +1,54 @@
+import os
+import shutil
+import pytest
+
+pytest.importorskip("yt_dlp")
+import database
+import content_store
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "downloads.db"))
+    database.init_db()
+    monkeypatch.setattr(content_store, "get_data_dir", lambda: str(tmp_path / "data"))
+    library = tmp_path / "library"
+    library.mkdir()
+    return library
+
+
+def ingest(library):
+    song = library / "Song.mp3"
+    song.write_bytes(b"\xff\xfb" * 1000)
+    return song, content_store.ingest("vid00000001", "mp3-320", str(song), {"title": "Song"})
+
+
+def test_moved_symlink_keeps_store_object(library, monkeypatch):
+    # Store em outro disco: os.link falha e a biblioteca fica com um symlink para o objeto
+    def no_hardlink(*args):
+        raise OSError("cross-device link")
+    monkeypatch.setattr(os, "link", no_hardlink)
+    song, kind = ingest(library)
+    assert kind == "symlink"
+
+    # O tag_editor move o arquivo editado para edited/
+    (library / "edited").mkdir()
+    edited = library / "edited" / "Song.mp3"
+    shutil.move(str(song), str(edited))
+
+    for _ in range(2):
+        summary = database.sync_db_with_disk(str(library))
+        assert summary["store_orphans_removed"] == 0
+        assert edited.read_bytes() == b"\xff\xfb" * 1000
+    assert database.get_store_object("vid00000001", "mp3-320") is not None
+
+
+def test_object_without_hardlinks_is_freed(library):
+    song, kind = ingest(library)
+    assert kind == "hardlink"
+    object_path = database.get_store_object("vid00000001", "mp3-320")["object_path"]
+    song.unlink()
+
+    summary = database.sync_db_with_disk(str(library))
+    assert summary["store_orphans_removed"] == 1
+    assert not os.path.exists(object_path)
@@ -0,0 +1,52 @@
+import time
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+downloader = pytest.importorskip("downloader")
+import content_store
+
+LOOKUP_SECONDS = 0.3
+
+
+@pytest.fixture
+def env(monkeypatch):
+    finished = []
+    monkeypatch.setattr(downloader, "jobs", {})
+    monkeypatch.setattr(downloader, "_inflight", {})
+    monkeypatch.setattr(downloader, "mark_downloaded_db", lambda *args: None)
+    monkeypatch.setattr(content_store, "job_finished", lambda job_id, status: finished.append((job_id, status)))
+
+    def slow_lookup(request):
+        # Varredura do disco + hardlink do content store numa biblioteca grande
+        time.sleep(LOOKUP_SECONDS)
+        return "Faixa.mp3"
+
+    monkeypatch.setattr(downloader, "_existing_file", slow_lookup)
+    return finished
+
+
+def request():
+    return SimpleNamespace(url="https://www.youtube.com/watch?v=dQw4w9WgXcQ", mode="audio", quality="320", pitch=0,
+                           speed=1.0, eq_preset=None, start_time=None, end_time=None, playlist=False, title="Faixa")
+
+
+async def enqueue_twice(lag):
+    """Dois pedidos iguais, o segundo durante a busca no disco do primeiro, enquanto `lag` mede o event loop."""
+    async with lag:
+        first = asyncio.create_task(downloader.enqueue_job("first", request()))
+        await asyncio.sleep(LOOKUP_SECONDS / 3)
+        second = await downloader.enqueue_job("second", request())
+        first = await first
+    return first, second
+
+
+def test_disk_lookup_runs_off_the_event_loop(env, event_loop_lag):
+    lag = event_loop_lag()
+    first, second = asyncio.run(enqueue_twice(lag))
+
+    assert lag.max < LOOKUP_SECONDS / 2, f"event loop ficou {lag.max:.2f}s parado na busca do arquivo"
+    # O pedido repetido se anexou ao primeiro em vez de repetir a busca
+    assert second is first and first.coalesced == 1
+    assert first.status == "already_downloaded" and first.filename == "Faixa.mp3"
+    assert env == [("first", "already_downloaded")]
@@ -0,0 +1,47 @@
+import shutil
+import subprocess
+from types import SimpleNamespace
+import pytest
+
+yt_dlp = pytest.importorskip("yt_dlp")
+downloader = pytest.importorskip("downloader")
+from mutagen import File
+
+FFMPEG = shutil.which("ffmpeg")
+pytestmark = pytest.mark.skipif(not FFMPEG, reason="ffmpeg não está no PATH")
+
+SOURCES = {"m4a": ("m4a", ["-c:a", "aac"]), "opus": ("webm", ["-c:a", "libopus"])}
+
+
+@pytest.mark.parametrize("quality", ["m4a", "opus"])
+def test_speed_filter_reencodes_source_already_in_target_codec(tmp_path, quality):
+    # Fonte no mesmo codec da saída: o FFmpegExtractAudio copiaria o stream e o filtro falharia ou sumiria
+    ext, codec_args = SOURCES[quality]
+    source = tmp_path / f"track.{ext}"
+    subprocess.run([FFMPEG, "-v", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=6", *codec_args, str(source)],
+                   check=True)
+    request = SimpleNamespace(mode="audio", quality=quality, pitch=0, speed=2.0, eq_preset=None, cover_path=None,
+                              playlist=False, subtitle="none", url="", organize=False, organize_by_playlist=False)
+    opts = downloader.build_ydl_opts("job", request)
+    assert opts['postprocessors'] == [{'key': 'FilteredExtractAudio', 'preferredcodec': quality}]
+
+    with yt_dlp.YoutubeDL({'postprocessors': opts['postprocessors'], 'postprocessor_args': opts['postprocessor_args'],
+                           'ffmpeg_location': FFMPEG, 'quiet': True}) as ydl:
+        info = ydl.post_process(str(source), {"id": "x", "title": "x", "ext": ext, "filepath": str(source)})
+
+    output = tmp_path / f"track{downloader.audio_extension(request)}"
+    assert info['filepath'] == str(output)
+    # speed=2.0 aplicado: sem o filtro a faixa continuaria com 6 s
+    assert 2.5 < File(str(output)).info.length < 4.0
+
+
+def test_stock_extractor_when_yt_dlp_internals_change(monkeypatch):
+    assert downloader.FILTERED_EXTRACT_AUDIO
+    monkeypatch.setattr(downloader, "ACODECS", {"mp3": ("mp3", "libmp3lame")})
+    assert not downloader._filtered_extract_supported()
+
+    monkeypatch.setattr(downloader, "FILTERED_EXTRACT_AUDIO", False)
+    request = SimpleNamespace(mode="audio", quality="opus", pitch=0, speed=2.0, eq_preset=None, cover_path=None,
+                              playlist=False, subtitle="none", url="", organize=False, organize_by_playlist=False)
+    opts = downloader.build_ydl_opts("job", request)
+    assert opts['postprocessors'] == [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'opus'}]
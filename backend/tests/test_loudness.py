@@ -0,0 +1,46 @@
+import shutil
+import subprocess
+import pytest
+
+np = pytest.importorskip("numpy")
+import loudness
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+def sine(seconds: float = 5.0, amplitude: float = 0.5) -> np.ndarray:
+    t = np.arange(int(seconds * loudness.SAMPLE_RATE)) / loudness.SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * 997 * t)
+
+
+def measure(x: np.ndarray) -> float:
+    meter = loudness.R128Meter(x.shape[1])
+    meter.feed(x)
+    return meter.result()["integrated_lufs"]
+
+
+def test_mono_is_not_measured_as_dual_mono():
+    # BS.1770: 997 Hz a 0 dBFS num canal só mede -3,01 LKFS; o mesmo sinal nos dois canais, 3 LU a mais
+    mono = sine()[:, None]
+    assert measure(mono) == pytest.approx(-3.01 + 20 * np.log10(0.5), abs=0.05)
+    assert measure(np.repeat(mono, 2, axis=1)) - measure(mono) == pytest.approx(3.01, abs=0.05)
+
+
+def test_surround_weights_drop_lfe():
+    assert list(loudness.channel_weights(1)) == [1.0]
+    assert list(loudness.channel_weights(6)) == [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+    x = np.zeros((len(sine()), 6))
+    x[:, 3] = sine()  # só LFE
+    assert measure(x) == loudness.SILENCE_LUFS
+
+
+@pytest.mark.skipif(not FFMPEG, reason="ffmpeg não está no PATH")
+def test_measure_file_decodes_mono_at_native_channel_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(loudness, "_ffmpeg_binary", lambda: FFMPEG)
+    path = tmp_path / "mono.flac"
+    subprocess.run([FFMPEG, "-v", "error", "-f", "lavfi", "-i", "sine=frequency=997:sample_rate=48000:duration=5",
+                    "-af", "volume=0.5", "-ac", "1", str(path)], check=True)
+    assert loudness.probe_channels(str(path)) == 1
+    # lavfi sine tem amplitude 1/8
+    expected = -3.01 + 20 * np.log10(0.5 / 8)
+    assert loudness.measure_file(str(path))["integrated_lufs"] == pytest.approx(expected, abs=0.1)
@@ -0,0 +1,88 @@
+import time
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+downloader = pytest.importorskip("downloader")
+import database
+import playlist_groups
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "downloads.db"))
+    database.init_db()
+    library = tmp_path / "library"
+    (library / "Mix").mkdir(parents=True)
+    monkeypatch.setattr(playlist_groups, "get_downloads_dir", lambda: str(library))
+    monkeypatch.setattr(playlist_groups, "groups", {})
+    monkeypatch.setattr(downloader, "jobs", {})
+    return library
+
+
+def child(index: int):
+    return SimpleNamespace(playlist_title="Mix", organize_by_playlist=True, album_gain=False, mode="audio",
+                           playlist_id="PL1", playlist_index=index)
+
+
+def finish(library, job_id: str, name: str):
+    (library / "Mix" / f"{name}.mp3").write_bytes(b"\xff\xfb")
+    st = downloader.jobs[job_id]
+    st.status, st.title, st.filename = "done", name, f"Mix/{name}.mp3"
+
+
+def test_m3u_keeps_tracks_finished_before_restart(env):
+    for index, job_id in enumerate(("a", "b", "c"), start=1):
+        downloader.jobs[job_id] = downloader.JobState(id=job_id, status="queued", progress=0.0)
+        playlist_groups.register_child("group", job_id, child(index))
+    finish(env, "a", "Primeira")
+    finish(env, "b", "Segunda")
+    playlist_groups.update_groups()
+    playlist_groups.flush_tracks()
+
+    # Reinício: só a faixa que não terminou volta da fila persistente
+    playlist_groups.groups.clear()
+    downloader.jobs.clear()
+    downloader.jobs["c"] = downloader.JobState(id="c", status="queued", progress=0.0)
+    playlist_groups.register_child("group", "c", child(3))
+    assert downloader.jobs["group"].children_total == 3
+
+    finish(env, "c", "Terceira")
+    playlist_groups.update_groups()
+    playlist_groups.flush_tracks()
+
+    m3u = (env / "Mix" / "Mix.m3u").read_text(encoding="utf-8").splitlines()
+    assert [line for line in m3u if not line.startswith("#")] == ["Primeira.mp3", "Segunda.mp3", "Terceira.mp3"]
+    assert downloader.jobs["group"].status == "done" and downloader.jobs["group"].children_done == 3
+    assert database.load_group_tracks("group") == []
+
+
+def test_group_waits_for_every_track_of_the_expansion(env, monkeypatch):
+    # Faixas já no disco terminam na hora: o grupo não pode fechar com as poucas registradas até então
+    import content_store
+    entries = [{"id": f"vid{i:08d}", "title": f"Faixa {i}"} for i in range(1, 6)]
+    monkeypatch.setattr(playlist_groups, "expand_playlist", lambda request: ("Mix", "PL1", entries))
+    monkeypatch.setattr(playlist_groups, "GROUP_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(downloader, "_inflight", {})
+    monkeypatch.setattr(downloader, "mark_downloaded_db", lambda *args: None)
+    monkeypatch.setattr(downloader, "_existing_file", lambda request: f"Mix/{request.title}.mp3")
+    # Links dos pedidos anexados: o grupo é verificado enquanto a faixa já terminou e a próxima não chegou
+    monkeypatch.setattr(content_store, "job_finished", lambda job_id, status: time.sleep(0.03))
+    closes = []
+    monkeypatch.setattr(playlist_groups, "write_m3u", lambda group: closes.append(len(group["children"])))
+
+    request = SimpleNamespace(url="https://www.youtube.com/playlist?list=PL1", playlist=True, playlist_id=None,
+                              organize_by_playlist=True, album_gain=False, mode="audio", quality="320", pitch=0,
+                              speed=1.0, eq_preset=None, start_time=None, end_time=None)
+    downloader.jobs["group"] = downloader.JobState(id="group", status="downloading", progress=0.0)
+
+    async def expand():
+        monitor = asyncio.create_task(playlist_groups.group_monitor_loop())
+        await downloader.expand_playlist_job("group", request)
+        await asyncio.sleep(0.1)
+        monitor.cancel()
+
+    asyncio.run(expand())
+    assert closes == [5]
+    parent = downloader.jobs["group"]
+    assert parent.status == "done" and parent.children_total == 5 and parent.children_done == 5
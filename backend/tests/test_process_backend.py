@@ -0,0 +1,35 @@
+import queue
+from dataclasses import asdict
+import pytest
+
+downloader = pytest.importorskip("downloader")
+import process_backend
+import strategy_scoreboard
+
+
+def test_child_state_keeps_parent_fields(monkeypatch):
+    monkeypatch.setattr(downloader, "jobs", {})
+    monkeypatch.setattr(process_backend, "_channel", queue.Queue())
+    monkeypatch.setattr(process_backend, "_cancel_flags", {})
+    monkeypatch.setattr(strategy_scoreboard, "reload", lambda: None)
+
+    parent = downloader.JobState(id="job", status="queued", progress=0.0, title="Faixa", playlist_id="PL1",
+                                 coalesced=1, priority="interactive")
+    parent_state = asdict(parent)
+
+    def fake_download(job_id, request):
+        st = downloader.jobs[job_id]
+        # O filho enxerga o JobState do pai
+        assert st.title == "Faixa" and st.playlist_id == "PL1"
+        st.progress, st.status, st.filename = 100.0, "done", "Faixa.mp3"
+        # Enquanto isso, um pedido repetido se anexa ao job no pai
+        parent.coalesced += 1
+    monkeypatch.setattr(downloader, "download_with_retries", fake_download)
+
+    changed = process_backend._run_job_in_child("job", {"url": "x"}, {}, parent_state)
+    downloader.jobs["job"] = parent
+    process_backend._apply_state("job", changed)
+
+    assert (parent.status, parent.progress, parent.filename) == ("done", 100.0, "Faixa.mp3")
+    assert (parent.title, parent.playlist_id, parent.coalesced) == ("Faixa", "PL1", 2)
+    assert "playlist_id" not in changed and "coalesced" not in changed
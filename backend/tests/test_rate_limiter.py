@@ -0,0 +1,69 @@
+import multiprocessing
+import pytest
+import rate_limiter
+import process_backend
+
+
+@pytest.fixture
+def manager():
+    manager = process_backend._Manager(ctx=multiprocessing.get_context("spawn"))
+    manager.start()
+    yield manager
+    manager.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def local_buckets(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_shared", None)
+    monkeypatch.setattr(rate_limiter, "_buckets", {name: rate_limiter.TokenBucket(cfg["rate"], cfg["burst"])
+                                                   for name, cfg in rate_limiter.DEFAULT_BUCKETS.items()})
+
+
+def _child_requests(shared, n: int, result):
+    # Processo filho do pool: mesmo initializer do process_backend para o rate_limiter
+    rate_limiter.share(shared)
+    for _ in range(n):
+        rate_limiter._acquire("youtube.com")
+    result.put(rate_limiter.get_config()["youtube.com"])
+
+
+def test_child_processes_draw_from_the_parent_buckets(manager):
+    shared = manager.SharedBuckets(rate_limiter.get_config())
+    rate_limiter.share(shared)
+    rate_limiter.configure({"youtube.com": {"rate": 50, "burst": 20}})
+
+    ctx = multiprocessing.get_context("spawn")
+    result = ctx.Queue()
+    children = [ctx.Process(target=_child_requests, args=(shared, 5, result)) for _ in range(2)]
+    for p in children: p.start()
+    configs = [result.get(timeout=60) for _ in children]
+    for p in children: p.join(timeout=60)
+
+    # Um só balde para o pai e os dois filhos, com o limite alterado depois do pool criado
+    assert rate_limiter.snapshot()["youtube.com"]["requests"] == 10
+    assert configs == [{"rate": 50.0, "burst": 20}] * 2
+
+
+def test_falls_back_to_local_bucket_when_manager_is_gone(manager):
+    rate_limiter.share(manager.SharedBuckets(rate_limiter.get_config()))
+    manager.shutdown()
+    rate_limiter._acquire("youtube.com")
+    assert rate_limiter._buckets["youtube.com"].requests == 1
+
+
+def test_only_http_429_counts_as_rate_limited():
+    yt_dlp_networking = pytest.importorskip("yt_dlp.networking.exceptions")
+    from yt_dlp.networking import Response
+    import io
+    http_429 = yt_dlp_networking.HTTPError(Response(io.BytesIO(), "https://www.youtube.com/x", {}, status=429))
+    assert rate_limiter.is_rate_limited(http_429)
+    try:
+        raise Exception("ERROR: Unable to download webpage") from http_429
+    except Exception as wrapped:
+        assert rate_limiter.is_rate_limited(wrapped)
+    assert rate_limiter.is_rate_limited(Exception("ERROR: [youtube] x: HTTP Error 429: Too Many Requests"))
+    # "429" em IDs, tamanhos e URLs não é rate limit
+    assert not rate_limiter.is_rate_limited(Exception("ERROR: [youtube] a4291xYz_Qk: Video unavailable"))
+    assert not rate_limiter.is_rate_limited(Exception("Incomplete read: 42917 bytes"))
+    assert not rate_limiter.is_rate_limited(yt_dlp_networking.HTTPError(
+        Response(io.BytesIO(), "https://r4---sn-429.googlevideo.com/x", {}, status=403)))
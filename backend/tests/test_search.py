@@ -0,0 +1,55 @@
+import time
+import asyncio
+import pytest
+
+yt_dlp = pytest.importorskip("yt_dlp")
+try:
+    import main
+except (ImportError, OSError) as e:  # voice_engine precisa do vosk e do PortAudio (sounddevice)
+    pytest.skip(f"main indisponível: {e}", allow_module_level=True)
+import ydl_pool
+
+# Regressão: /search não pode travar o event loop.
+# A extração do yt-dlp é trocada por uma espera bloqueante de FAKE_LATENCY segundos;
+# N buscas concorrentes têm que terminar bem antes de N * FAKE_LATENCY, e o loop segue respondendo.
+
+FAKE_LATENCY = 0.5
+N_REQUESTS = 8
+
+
+class FakeYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL de verdade (o pool aplica as opções da chamada nele), só sem rede."""
+
+    def extract_info(self, query, download=False, **kwargs):
+        time.sleep(FAKE_LATENCY)
+        return {"entries": [{"id": "dQw4w9WgXcQ", "title": query, "uploader": "Stub", "duration": 212}]}
+
+
+@pytest.fixture
+def fake_search(monkeypatch):
+    monkeypatch.setattr(ydl_pool.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    monkeypatch.setattr(main, "get_cookies_path", lambda: None)
+    ydl_pool.invalidate()
+    yield
+    ydl_pool.invalidate()
+
+
+async def run_searches(n, lag):
+    """Dispara n buscas juntas enquanto `lag` mede o event loop."""
+    async with lag:
+        start_time = time.monotonic()
+        responses = await asyncio.gather(*(main.search_youtube(main.SearchRequest(query=f"teste {i}", limit=1))
+                                           for i in range(n)))
+        elapsed = time.monotonic() - start_time
+    return responses, elapsed
+
+
+def test_search_does_not_block_event_loop(fake_search, event_loop_lag):
+    fallbacks = ydl_pool.snapshot()["fallbacks"]
+    lag = event_loop_lag()
+    responses, elapsed = asyncio.run(run_searches(N_REQUESTS, lag))
+
+    assert [r["results"][0]["title"] for r in responses] == [f"ytsearch1:teste {i}" for i in range(N_REQUESTS)]
+    assert ydl_pool.snapshot()["fallbacks"] == fallbacks, "a busca deveria passar pelo pool, não pela instância avulsa"
+    assert lag.max < FAKE_LATENCY / 2, f"event loop ficou {lag.max:.2f}s sem rodar durante as buscas"
+    assert elapsed < FAKE_LATENCY * N_REQUESTS * 0.5, "buscas concorrentes estão sendo serializadas"
@@ -0,0 +1,79 @@
+import shutil
+import threading
+import subprocess
+import functools
+import http.server
+from types import SimpleNamespace
+import pytest
+
+yt_dlp = pytest.importorskip("yt_dlp")
+downloader = pytest.importorskip("downloader")
+import stall_watchdog
+
+FFMPEG = shutil.which("ffmpeg")
+pytestmark = pytest.mark.skipif(not FFMPEG, reason="ffmpeg não está no PATH")
+
+SECONDS = 8
+BITRATE_KBPS = 128
+
+
+@pytest.fixture
+def media_server(tmp_path):
+    """Serve um MP3 de SECONDS segundos por HTTP, como um stream do YouTube."""
+    src = tmp_path / "src"
+    src.mkdir()
+    subprocess.run([FFMPEG, "-v", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={SECONDS}",
+                    "-c:a", "libmp3lame", "-b:a", f"{BITRATE_KBPS}k", str(src / "track.mp3")], check=True)
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(src))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/track.mp3"
+    server.shutdown()
+    server.server_close()
+
+
+def test_section_download_reports_progress_and_feeds_watchdog(tmp_path, media_server, monkeypatch):
+    # Trecho passa pelo FFmpegFD, que não emite hooks 'downloading': quem reporta é o SectionProbe
+    monkeypatch.setattr(downloader, "get_downloads_dir", lambda: str(tmp_path))
+    monkeypatch.setattr(downloader, "prefetch_metadata", lambda title: None)
+    monkeypatch.setattr(downloader.SectionProbe, "INTERVAL", 0.2)
+    monkeypatch.setattr(stall_watchdog, "_record", lambda job_id, cause: None)
+
+    request = SimpleNamespace(url=media_server, mode="audio", quality="medium", playlist=False, start_time="0:01",
+                              end_time=f"0:0{SECONDS - 1}", pitch=0, speed=1.0, eq_preset=None, cover_path=None,
+                              subtitle="none", organize=False, organize_by_playlist=False)
+    job_id = "section-job"
+    st = downloader.JobState(id=job_id, status="queued", progress=0.0)
+    monkeypatch.setitem(downloader.jobs, job_id, st)
+
+    seen = []
+    opts = downloader.build_ydl_opts(job_id, request)
+    opts.update(postprocessors=[], ffmpeg_location=FFMPEG, cookiefile=None,
+                # Lê a fonte em tempo real para o trecho levar alguns segundos, como um stream remoto
+                external_downloader_args={'ffmpeg_i': ['-re']})
+    opts['progress_hooks'] = opts['progress_hooks'] + [lambda d: seen.append((d['status'], st.progress))]
+
+    # Sem bitrate no formato (como um link direto): o percentual vem do tempo gravado pelo ffmpeg
+    info = {"id": "sine", "title": "sine", "url": media_server, "ext": "mp3", "acodec": "mp3", "vcodec": "none",
+            "duration": SECONDS, "protocol": "http"}
+    probe = downloader.SectionProbe(opts['progress_hooks'])
+    stall_watchdog.arm(job_id)
+    try:
+        with yt_dlp.YoutubeDL(probe.apply(opts)) as ydl:
+            probe.attach(ydl)
+            try:
+                ydl.process_ie_result(info, download=True)
+            finally:
+                probe.stop()
+        watch = stall_watchdog._watches[job_id]
+        assert watch.last_bytes and watch.last_progress_at is not None
+    finally:
+        stall_watchdog.disarm(job_id)
+
+    partial = [progress for status, progress in seen if status == "downloading"]
+    assert partial, "nenhum progresso antes do fim do trecho"
+    assert any(0 < p < 100 for p in partial)
+    assert max(partial) > 50
+    assert partial == sorted(partial)
+    assert seen[-1][0] == "finished" and st.progress == 100
+    assert (tmp_path / f"sine{downloader._section_label((1, SECONDS - 1))}.mp3").exists()
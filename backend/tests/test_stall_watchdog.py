@@ -0,0 +1,69 @@
+import time
+import threading
+import pytest
+
+pytest.importorskip("yt_dlp")
+downloader = pytest.importorskip("downloader")
+import stall_watchdog
+
+
+@pytest.fixture
+def watchdog(monkeypatch):
+    monkeypatch.setattr(stall_watchdog, "_watches", {})
+    monkeypatch.setattr(stall_watchdog, "_abandoned_tokens", set())
+    monkeypatch.setattr(stall_watchdog, "_ensure_monitor", lambda: None)
+    monkeypatch.setattr(stall_watchdog, "_record", lambda job_id, cause: None)
+    return stall_watchdog
+
+
+def in_thread(fn):
+    errors = []
+
+    def run():
+        try:
+            fn()
+        except Exception as e:
+            errors.append(e)
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    return errors
+
+
+def test_feed_from_fragment_worker_thread_counts_as_progress(watchdog):
+    # FragmentFD chama os hooks das threads do ThreadPoolExecutor, que nunca passaram pelo arm()
+    watchdog.arm("job")
+    errors = in_thread(lambda: watchdog.feed("job", {"status": "downloading", "downloaded_bytes": 4096}))
+    assert errors == []
+    watch = watchdog._watches["job"]
+    assert watch.last_bytes == 4096
+    watch.armed_at -= watchdog.STARTUP_WINDOW + 1
+    watch.last_progress_at = time.monotonic()
+    watchdog.check()
+    assert watch.cause is None
+    watchdog.disarm("job")
+
+
+def test_abandoned_attempt_thread_still_raises(watchdog):
+    watchdog.arm("job")
+    watchdog.abandon("job")
+    # O worker_loop recolocou o job e a nova tentativa roda em outra thread
+    assert in_thread(lambda: watchdog.arm("job")) == []
+    with pytest.raises(watchdog.StallError):
+        watchdog.feed("job", {"status": "downloading", "downloaded_bytes": 1})
+
+
+def test_concurrent_arm_keeps_each_thread_token(watchdog):
+    barrier = threading.Barrier(8)
+    mismatches = []
+
+    def worker(i):
+        barrier.wait()
+        for _ in range(200):
+            watchdog.arm(f"job{i}")
+            if watchdog.current_token() != watchdog._watches[f"job{i}"].token:
+                mismatches.append(i)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert mismatches == []
@@ -0,0 +1,29 @@
+import time
+import database
+import strategy_scoreboard
+
+
+def test_record_prunes_events_older_than_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "downloads.db"))
+    database.init_db()
+    monkeypatch.setattr(strategy_scoreboard, "_loaded", True)  # servidor rodando há tempo: a carga já aconteceu
+    monkeypatch.setattr(strategy_scoreboard, "_recorded", 0)
+    monkeypatch.setattr(strategy_scoreboard, "PRUNE_EVERY", 3)
+
+    conn = database.get_conn()
+    conn.execute("INSERT INTO strategy_events (strategy, ok, error_class, latency, created_at) VALUES (?, ?, ?, ?, ?);",
+                 ("android", 1, None, 1.0, time.time() - strategy_scoreboard.WINDOW_SECONDS - 60))
+    conn.commit()
+    conn.close()
+
+    def count():
+        conn = database.get_conn()
+        n = conn.execute("SELECT COUNT(*) FROM strategy_events;").fetchone()[0]
+        conn.close()
+        return n
+
+    strategy_scoreboard.record("web", True, 1.0)
+    strategy_scoreboard.record("web", True, 1.0)
+    assert count() == 3
+    strategy_scoreboard.record("web", False, 1.0, "transient")
+    assert count() == 3  # a linha velha saiu na terceira gravação
@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+downloader = pytest.importorskip("downloader")
+import content_store
+from download_scheduler import DownloadScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+WORKERS = 5
+
+
+def test_idle_workers_do_not_hold_slots(monkeypatch):
+    monkeypatch.setattr(downloader, "jobs", {})
+    monkeypatch.setattr(downloader, "download_sem", downloader.AIMDLimiter(3))
+    monkeypatch.setattr(content_store, "job_finished", lambda job_id, status: None)
+    started = []
+
+    async def scenario():
+        monkeypatch.setattr(downloader, "download_queue", DownloadScheduler())
+        release = asyncio.Event()
+
+        async def fake_download(job_id, request):
+            started.append(job_id)
+            await release.wait()
+        monkeypatch.setattr(downloader, "run_download", fake_download)
+
+        workers = [asyncio.create_task(downloader.worker_loop()) for _ in range(WORKERS)]
+        await asyncio.sleep(0.05)
+        idle = downloader.download_sem.snapshot()
+
+        for job_id, priority in (("bg", PRIORITY_BACKGROUND), ("click", PRIORITY_INTERACTIVE)):
+            downloader.jobs[job_id] = downloader.JobState(id=job_id, status="queued", progress=0.0)
+            downloader.download_queue.put_nowait(job_id, SimpleNamespace(url="", playlist_id=None), priority)
+        await asyncio.sleep(0.05)
+        busy = downloader.download_sem.snapshot()
+
+        release.set()
+        await asyncio.sleep(0.05)
+        done = downloader.download_sem.snapshot()
+        for worker in workers: worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return idle, busy, done
+
+    idle, busy, done = asyncio.run(scenario())
+    assert idle["active"] == 0 and idle["waiting"] == 0
+    assert busy["active"] == 2
+    assert done["active"] == 0
+    # Escolhido na hora do slot: o clique passa na frente do job de assinatura enfileirado antes
+    assert started == ["click", "bg"]
+    assert downloader.jobs["bg"].status == "done"
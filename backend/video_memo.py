@@ -0,0 +1,112 @@
+"""
+video_memo.py
+Memória por vídeo para o `download_with_retries`, persistida em downloads.db.
+  - memo: a última estratégia que funcionou para o video_id vai para o topo da lista na próxima
+    vez (retry, re-download, assinatura), em vez de recomeçar pelo placar global;
+  - cache negativo: falhas permanentes (vídeo removido, privado, só para membros, bloqueio
+    regional, login) ficam registradas com TTL por classe, e o job falha na hora sem gastar
+    as 18 estratégias e as tentativas de proxy.
+Uma mensagem "permanente" de um único cliente pode ser peculiaridade dele, então cada classe
+exige algumas confirmações de estratégias diferentes antes de parar o loop.
+"""
+import time
+import threading
+from database import (get_video_memo, save_video_memo, get_video_failure, save_video_failure,
+                      delete_video_failures, get_video_memo_summary)
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Memo mais velho que isso é ignorado (o YouTube muda os clientes que funcionam)
+MEMO_TTL = 30 * DAY
+
+# classe -> (fragmentos da mensagem, TTL, confirmações para parar o loop; None = só no fim)
+PERMANENT_FAILURES = {
+    "removed": (("video has been removed", "this video is no longer available", "account associated with this video has been terminated",
+                 "no longer available because the youtube account"), 30 * DAY, 2),
+    "copyright": (("copyright claim", "copyright grounds"), 30 * DAY, 2),
+    "private": (("private video",), 7 * DAY, 1),
+    "members_only": (("members-only", "join this channel to get access"), 7 * DAY, 2),
+    # Proxies podem furar o bloqueio regional: só entra no cache depois de todas as estratégias
+    "region_locked": (("not available in your country", "blocked it in your country", "geo restriction", "geo-restricted"), 3 * DAY, None),
+    "login": (("sign in required", "sign in to confirm your age", "account problem"), 6 * HOUR, 1),
+}
+# Falhas que um cookies.txt novo pode resolver (limpas no upload de cookies)
+COOKIE_CLASSES = ("login", "private", "members_only")
+# Confirmações mínimas para cachear uma classe quando todas as estratégias falharam
+FINAL_CONFIRMATIONS = 2
+
+_stats = {"memo_hits": 0, "negative_hits": 0, "early_stops": 0, "cached_failures": 0}
+_lock = threading.Lock()
+
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+def classify_permanent(err_msg: str):
+    lower = err_msg.lower()
+    for cls, (fragments, _, _) in PERMANENT_FAILURES.items():
+        if any(f in lower for f in fragments): return cls
+    return None
+
+
+def apply_memo(strategies: list, video_id: str) -> list:
+    """Põe a estratégia que funcionou da última vez para este vídeo na frente."""
+    if not video_id: return strategies
+    memo = get_video_memo(video_id)
+    if not memo or time.time() - (memo["updated_at"] or 0) > MEMO_TTL: return strategies
+    preferred = [s for s in strategies if s["name"] == memo["strategy"]]
+    if not preferred: return strategies
+    _count("memo_hits")
+    print(f"  \033[94m-> Memo: {video_id} funcionou com {memo['strategy'].upper()} ({memo['successes']}x)\033[0m")
+    return preferred + [s for s in strategies if s["name"] != memo["strategy"]]
+
+
+def remember_success(video_id: str, strategy: str):
+    if video_id: save_video_memo(video_id, strategy)
+
+
+def cached_failure(video_id: str):
+    if not video_id: return None
+    failure = get_video_failure(video_id)
+    if failure: _count("negative_hits")
+    return failure
+
+
+def remember_failure(video_id: str, failure_class: str, message: str):
+    if not video_id or failure_class not in PERMANENT_FAILURES: return
+    save_video_failure(video_id, failure_class, message, PERMANENT_FAILURES[failure_class][1])
+    _count("cached_failures")
+
+
+def record_early_stop():
+    _count("early_stops")
+
+
+def should_stop(failure_class: str, hits: int) -> bool:
+    """Confirmações suficientes para desistir das estratégias restantes."""
+    needed = PERMANENT_FAILURES.get(failure_class, (None, None, None))[2]
+    return needed is not None and hits >= needed
+
+
+def final_class(hits: dict):
+    """Classe permanente mais vista quando todas as estratégias falharam (None se pouco confirmada)."""
+    if not hits: return None
+    cls, count = max(hits.items(), key=lambda item: item[1])
+    return cls if count >= FINAL_CONFIRMATIONS else None
+
+
+def forget_failure(video_id: str) -> int:
+    """Retry manual: o usuário quer tentar de novo mesmo com a falha em cache."""
+    return delete_video_failures(video_id=video_id) if video_id else 0
+
+
+def clear_failures(classes: tuple = None) -> int:
+    return delete_video_failures(classes=classes)
+
+
+def snapshot() -> dict:
+    return {**_stats, **get_video_memo_summary(),
+            "ttl_seconds": {cls: ttl for cls, (_, ttl, _) in PERMANENT_FAILURES.items()}}
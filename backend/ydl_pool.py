@@ -0,0 +1,215 @@
+"""
+ydl_pool.py
+Pool de instâncias YoutubeDL reaproveitáveis, chaveado pelo perfil de sessão
+(player_client, impersonate, cookies, proxy, ...).
+Criar um YoutubeDL por tentativa relê o cookies.txt, reinicia os handlers de impersonate e abre
+sessões HTTP novas (TLS do zero com o YouTube). Aqui a instância fica viva entre chamadas:
+cookiejar, request director (conexões keep-alive) e extratores já carregados são reaproveitados,
+e as opções de cada chamada (outtmpl, formato, hooks, postprocessors, logger) são aplicadas no
+empréstimo e descartadas na devolução.
+Uso: `with ydl_pool.lease(opts) as ydl:` no lugar de `with yt_dlp.YoutubeDL(opts) as ydl:`.
+"""
+import time
+import threading
+import contextlib
+import yt_dlp
+
+# Opções que ficam presas na instância (request director, cookiejar, runtimes JS): fazem parte da chave
+SESSION_OPTS = (
+    'extractor_args', 'impersonate', 'cookiefile', 'proxy', 'source_address', 'socket_timeout',
+    'nocheckcertificate', 'http_headers', 'legacyserverconnect', 'js_runtimes', 'remote_components', 'quiet',
+)
+
+MAX_IDLE_PER_KEY = 4
+MAX_IDLE_TOTAL = 24
+# Sessões paradas por mais tempo que isso são fechadas (o YouTube derruba keep-alive ocioso)
+IDLE_TTL = 300.0
+
+_idle = {}  # chave -> [_Entry] ociosas (a mais recente no fim)
+_lock = threading.Lock()
+_generation = 0
+_stats = {"leases": 0, "reused": 0, "created": 0, "evicted": 0, "fallbacks": 0}
+
+
+class _Entry:
+    def __init__(self, key: tuple, session_opts: dict):
+        self.key = key
+        self.generation = _generation
+        self.ydl = yt_dlp.YoutubeDL(dict(session_opts))
+        # Parâmetros já normalizados pelo __init__ (http_headers, compat_opts, outtmpl...), sem nada da chamada
+        self.base_params = dict(self.ydl.params)
+        self.leases = 0
+        self.idle_since = time.monotonic()
+
+
+def session_key(opts: dict) -> tuple:
+    return tuple(repr(opts.get(name)) for name in SESSION_OPTS)
+
+
+def _apply_call_opts(entry: _Entry, opts: dict):
+    """Coloca as opções da chamada na instância, refazendo o que o YoutubeDL.__init__ deriva delas."""
+    from yt_dlp.postprocessor import get_postprocessor
+    ydl = entry.ydl
+    params = dict(entry.base_params)
+    params.update({k: v for k, v in opts.items() if k not in SESSION_OPTS})
+    outtmpl = opts.get('outtmpl', entry.base_params.get('outtmpl'))
+    params['outtmpl'] = dict(outtmpl) if isinstance(outtmpl, dict) else {'default': outtmpl}
+    ydl.params = params
+    ydl._parse_outtmpl()
+
+    fmt = params.get('format')
+    ydl.format_selector = fmt if fmt in (None, '-') or callable(fmt) else ydl.build_format_selector(fmt)
+
+    ydl._progress_hooks = []
+    ydl._postprocessor_hooks = []
+    ydl._post_hooks = []
+    ydl._pps = {when: [] for when in ydl._pps}
+    for pp_def_raw in params.get('postprocessors', []):
+        pp_def = dict(pp_def_raw)
+        when = pp_def.pop('when', 'post_process')
+        ydl.add_post_processor(get_postprocessor(pp_def.pop('key'))(ydl, **pp_def), when=when)
+    for hook in params.get('progress_hooks', []): ydl.add_progress_hook(hook)
+    for hook in params.get('post_hooks', []): ydl.add_post_hook(hook)
+    for hook in params.get('postprocessor_hooks', []): ydl.add_postprocessor_hook(hook)
+
+    ydl._download_retcode = 0
+    ydl._num_downloads = 0
+    ydl._playlist_level = 0
+    ydl._playlist_urls = set()
+
+
+def _close(entry: _Entry):
+    try:
+        entry.ydl.close()
+    except Exception as e:
+        print(f"[YDL Pool] Erro ao fechar instância: {e}")
+
+
+def _take(key: tuple):
+    """Instância ociosa da chave (a mais recente), fechando as vencidas pelo caminho."""
+    now = time.monotonic()
+    expired = []
+    entry = None
+    with _lock:
+        for entries in _idle.values():
+            while entries and now - entries[0].idle_since > IDLE_TTL:
+                expired.append(entries.pop(0))
+        entries = _idle.get(key)
+        if entries: entry = entries.pop()
+        _stats["evicted"] += len(expired)
+    for old in expired: _close(old)
+    return entry
+
+
+def _give_back(entry: _Entry):
+    evicted = []
+    with _lock:
+        if entry.generation != _generation:
+            evicted.append(entry)
+        else:
+            entry.idle_since = time.monotonic()
+            entries = _idle.setdefault(entry.key, [])
+            entries.append(entry)
+            if len(entries) > MAX_IDLE_PER_KEY: evicted.append(entries.pop(0))
+            # Teto global: fecha a ociosa mais antiga de todas
+            while sum(len(e) for e in _idle.values()) > MAX_IDLE_TOTAL:
+                oldest_key = min((k for k, e in _idle.items() if e), key=lambda k: _idle[k][0].idle_since)
+                evicted.append(_idle[oldest_key].pop(0))
+        _stats["evicted"] += len(evicted)
+    for old in evicted: _close(old)
+
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+@contextlib.contextmanager
+def lease(opts: dict):
+    """Empresta uma instância com as opções `opts` aplicadas. Exclusiva da thread até sair do with."""
+    key = session_key(opts)
+    entry = _take(key)
+    unsupported = None
+    try:
+        if entry is None:
+            entry = _Entry(key, {k: opts[k] for k in SESSION_OPTS if k in opts})
+            _count("created")
+        else:
+            _count("reused")
+        _apply_call_opts(entry, opts)
+    except (AttributeError, TypeError) as e:
+        unsupported = e
+
+    if unsupported is not None:
+        # Internals do yt-dlp mudaram: instância nova a cada chamada, como antes do pool
+        print(f"[YDL Pool] Reuso indisponível ({unsupported}), usando instância avulsa")
+        _count("fallbacks")
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            yield ydl
+        return
+
+    _count("leases")
+    entry.leases += 1
+    try:
+        yield entry.ydl
+    finally:
+        try:
+            entry.ydl.save_cookies()  # o close() do `with YoutubeDL` fazia isso a cada chamada
+        except Exception:
+            pass
+        _give_back(entry)
+
+
+def invalidate():
+    """Fecha tudo (ex.: cookies.txt novo). Instâncias emprestadas são fechadas na devolução."""
+    global _generation
+    with _lock:
+        _generation += 1
+        entries = [entry for group in _idle.values() for entry in group]
+        _idle.clear()
+        _stats["evicted"] += len(entries)
+    for entry in entries: _close(entry)
+
+
+def _connection_stats(ydl) -> dict:
+    """Requisições x conexões TCP abertas pelos pools do urllib3 (handler requests). Melhor esforço."""
+    requests_count = connections = 0
+    director = ydl.__dict__.get('_request_director')
+    if director is None: return None
+    for handler in director.handlers.values():
+        for _, session in getattr(handler, '_InstanceStoreMixin__instances', []):
+            for adapter in getattr(session, 'adapters', {}).values():
+                pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+                if pools is None: continue
+                for pool_key in list(pools.keys()):
+                    pool = pools.get(pool_key)
+                    if pool is None: continue
+                    requests_count += getattr(pool, 'num_requests', 0)
+                    connections += getattr(pool, 'num_connections', 0)
+    return {"requests": requests_count, "connections": connections}
+
+
+def snapshot() -> dict:
+    with _lock:
+        entries = [entry for group in _idle.values() for entry in group]
+        idle_by_key = {str(key): len(group) for key, group in _idle.items() if group}
+    requests_count = connections = 0
+    for entry in entries:
+        try:
+            conn = _connection_stats(entry.ydl)
+        except Exception:
+            conn = None
+        if conn:
+            requests_count += conn["requests"]
+            connections += conn["connections"]
+    leases = _stats["leases"]
+    return {
+        **_stats,
+        "idle": len(entries),
+        "idle_by_key": idle_by_key,
+        "reuse_ratio": round(_stats["reused"] / leases, 3) if leases else 0.0,
+        # Conexões das instâncias ociosas: quanto menor que requests, mais keep-alive foi aproveitado
+        "http_requests": requests_count,
+        "tcp_connections": connections,
+        "connection_reuse_ratio": round(1 - connections / requests_count, 3) if requests_count else 0.0,
+    }
@@ -389,6 +389,10 @@ function App() {
     let reconnectTimer;
     const connectWs = () => {
       ws = new WebSocket(getApiUrl('/ws').replace('http', 'ws'));
+      ws.onopen = () => {
+        // Delta mode: the backend only sends the fields that changed since the last tick
+        ws.send(JSON.stringify({ type: 'subscribe', mode: 'delta' }));
+      };
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
@@ -410,6 +414,21 @@ function App() {
             window.dispatchEvent(new CustomEvent('voiceCommand', { detail: data.action }));
             return;
           }
+          if (data.type === 'jobs_snapshot') {
+            setGlobalJobs(data.jobs || {});
+            return;
+          }
+          if (data.type === 'jobs_delta') {
+            setGlobalJobs(prev => {
+              const next = { ...prev };
+              for (const [jobId, fields] of Object.entries(data.changed || {})) {
+                next[jobId] = { ...(prev[jobId] || {}), ...fields };
+              }
+              for (const jobId of data.removed || []) delete next[jobId];
+              return next;
+            });
+            return;
+          }
           setGlobalJobs(data);
         } catch (e) {}
       };
@@ -438,7 +457,7 @@ function App() {
             total: job.total_bytes_str
           });
         }
-        if (job.status === 'done') {
+        if (job.status === 'done' || job.status === 'already_downloaded') {
           setDownloadInfo({
             status: 'success',
             title: job.title || job.filename,
@@ -792,7 +811,7 @@ function App() {
             });
           } else if (statusData.status === 'processing') {
             updateQueueItem(item.uniqueId, { status: 'processing', progress: 99 });
-          } else if (statusData.status === 'done') {
+          } else if (statusData.status === 'done' || statusData.status === 'already_downloaded') {
             clearInterval(pollInterval);
             updateQueueItem(item.uniqueId, { status: 'completed', progress: 100 });
           } else if (statusData.status === 'error') {
@@ -1732,7 +1751,14 @@ function App() {
                           <QualityOption
                             id="best"
                             label="Original"
-                            sub="M4A/Opus sem conversão"
+                            sub="M4A/AAC sem conversão • ReplayGain"
+                            selected={quality}
+                            set={setQuality}
+                          />
+                          <QualityOption
+                            id="opus"
+                            label="Original Opus"
+                            sub="Opus sem conversão • ReplayGain"
                             selected={quality}
                             set={setQuality}
                           />